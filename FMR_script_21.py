@@ -13,10 +13,37 @@ import numpy as np
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import os
+import shutil
 import time
 import string
 import requests
 import json
+import hashlib
+import getpass
+import socket
+import re
+import sqlite3
+import queue
+import threading
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque, OrderedDict
+
+try: # needed for the parquet and feather data cache and the arrow fetch backend
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try: # only needed for the arrow fetch backend
+    from arrow_odbc import read_arrow_batches_from_odbc
+except ImportError:
+    read_arrow_batches_from_odbc = None
+
+try: # only needed for the duckdb local backend
+    import duckdb
+except ImportError:
+    duckdb = None
 
 """This will be a script to pull all the data for the FMR and do all the analysis"""
 
@@ -24,402 +51,2389 @@ import json
 SETTINGS
 ============================================================================================================="""
 
-Excel_workbook_name = "FMR Analysis - November 2024.xlsx" 
-Frequency_data = "November 2024 freq.csv"
+Excel_workbook_name = "FMR Analysis - November 2024.xlsx" 
+Frequency_data = "November 2024 freq.csv"
+
+date_from: str = "2024-11-01" # date to begin analysis
+date_to: str = "2024-11-30" # date to end analysis
+
+# set these to True if you want the analysis to be done
+
+Market_fundementals: bool = False # generation, inertia, MIP, forecast wind/solar data
+BM: bool = True
+EAC: bool = False
+STOR: bool = False
+SFFR: bool = False
+kW_revenue = False
+
+# set to True to work out the monthly BM summary tables on the SQL server rather than from every DSP row. The BM
+# section loads every DSP row anyway (volume share, dispatch and unit tables), so this is an extra query that isn't
+# cached and is only worth it if those tables aren't needed
+BM_summaries_from_SQL: bool = False
+
+# where the data is gathered from, "sqlserver" for the SQL server or "sqlite"/"duckdb" to use SQL_local_database
+# instead, which has the same tables filled with synthetic or snapshot data (make it with SQL_local_build)
+SQL_backend: str = "sqlserver"
+SQL_local_database: str = "FMR local.sqlite"
+
+# Set Load = True if you want the data to be exported to the above Excel file
+Load = False
+
+
+"""==========================================================================================================
+Don't change anything from here downwards
+============================================================================================================="""
+
+pd.set_option('display.max_columns', None)
+pd.set_option('display.max_rows', None)
+pd.reset_option('display.max_rows')
+
+start_time = datetime.now()
+
+"""==========================================================================================================
+Run log
+============================================================================================================="""
+
+# every SQL query and Data_load call adds a line to the run log so runs can be compared month to month
+Run_log_file = "FMR run log.jsonl"
+Run_ID = start_time.strftime("%Y-%m-%d %H:%M:%S")
+Run_log_lock = threading.Lock() # queries can finish on several threads at once
+
+def Run_log(event: str, record: dict):
+    record = {"Run": Run_ID, "Time": datetime.now().isoformat(timespec = "seconds"), "Event": event, **record}
+    with Run_log_lock:
+        with open(Run_log_file, "a") as f:
+            f.write(json.dumps(record, default = str) + "\n")
+
+def Run_log_compare(n_runs: int = 2):
+    # time and rows for each dataset in the last n_runs runs side by side, to spot anything that's got slower
+    log = pd.read_json(Run_log_file, lines = True, dtype = {"Run": str})
+    log = log[log["Event"] == "Data_load"]
+    runs = sorted(log["Run"].unique())[-n_runs:]
+    return pd.pivot_table(log[log["Run"].isin(runs)], index = "Dataset", columns = "Run", values = ["Seconds", "Rows"], 
+                          aggfunc = "sum")
+
+def Run_log_size(df) -> dict:
+    return {"Rows": len(df.index), "MB": round(df.memory_usage(deep = True).sum()/1e6, 3)}
+
+"""==========================================================================================================
+SQL connection management
+============================================================================================================="""
+
+SQL_server = "tcp:mssql-01.citg.one"
+SQL_database = "CI_DL1"
+SQL_connection_string = "DRIVER={SQL Server};SERVER="+SQL_server+";DATABASE="+SQL_database+";Trusted_Connection=yes"
+SQL_pool_size: int = 4 # max number of connections open to the SQL server at once
+SQL_chunksize: int = 200000 # rows per chunk when streaming large datasets into the data cache
+SQL_streamed_datasets = ["BOD_data", "DSP_data", "BOA_data"] # datasets which are streamed in chunks rather than loaded in one go
+# how each dataset is read off the server, either "pandas" (pd.read_sql_query through pyodbc) or "arrow" (arrow-odbc,
+# which fills Arrow column buffers straight from the driver instead of making a Python tuple for every row).
+# Anything not listed uses "pandas"
+SQL_fetch_backends = {"DSP_data": "arrow", "BOD_data": "arrow", "FPN_data": "arrow"}
+SQL_backend_warnings = []
+# datasets filtered on settlement date which are split into months and gathered in parallel for long date ranges
+SQL_partitioned_datasets = ["DSP_data", "DISBSAD_data", "Inertia_data", "Generation_data", "Demand_data", "MIP_data"]
+SQL_schemas = ["PowerSystem", "Meta"] # schemas the queries use, which the local database has to provide as well
+
+# errors which mean a connection may have dropped
+SQL_errors = (pyodbc.Error, sqlite3.Error) if duckdb == None else (pyodbc.Error, sqlite3.Error, duckdb.Error)
+
+# the few parts of the queries which are written differently for each backend, filled in with SQL_dialect
+SQL_dialects = {"sqlserver": {"month start": "DATEFROMPARTS(YEAR({0}), MONTH({0}), 1)", 
+                              "int": "TRY_CAST({0} as int)"},
+                
+                "sqlite": {"month start": "date({0}, 'start of month')", 
+                           "int": "(CASE WHEN {0} GLOB '[0-9]*' AND {0} NOT GLOB '*[^0-9]*' THEN CAST({0} as int) END)"},
+                
+                "duckdb": {"month start": "CAST(date_trunc('month', {0}) as DATE)", 
+                           "int": "TRY_CAST({0} as int)"}}
+
+def SQL_dialect(snippet: str, column: str) -> str:
+    return SQL_dialects[SQL_backend][snippet].format(column)
+
+def SQL_translate(query_string: str) -> str:
+    # the queries are written for SQL Server, duckdb quotes names with "" instead of []
+    if SQL_backend == "duckdb":
+        query_string = re.sub(r"\[([^\]]+)\]", r'"\1"', query_string)
+    return query_string
+
+# sqlite hands dates back as text unless they're converted using the column types the local database was made with
+sqlite3.register_converter("TIMESTAMP", lambda i: datetime.fromisoformat(i.decode()))
+
+def SQL_local_connect(backend: str = None, database: str = None, read_only: bool = True):
+    # connects to the local stand-in for the SQL server
+    backend = SQL_backend if backend == None else backend
+    database = SQL_local_database if database == None else database
+    if (read_only == True) and (os.path.exists(database) == False):
+        raise FileNotFoundError(f"{database} doesn't exist, make it with SQL_local_build")
+    
+    if backend == "sqlite":
+        # the same file is attached under each schema name so PowerSystem.tbl... and Meta.tbl... work as they do on the server
+        connection = sqlite3.connect(":memory:", detect_types = sqlite3.PARSE_DECLTYPES, check_same_thread = False)
+        for schema in SQL_schemas:
+            connection.execute(f"ATTACH DATABASE ? AS {schema}", [database])
+        return connection
+    elif backend == "duckdb":
+        if duckdb == None:
+            raise ImportError("duckdb isn't installed (pip install duckdb)")
+        return duckdb.connect(database, read_only = read_only)
+    else:
+        raise ValueError(f"{backend} isn't a local backend, use sqlite or duckdb")
+
+class SQL_connection_pool:
+    """Only connects to the SQL server when a query is actually run, then keeps the connection open so it can
+    be reused by later queries. Up to pool_size connections can be in use at once, anything else waits for one
+    to be handed back"""
+
+    def __init__(self, connection_string: str, pool_size: int = 4):
+        self.connection_string = connection_string
+        self.pool_size = pool_size
+        self.idle = queue.LifoQueue() # connections which are open but not currently being used
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.opened = 0
+
+    def connect(self):
+        if SQL_backend == "sqlserver":
+            print("Connecting to SQL server...")
+            print(" ")
+            connection = pyodbc.connect(self.connection_string)
+        else:
+            print(f"Connecting to local {SQL_backend} database {SQL_local_database}...")
+            print(" ")
+            connection = SQL_local_connect()
+        self.opened += 1
+        return connection
+
+    def acquire(self):
+        self.slots.acquire() # waits here if all the connections are in use
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self.connect()
+            except:
+                self.slots.release()
+                raise
+
+    def release(self, connection, broken: bool = False):
+        if broken == True: # doesn't reuse connections which errored as they may have dropped
+            try:
+                connection.close()
+            except SQL_errors:
+                pass
+            self.opened -= 1
+        else:
+            self.idle.put(connection)
+        self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        broken = False
+        try:
+            yield connection
+        except SQL_errors:
+            broken = True
+            raise
+        finally:
+            self.release(connection, broken)
+
+    def close(self):
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            self.opened -= 1
+
+SQL_connections = SQL_connection_pool(SQL_connection_string, pool_size = SQL_pool_size)
+
+def SQL_date(date) -> str:
+    # query parameters are passed as strings, dropping the time if it's midnight, so dates and datetimes both work.
+    # Fractions of a second are kept to the millisecond (what the SQL server's datetime holds) so watermarks compare
+    # properly
+    if isinstance(date, str):
+        return date
+    elif (date.hour, date.minute, date.second, date.microsecond) == (0, 0, 0, 0):
+        return datetime.strftime(date, "%Y-%m-%d")
+    elif date.microsecond == 0:
+        return datetime.strftime(date, "%Y-%m-%d %H:%M:%S")
+    else:
+        return datetime.strftime(date, "%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+def SQL_fetch_backend(data: str) -> str:
+    if SQL_backend != "sqlserver": # arrow-odbc only works with the SQL server
+        return "pandas"
+    backend = SQL_fetch_backends.get(data, "pandas")
+    if (backend == "arrow") and (read_arrow_batches_from_odbc == None):
+        if "arrow" not in SQL_backend_warnings:
+            print("arrow-odbc isn't installed so the pandas fetch backend is being used instead (pip install arrow-odbc)")
+            print(" ")
+            SQL_backend_warnings.append("arrow")
+        backend = "pandas"
+    return backend
+
+def SQL_log(data: str, seconds: float, rows: int, MB: float, chunks: int = 1):
+    Run_log("SQL query", {"Dataset": data, "Backend": SQL_backend, "Fetch": SQL_fetch_backend(data), 
+                          "Seconds": round(seconds, 3), "Rows": rows, "MB": round(MB, 3), "Chunks": chunks,
+                          "Rows per second": round(rows/seconds) if seconds > 0 else None})
+
+def SQL_read_arrow(query_string: str, params: list = None, batch_size: int = SQL_chunksize):
+    # yields DataFrames converted from Arrow record batches of up to batch_size rows. arrow-odbc makes its own
+    # connection from the connection string, so these queries don't use the connection pool
+    reader = read_arrow_batches_from_odbc(query = query_string, connection_string = SQL_connection_string, 
+                                          batch_size = batch_size, parameters = params)
+    for batch in reader:
+        yield batch.to_pandas(split_blocks = True, self_destruct = True)
+
+def SQL_read(query_string: str, params: list = None, data: str = None):
+    # borrows a connection from the pool for the length of the query
+    # data is the dataset the query is for, which decides the fetch backend used
+    query_string = SQL_translate(query_string)
+    if params != None:
+        params = [SQL_date(i) if isinstance(i, datetime) else i for i in params]
+    t0 = time.time()
+    
+    if SQL_fetch_backend(data) == "arrow":
+        # arrow-odbc binds every parameter as text
+        params = None if params == None else [None if i == None else str(i) for i in params]
+        reader = read_arrow_batches_from_odbc(query = query_string, connection_string = SQL_connection_string, 
+                                              batch_size = SQL_chunksize, parameters = params)
+        df = pa.Table.from_batches(list(reader), schema = reader.schema).to_pandas(split_blocks = True, self_destruct = True)
+    else:
+        with SQL_connections.connection() as connection:
+            df = pd.read_sql_query(query_string, connection, params = params)
+    
+    size = Run_log_size(df)
+    SQL_log(data, time.time() - t0, size["Rows"], size["MB"])
+    return df
+
+def SQL_log_chunks(chunks, data: str):
+    # passes the chunks on, only logging the time spent getting each chunk rather than the time spent using it
+    seconds, rows, MB, n = 0, 0, 0, 0
+    t0 = time.time()
+    for df in chunks:
+        seconds += time.time() - t0
+        size = Run_log_size(df)
+        rows, MB, n = rows + size["Rows"], MB + size["MB"], n + 1
+        yield df
+        t0 = time.time()
+    seconds += time.time() - t0
+    SQL_log(data, seconds, rows, MB, chunks = n)
+
+def SQL_read_chunks(query_string: str, params: list = None, chunksize: int = SQL_chunksize, data: str = None):
+    # yields the result set chunksize rows at a time, the connection is kept until every chunk has been read
+    query_string = SQL_translate(query_string)
+    if params != None:
+        params = [SQL_date(i) if isinstance(i, datetime) else i for i in params]
+    
+    if SQL_fetch_backend(data) == "arrow":
+        params = None if params == None else [None if i == None else str(i) for i in params]
+        for df in SQL_log_chunks(SQL_read_arrow(query_string, params, batch_size = chunksize), data):
+            yield df
+    else:
+        with SQL_connections.connection() as connection:
+            chunks = pd.read_sql_query(query_string, connection, params = params, chunksize = chunksize)
+            for df in SQL_log_chunks(chunks, data):
+                yield df
+
+def SQL_read_batch(query_strings: list) -> list:
+    # runs several queries in one round trip to the SQL server and returns a DataFrame for each of them. The local
+    # backends can't return more than one result set from a query, so they run them one after another instead
+    t0 = time.time()
+    with SQL_connections.connection() as connection:
+        if SQL_backend != "sqlserver":
+            dfs = [pd.read_sql_query(SQL_translate(i), connection) for i in query_strings]
+            SQL_log("Reference_data", time.time() - t0, sum(len(i.index) for i in dfs), 
+                    sum(Run_log_size(i)["MB"] for i in dfs), chunks = len(dfs))
+            return dfs
+        
+        cursor = connection.cursor()
+        cursor.execute("SET NOCOUNT ON;\n" + ";\n".join(query_strings))
+        dfs = []
+        while True:
+            columns = [i[0] for i in cursor.description]
+            dfs.append(pd.DataFrame.from_records([tuple(i) for i in cursor.fetchall()], columns = columns))
+            if cursor.nextset() != True:
+                break
+        cursor.close()
+    SQL_log("Reference_data", time.time() - t0, sum(len(i.index) for i in dfs), 
+            sum(Run_log_size(i)["MB"] for i in dfs), chunks = len(dfs))
+    return dfs
+
+def month_partitions(date_from, date_to) -> list:
+    # splits a date range into one (start, end) pair per calendar month, e.g. 2024-10-15 to 2024-12-10 gives
+    # [("2024-10-15", "2024-10-31"), ("2024-11-01", "2024-11-30"), ("2024-12-01", "2024-12-10")]
+    start = pd.Timestamp(date_from)
+    end = pd.Timestamp(date_to)
+    partitions = []
+    while start <= end:
+        next_month = start.normalize() + relativedelta(months = 1, day = 1)
+        partitions.append((SQL_date(start), SQL_date(min(next_month - relativedelta(days = 1), end))))
+        start = next_month
+    return partitions
+
+SQL_thread_state = threading.local() # "loads" is set on Load_scheduler's threads to how many it runs at once
+
+def SQL_workers() -> int:
+    # threads for gathering months or batches of one dataset at once. Loads run by Load_scheduler share the pool's
+    # connections, so each gets its share of SQL_pool_size rather than that many threads of its own
+    return max(1, SQL_pool_size // getattr(SQL_thread_state, "loads", 1))
+
+def SQL_read_partitioned(method, date_from, date_to):
+    # yields the data for each month in order, with up to SQL_workers() months being gathered at once on separate
+    # threads (each with its own pooled connection), so only a few months are ever held in memory at a time
+    partitions = month_partitions(date_from, date_to)
+    if len(partitions) <= 1:
+        yield method(date_from, date_to)
+        return
+    
+    print(f"Gathering {len(partitions)} months in parallel...")
+    print(" ")
+    workers = SQL_workers()
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        futures = deque()
+        for i, j in partitions:
+            futures.append(executor.submit(method, i, j))
+            if len(futures) >= workers:
+                yield futures.popleft().result()
+        while len(futures) > 0:
+            yield futures.popleft().result()
+
+# columns gathered for each dataset, {column in the SQL table: column name used in the analysis}
+# these are the only columns requested from the server so add any new ones here
+SQL_columns = {"MIP_data": {"SettlementDate": "Date", "HHPeriod": "SP", "Value": "Price", "Description": "Description"},
+               
+               "BMU_data": {"Elexon_BMUnitID": "BMU ID", "NGC_BMUnitID": "NGU ID", "PartyName": "Company",
+                            "GSPGroup": "GSP Group", "ReportName": "Fuel type", "BMU.FuelTypeID": "Fuel type ID"},
+               
+               "NGU_data": {"NGESO_NGTUnitID": "NGU ID", "CompanyName": "Company", "ReportName": "Fuel type", 
+                            "[BM/NBM]": "BM/NBM"},
+               
+               "Capacity_data": {"BMU.Elexon_BMUnitID": "BMU ID", "Capacity.Runtime": "Date", "Capacity.GC": "GC",
+                                 "Capacity.DC": "DC", "BMU.NGC_BMUnitID": "NGU ID"},
+               
+               "BOD_data": {"BOD.SettlementDate": "Date", "BOD.HHPeriod": "SP", "BOD.TimeFromUTC": "Time from",
+                            "BOD.TimeToUTC": "Time to", "BMU.Elexon_BMUnitID": "BMU ID", "BMU.NGC_BMUnitID": "NGU ID",
+                            "ft.ReportName": "Fuel type", "BMU.PartyName": "Company", "BOD.LevelFrom": "MW from", 
+                            "BOD.LevelTo": "MW to", "BOD.PairId": "Pair ID", "BOD.Bid": "Bid price", "BOD.Offer": "Offer price"},
+               
+               "BOA_data": {"BOA.SettlementDate": "Date", "BMU.Elexon_BMUnitID": "BMU ID", 
+                            "BOA.AcceptanceNumber": "Acceptance number", "BOA.AcceptanceTime": "Acceptance time",
+                            "BOA.TimeFromUTC": "Time from", "BOA.TimeToUTC": "Time to", "BOA.LevelFrom": "MW from",
+                            "BOA.LevelTo": "MW to", "BOA.SoFlag": "SO Flag", "BOA.StorFlag": "STOR Flag", 
+                            "BOA.DeemedBOFlag": "Deemed Flag", "BOA.RRFlag": "RR Flag"},
+               
+               "DSP_data": {"SettlementDate": "Date", "HHPeriod": "SP", "ID": "BMU ID", "BidOfferPairId": "Pair ID",
+                            "CadlFlag": "CADL Flag", "SoFlag": "SO Flag", "StorFlag": "STOR Flag", 
+                            "Price": "Price (£/MWh)", "Volume": "Volume (MWh)"},
+               
+               "DISBSAD_data": {"SettlementDate": "Date", "HHPeriod": "SP", "ID": "ID", "Elexon_AssetID": "NGU ID",
+                                "SoFlag": "SO Flag", "BsaaSTORProviderFlag": "STOR Flag", "Elexon_PartyID": "Company ID",
+                                "Price": "Price (£/MWh)", "Volume": "Volume (MWh)", "Cost": "Cost (£)", 
+                                "TenderedStatus": "Tendered Status", "ServiceType": "Service type", "StartTime": "Start time"},
+               
+               "EAC_data": {"Unit_NGESOID": "NGU ID", "BasketID": "Basket ID", "ServiceType": "Service type",
+                            "DeliveryStartDate": "Start time", "DeliveryEndDate": "End time", "OrderType": "Order type",
+                            "AuctionProduct": "Service", "Volume": "Volume (MW)", "PriceLimit": "Submitted price (£/MW/hr)",
+                            "LoopedBasketID": "Looped Basket ID", "ExecutedVolume": "Executed Volume (MW)",
+                            "ClearingPrice": "Clearing price (£/MW/hr)", "NGU.CompanyName": "Company"},
+               
+               "STOR_data": {"ServiceDeliveryFromDate": "Start time", "ServiceDeliveryToDate": "End time", 
+                             "Unit_NGESOID": "NGU ID", "NGU.CompanyName": "Company", "NGU.[BM/NBM]": "BM/NBM", 
+                             "FuelType": "Fuel type", "TenderedMW": "Submitted MW", "ContractedMW": "Accepted MW",
+                             "TenderedAvailabilityPrice": "Availability price", "MarketClearingPrice": "Clearing price",
+                             "Status": "Status"},
+               
+               "SFFR_data": {"DeliveryStart": "Start time", "NGESO_NGTUnitID": "NGU ID", "NGU.CompanyName": "Company",
+                             "TechnologyType": "Fuel type", "EFA": "EFA", "[Volume(MW)]": "Submitted MW",
+                             "[AcceptedVolume(MW)]": "Accepted MW", "[Price(£/MWh)]": "Submitted price (£/MW/hr)",
+                             "[ClearingPrice(£/MWh)]": "Clearing price", "Status": "Status"},
+               
+               "Inertia_data": {"SettlementDate": "Date", "HHPeriod": "SP", "OutturnInertia": "Outturn Inertia",
+                                "MarketProvidedInertia": "Market Provided Inertia"},
+               
+               "Generation_data": {"gen.SettlementDate": "Date", "gen.HHPeriod": "SP", "gen.Value": "MW",
+                                   "Fuel.ReportName": "Fuel type"},
+               
+               "Demand_data": {"SettlementDate": "Date", "HHPeriod": "SP", "Value": "MW", "Description": "Demand type"},
+               
+               "FPN_data": {"SettlementDate": "Date", "HHPeriod": "SP", "TimeFrom": "Time from", "TimeTo": "Time to", 
+                            "Elexon_BMUnitID": "BMU ID", "LevelFrom": "MW from", "LevelTo": "MW to"}}
+
+def SQL_select(data: str) -> str:
+    # column list for the SELECT part of a query, with the sync watermark if the table has it
+    columns = list(SQL_columns[data].keys())
+    if SQL_sync_watermark(data) != None:
+        columns.append(SQL_sync_datasets[data]["watermark"])
+    return ", ".join(columns)
+
+def SQL_renames(data: str) -> dict:
+    # the server returns column names without the table alias or square brackets
+    renames = {i.split(".")[-1].strip("[]"): j for i, j in SQL_columns[data].items()}
+    if data in SQL_sync_datasets:
+        renames[SQL_sync_datasets[data]["watermark"].split(".")[-1]] = "Last updated"
+    return renames
+
+# datasets whose cached data is kept in sync with rows that are added late or restated on the server. The watermark
+# is the column in the table ("table") that's set whenever a row is published or changed, so only rows newer than
+# the newest one in the cache (its high-watermark) are pulled. They replace the cached rows with the same natural
+# key. The watermark is gathered as "Last updated" if the table has it, which is checked the first time the dataset
+# is queried, the dataset isn't synced if it hasn't. Cached datasets are synced at most every SQL_sync_every minutes
+# so warm runs in between don't query the server (0 to sync on every load)
+SQL_sync_datasets = {"MIP_data": {"table": "PowerSystem.tblSystemPrice", "watermark": "Price.LastUpdated", 
+                                  "key": ["Date", "SP", "Description"]},
+                     "DISBSAD_data": {"table": "PowerSystem.tblBalancingServicesAdjustment", "watermark": "LastUpdated", 
+                                      "key": ["Date", "SP", "ID"]},
+                     "EAC_data": {"table": "PowerSystem.tblEACAuctionResultsSell", "watermark": "EAC.LastUpdated", 
+                                  "key": ["Basket ID", "NGU ID", "Service", "Start time"]},
+                     "STOR_data": {"table": "PowerSystem.tblSTORDayAheadAuctionResults", "watermark": "STOR.LastUpdated", 
+                                   "key": ["Start time", "NGU ID"]},
+                     "SFFR_data": {"table": "PowerSystem.tblFFRStaticAuctionResults", "watermark": "SFFR.LastUpdated", 
+                                   "key": ["Start time", "NGU ID", "EFA"]},
+                     "Inertia_data": {"table": "PowerSystem.tblSystemInertia", "watermark": "LastUpdated", "key": ["Date", "SP"]},
+                     "Generation_data": {"table": "PowerSystem.tblGenerationByFuel", "watermark": "gen.LastUpdated", 
+                                         "key": ["Date", "SP", "Fuel type"]},
+                     "Demand_data": {"table": "PowerSystem.tblDemandOutturn", "watermark": "demand.LastUpdated", 
+                                     "key": ["Date", "SP", "Demand type"]}}
+SQL_sync_every: int = 60
+SQL_sync_checked = {} # {(backend, dataset): whether the table has the watermark column}
+SQL_sync_checked_lock = threading.Lock() # the months of a dataset are gathered on several threads at once
+
+def SQL_sync_watermark(data: str):
+    # the dataset's watermark column if its table has one, otherwise None. Checked once a session with a query
+    # that returns no rows
+    if data not in SQL_sync_datasets:
+        return None
+    with SQL_sync_checked_lock:
+        if (SQL_backend, data) not in SQL_sync_checked:
+            column = SQL_sync_datasets[data]["watermark"].split(".")[-1]
+            try:
+                with SQL_connections.connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(SQL_translate(f"SELECT MAX({column}) FROM {SQL_sync_datasets[data]['table']} WHERE 1 = 0"))
+                    cursor.fetchall()
+                    cursor.close()
+                SQL_sync_checked[(SQL_backend, data)] = True
+            except SQL_errors:
+                print(f"{SQL_sync_datasets[data]['table']} hasn't got {column}, so {data} won't be synced")
+                print(" ")
+                SQL_sync_checked[(SQL_backend, data)] = False
+    return SQL_sync_datasets[data]["watermark"] if SQL_sync_checked[(SQL_backend, data)] == True else None
+
+# datasets whose table and column names haven't been confirmed against the SQL server yet (BOA_data's follow the
+# Elexon BOALF fields). The local database is made from SQL_columns so it can't catch a wrong name, so they're
+# checked on the server with a query returning no rows before they're gathered, and aren't loaded by the analysis
+# below. Take a dataset off once its names have been checked
+SQL_unconfirmed_datasets = ["BOA_data"]
+SQL_schema_checked = {} # {(backend, dataset): the error if the check failed, otherwise None}
+SQL_schema_checked_lock = threading.Lock()
+
+def SQL_schema_check(data: str, from_string: str):
+    # for the datasets in SQL_unconfirmed_datasets, checks the columns in SQL_columns can be selected from
+    # from_string (the query's FROM and JOINs), once a session. Raises a ValueError if they can't
+    if data not in SQL_unconfirmed_datasets:
+        return
+    with SQL_schema_checked_lock:
+        if (SQL_backend, data) not in SQL_schema_checked:
+            try:
+                with SQL_connections.connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(SQL_translate(f"SELECT {SQL_select(data)} {from_string} WHERE 1 = 0"))
+                    cursor.fetchall()
+                    cursor.close()
+                SQL_schema_checked[(SQL_backend, data)] = None
+            except SQL_errors as error:
+                SQL_schema_checked[(SQL_backend, data)] = str(error)
+    if SQL_schema_checked[(SQL_backend, data)] != None:
+        raise ValueError(f"The server hasn't got the table or columns {data} is gathered from, check SQL_columns and SQL_query.{data} "
+                         f"({SQL_schema_checked[(SQL_backend, data)]})")
+
+def SQL_sync_filter(data: str, changed_since = False) -> tuple:
+    # extra WHERE condition and parameter to only get the rows published or restated after changed_since
+    if changed_since == False:
+        return "", []
+    return f"AND {SQL_sync_datasets[data]['watermark']} > ?", [changed_since]
+
+# types each dataset is given at the end of Data_load, whether it came off the server or out of the cache.
+# "category" is for columns with only a few different strings (IDs, fuel types, services), "flag" turns the "T"/"F"
+# flags into True/False, SP and EFA fit in an int8 and prices and volumes don't need more than a float32.
+# "datetime" is for the time columns which Data_load doesn't check the dates on (or which can come back as strings
+# when a top-up off the server is empty), so they're the same type whether they came from the server or the cache.
+# Costs and MW totals which get summed over months are left as float64, and the reference data (BMU, NGU and
+# capacity info) is left as it is as it's only used to make the lookup dicts
+Data_schemas = {"DSP_data": {"BMU ID": "category", "NGU ID": "category", "Fuel type": "category", "Company": "category",
+                             "Order type": "category", "Energy/System": "category", "Month": "category",
+                             "SO Flag": "flag", "STOR Flag": "flag", "CADL Flag": "flag", "SP": "int8", "Pair ID": "int8",
+                             "Price (£/MWh)": "float32", "Volume (MWh)": "float32", "Volume ABS": "float32", "Month start": "date"},
+
+                "DISBSAD_data": {"NGU ID": "category", "Fuel type": "category", "Company": "category",
+                                 "Company ID": "category", "Order type": "category", "Tendered Status": "category",
+                                 "Service type": "category", "Month": "category", "SO Flag": "flag", "STOR Flag": "flag",
+                                 "Start time": "datetime", "Last updated": "datetime", "SP": "int8",
+                                 "Price (£/MWh)": "float32", "Volume (MWh)": "float32"},
+
+                "EAC_data": {"NGU ID": "category", "BMU ID": "category", "Fuel type": "category", "Company": "category",
+                             "Service": "category", "Service type": "category", "Order type": "category",
+                             "Month": "category", "Start time": "datetime", "End time": "datetime",
+                             "Last updated": "datetime", "Volume (MW)": "float32", "Submitted price (£/MW/hr)": "float32",
+                             "Executed Volume (MW)": "float32", "Clearing price (£/MW/hr)": "float32"},
+
+                "STOR_data": {"NGU ID": "category", "Company": "category", "BM/NBM": "category", "Fuel type": "category",
+                              "Status": "category", "Start time": "datetime", "End time": "datetime",
+                              "Last updated": "datetime", "Submitted MW": "float32", "Accepted MW": "float32",
+                              "Availability price": "float32", "Clearing price": "float32"},
+
+                "SFFR_data": {"NGU ID": "category", "Company": "category", "Fuel type": "category", "Status": "category",
+                              "Start time": "datetime", "Last updated": "datetime", "EFA": "int8", "Submitted MW": "float32",
+                              "Accepted MW": "float32", "Submitted price (£/MW/hr)": "float32", "Clearing price": "float32"},
+
+                "BOD_data": {"BMU ID": "category", "NGU ID": "category", "Fuel type": "category", "Company": "category",
+                             "Time from": "datetime", "Time to": "datetime", "SP": "int8", "Pair ID": "int8"},
+
+                "BOA_data": {"BMU ID": "category", "SO Flag": "flag", "STOR Flag": "flag", "Deemed Flag": "flag",
+                             "RR Flag": "flag"},
+
+                "FPN_data": {"BMU ID": "category", "Time from": "datetime", "Time to": "datetime", "SP": "int8"},
+                "MIP_data": {"Description": "category", "Last updated": "datetime", "SP": "int8"},
+                "Generation_data": {"Fuel type": "category", "Last updated": "datetime", "SP": "int8"},
+                "Demand_data": {"Demand type": "category", "Last updated": "datetime", "SP": "int8"},
+                "Inertia_data": {"Last updated": "datetime", "SP": "int8"}}
+
+def Data_schema(df, data: str):
+    # gives the dataset the types in Data_schemas, any columns it doesn't have are skipped
+    for i, j in Data_schemas.get(data, {}).items():
+        if i not in df.columns:
+            continue
+        if j == "flag":
+            df[i] = df[i].isin(["T", True, "True"])
+        elif j == "datetime":
+            df[i] = pd.to_datetime(df[i])
+        elif j == "date":
+            pass # kept as dates by the cache, see Cache_read_partition
+        elif j == "int8" and df[i].isna().any() == True:
+            df[i] = df[i].astype("Int8") # nullable int so blanks are kept
+        else:
+            df[i] = df[i].astype(j)
+    return df
+
+# columns worked out from a dataset's own rows, which are added as the rows go into the cache and saved with them
+# so they aren't worked out again on every load. Change the number when Data_derive changes, the cached partitions
+# are then worked out again as they're read
+Data_derived_versions = {"DSP_data": 1}
+
+def Data_derive(df, data: str):
+    # adds the derived columns for the dataset
+    if data == "DSP_data":
+        df["Date"] = pd.to_datetime(df["Date"])
+        df["Month"] = df["Date"].dt.strftime("%b-%y")
+        df["Volume ABS"] = df["Volume (MWh)"].abs()
+        
+        # works out bid/offer status, from the volume for DISBSAD and from the pair ID for normal BOAs
+        DISBSAD = df["BMU ID"].isin([str(i) for i in range(2000)]) # BMU ID is a number for DISBSAD
+        df["Order type"] = "Offer"
+        df["Order type"] = df["Order type"].where(df["Volume (MWh)"].where(DISBSAD, df["Pair ID"]) > 0, "Bid")
+        
+        df["Energy/System"] = "System"
+        df["Energy/System"] = df["Energy/System"].where(df["SO Flag"].isin(["T", True]) | df["CADL Flag"].isin(["T", True]), "Energy")
+        df["Month start"] = df["Date"].dt.to_period("M").dt.start_time.dt.date
+    return df
+
+"""==========================================================================================================
+SQL queries
+============================================================================================================="""
+
+def BOA_compact(df):
+    # there are millions of acceptances a year so they're kept as small types, the acceptance number fits in an
+    # int32 and the MW levels don't need more precision than a float32
+    for i in ["Date", "Acceptance time", "Time from", "Time to"]:
+        df[i] = pd.to_datetime(df[i])
+    df["Acceptance number"] = df["Acceptance number"].astype("int32")
+    df[["MW from", "MW to"]] = df[["MW from", "MW to"]].astype("float32")
+    return df
+
+def SQL_capacity_query(mode: str = "history") -> str:
+    # "history" is every GC/DC submission in time order, "latest" the most recent one for each BMU and "as of" the
+    # one in force at a time given as the query parameter. The last two use a window function so only one row per
+    # BMU comes off the server
+    # don't use Company as a column in here, as it doesn't come from the BMUManaged table
+    row_number = ", ROW_NUMBER() OVER (PARTITION BY Capacity.BMUnitID ORDER BY Capacity.Runtime DESC) as RowNumber"
+    query_string = f"""
+    SELECT {SQL_select("Capacity_data")}{row_number if mode != "history" else ""}
+    
+    FROM PowerSystem.tblBMUnitGCDC as Capacity
+    
+    INNER JOIN Meta.tblBMUnit_Managed as BMU on BMU.BMUnitID = Capacity.BMUnitID
+    """
+    if mode == "history":
+        return f"{query_string}\n    ORDER BY Capacity.Runtime"
+    elif mode == "latest":
+        pass
+    elif mode == "as of":
+        query_string = f"{query_string}\n    WHERE Capacity.Runtime <= ?"
+    else:
+        raise ValueError(f"{mode} isn't a capacity query mode, use history, latest or as of")
+    return f"""SELECT {", ".join(SQL_renames("Capacity_data").keys())} FROM ({query_string}) as Capacity WHERE RowNumber = 1"""
+
+# queries for the reference data, which are kept here as they're run on their own and in one batch
+SQL_reference_queries = {"BMU_data": f"""
+                         SELECT {SQL_select("BMU_data")}
+                         
+                         FROM Meta.tblBMUnit_Managed as BMU
+                         
+                         INNER JOIN Meta.tblFuelType as ft ON ft.FuelTypeID = BMU.FuelTypeID
+                         """,
+                         
+                         "NGU_data": f"""
+                         SELECT {SQL_select("NGU_data")}
+                         
+                         FROM Meta.tblNGTUnit_Managed as NGU
+                         
+                         LEFT JOIN Meta.tblFuelType as ft on ft.FuelTypeID = NGU.FuelTypeID
+                         """,
+                         
+                         # only the latest capacity of each BMU is kept in the reference data
+                         "Capacity_data": SQL_capacity_query("latest")}
+
+class SQL_query: # creates SQL query class, connections come from SQL_connections when a method is run
+
+    def __init__(self):
+        print("Init")
+        
+    
+    def MIP_data(date_from: str, date_to: str, changed_since = False):
+        # changed_since only gets the rows published or restated after then (see SQL_sync_datasets)
+        sync_filter, sync_params = SQL_sync_filter("MIP_data", changed_since)
+        query_string = f"""
+        SELECT {SQL_select("MIP_data")}
+        
+        FROM PowerSystem.tblSystemPrice as Price
+
+        INNER JOIN Meta.tblDataDescription as DD on DD.DataDescriptionID = Price.DataDescriptionID
+        
+        WHERE SettlementDate >= ? AND SettlementDate <= ? {sync_filter}
+        """
+        df = SQL_read(query_string, [date_from, date_to] + sync_params, "MIP_data")
+        
+        df = df.rename(columns = SQL_renames("MIP_data"))
+        rename_MIP = {"Main Price Summary": "SIP", "APXMIDP": "APX", "N2EXMIDP": "N2EX", "Market Price Summary": "Market Price Summary"}
+        df["Description"] = df["Description"].map(rename_MIP).where(df["Description"].isin(rename_MIP.keys()), df["Description"])
+        df = df.sort_values(by = ["Date", "SP"]).reset_index(drop = True)
+        
+        return df
+        
+    def BMU_data():
+        print("Gathering asset information data from SQL server...")
+        print(" ")
+        df = SQL_read(SQL_reference_queries["BMU_data"], data = "BMU_data")
+        
+        df = df.rename(columns = SQL_renames("BMU_data"))
+        
+        return df
+    
+    def NGU_data():
+        print("Gathering asset information data from SQL server...")
+        print(" ")
+        df = SQL_read(SQL_reference_queries["NGU_data"], data = "NGU_data")
+        df = df.rename(columns = SQL_renames("NGU_data"))
+        df = df.sort_values(by = "NGU ID").reset_index(drop = True)
+        return df
+        
+    def Capacity_data(mode: str = "history", as_of: str = False):
+        # mode is "history", "latest" or "as of" (see SQL_capacity_query), as_of is the time for the "as of" mode
+        print("Gathering BMU capacity data from SQL server...")
+        print(" ")
+        
+        params = [as_of] if mode == "as of" else None
+        df = SQL_read(SQL_capacity_query(mode), params, "Capacity_data")
+        df = df.rename(columns = SQL_renames("Capacity_data"))
+        return df
+    
+    def Reference_data():
+        # BMU_data, NGU_data and Capacity_data gathered together in one batch, returned as a dict of DataFrames
+        print("Gathering BMU, NGU and capacity data from SQL server...")
+        print(" ")
+        dfs = SQL_read_batch(list(SQL_reference_queries.values()))
+        dfs = {i: df.rename(columns = SQL_renames(i)) for i, df in zip(SQL_reference_queries.keys(), dfs)}
+        dfs["NGU_data"] = dfs["NGU_data"].sort_values(by = "NGU ID").reset_index(drop = True)
+        return dfs
+    
+    def BOD_data(date_from: str, date_to: str, chunksize: int = None):
+        # if chunksize is given, returns an iterator of DataFrames with chunksize rows each instead of one DataFrame
+        date_to = datetime.strftime(datetime.strptime(date_to, "%Y-%m-%d") + relativedelta(days = 1), "%Y-%m-%d")
+        query_string = f"""SELECT {SQL_select("BOD_data")}
+        FROM [PowerSystem].[tblBidOfferData] as BOD
+        
+        INNER JOIN [Meta].[tblBMUnit_Managed] as BMU
+        ON BMU.BMUnitID = BOD.BMUnitID
+
+        INNER JOIN [Meta].[tblFuelType] as ft
+        ON BMU.FuelTypeID = ft.FuelTypeID
+
+        WHERE
+        [TimeFromUTC] >= ? and [TimeToUTC] <= ?
+        
+        ORDER BY [TimeFromUTC]
+        """
+        
+        def process(df):
+            df.rename(columns = SQL_renames("BOD_data"), inplace = True)
+            df = df.sort_values(by = "Time from").reset_index(drop = True)
+            return df
+
+        print("Gathering submitted bid/offer data from SQL server...")
+        print(" ")
+        if chunksize == None:
+            return process(SQL_read(query_string, [date_from, date_to], "BOD_data"))
+        else:
+            return map(process, SQL_read_chunks(query_string, [date_from, date_to], chunksize, "BOD_data"))
+    
+    def BOA_data(date_from: str, date_to: str, chunksize: int = None):
+        # bid-offer acceptances by settlement day, each row being one point of an acceptance's MW profile
+        # if chunksize is given, returns an iterator of DataFrames with chunksize rows each instead of one DataFrame
+        # the table and column names are still to be confirmed, see SQL_unconfirmed_datasets
+        from_string = """FROM PowerSystem.tblBidOfferAcceptance as BOA
+        
+        INNER JOIN Meta.tblBMUnit_Managed as BMU on BMU.BMUnitID = BOA.BMUnitID"""
+        SQL_schema_check("BOA_data", from_string)
+        query_string = f"""SELECT {SQL_select("BOA_data")}
+        {from_string}
+        
+        WHERE BOA.SettlementDate >= ? AND BOA.SettlementDate <= ?
+        
+        ORDER BY BOA.SettlementDate, BOA.AcceptanceTime, BOA.AcceptanceNumber
+        """
+        
+        def process(df):
+            df.rename(columns = SQL_renames("BOA_data"), inplace = True)
+            return BOA_compact(df)
+        
+        print("Gathering bid-offer acceptance data from SQL server...")
+        print(" ")
+        if chunksize == None:
+            return process(SQL_read(query_string, [date_from, date_to], "BOA_data"))
+        else:
+            return map(process, SQL_read_chunks(query_string, [date_from, date_to], chunksize, "BOA_data"))
+    
+    
+    def DSP_data(date_from: str, date_to: str, chunksize: int = None):
+        # if chunksize is given, returns an iterator of DataFrames with chunksize rows each instead of one DataFrame
+        query_string = f"""SELECT {SQL_select("DSP_data")}
+        FROM PowerSystem.tblDetailedSystemPrices as DSP
+        
+        WHERE SettlementDate >= ? AND SettlementDate <= ?
+        
+        ORDER BY SettlementDate, HHPeriod
+        """
+        
+        def process(df):
+            df.rename(columns = SQL_renames("DSP_data"), inplace = True)
+            df["Date"] = pd.to_datetime(df["Date"])
+            df = df.sort_values(by = ["Date", "SP"]).reset_index(drop = True)
+            return df
+        
+        print("Gathering submitted Detailed System Prices data from SQL server...")
+        print(" ")
+        if chunksize == None:
+            return process(SQL_read(query_string, [date_from, date_to], "DSP_data"))
+        else:
+            return map(process, SQL_read_chunks(query_string, [date_from, date_to], chunksize, "DSP_data"))
+    
+    def DSP_summary_data(date_from: str, date_to: str):
+        # monthly volumes, counts and prices of the DSP data by fuel type, order type and energy/system, worked out
+        # on the SQL server using the same rules as Data_load("DSP_data"). Prices are returned as a sum and a count
+        # so averages can be taken over any of the groupings
+        query_string = f"""SELECT MonthStart, FuelType, OrderType, EnergySystem, SUM(ABS(Volume)) as VolumeABS, 
+        COUNT(Volume) as VolumeCount, SUM(Price) as PriceSum, COUNT(Price) as PriceCount
+        
+        FROM (
+            SELECT {SQL_dialect("month start", "DSP.SettlementDate")} as MonthStart, 
+            fuel.ReportName as FuelType, DSP.Volume, DSP.Price,
+            
+            CASE WHEN {SQL_dialect("int", "DSP.ID")} BETWEEN 0 AND 1999 -- BMU ID is a number for DISBSAD
+            THEN (CASE WHEN DSP.Volume > 0 THEN 'Offer' ELSE 'Bid' END)
+            ELSE (CASE WHEN DSP.BidOfferPairId > 0 THEN 'Offer' ELSE 'Bid' END) END as OrderType,
+            
+            CASE WHEN DSP.SoFlag = 'T' OR DSP.CadlFlag = 'T' THEN 'System' ELSE 'Energy' END as EnergySystem
+            
+            FROM PowerSystem.tblDetailedSystemPrices as DSP
+            
+            LEFT JOIN (SELECT Elexon_BMUnitID, MAX(ft.ReportName) as ReportName
+                       FROM Meta.tblBMUnit_Managed as BMU
+                       INNER JOIN Meta.tblFuelType as ft ON ft.FuelTypeID = BMU.FuelTypeID
+                       GROUP BY Elexon_BMUnitID) as fuel on fuel.Elexon_BMUnitID = DSP.ID
+            
+            WHERE DSP.SettlementDate >= ? AND DSP.SettlementDate <= ?
+        ) as DSP
+        
+        GROUP BY MonthStart, FuelType, OrderType, EnergySystem
+        
+        ORDER BY MonthStart"""
+        
+        print("Gathering monthly Detailed System Prices summary from SQL server...")
+        print(" ")
+        df = SQL_read(query_string, [date_from, date_to], "DSP_summary_data")
+        column_renames = {"MonthStart": "Month start", "FuelType": "Fuel type", "OrderType": "Order type", 
+                          "EnergySystem": "Energy/System", "VolumeABS": "Volume ABS", "VolumeCount": "Count",
+                          "PriceSum": "Price sum", "PriceCount": "Price count"}
+        df.rename(columns = column_renames, inplace = True)
+        df["Month start"] = pd.to_datetime(df["Month start"]).dt.date
+        df["Month"] = pd.to_datetime(df["Month start"]).dt.strftime("%b-%y")
+        return df
+    
+    def DISBSAD_data(date_from: str, date_to: str, changed_since = False):
+        sync_filter, sync_params = SQL_sync_filter("DISBSAD_data", changed_since)
+        query_string = f"""SELECT {SQL_select("DISBSAD_data")}
+        FROM PowerSystem.tblBalancingServicesAdjustment
+        
+        WHERE SettlementDate >= ? AND SettlementDate <= ? {sync_filter}
+        
+        """
+        
+        print("Gathering DISBSAD data from SQL server...")
+        print(" ")
+        df = SQL_read(query_string, [date_from, date_to] + sync_params, "DISBSAD_data")
+        
+        df.rename(columns = SQL_renames("DISBSAD_data"), inplace = True)
+        df["Date"] == pd.to_datetime(df["Date"])
+        df = df.sort_values(by = ["Date", "SP"]).reset_index(drop = True)
+        
+        return df
+        
+    
+    def EAC_data(date_from: str, date_to: str, changed_since = False):
+        sync_filter, sync_params = SQL_sync_filter("EAC_data", changed_since)
+        query_string = f"""SELECT {SQL_select("EAC_data")}
+        
+        FROM PowerSystem.tblEACAuctionResultsSell as EAC
+        
+        INNER JOIN Meta.tblNGTUnit_Managed as NGU on NGU.NGESO_NGTUnitID = EAC.Unit_NGESOID
+        
+        WHERE DeliveryStartDate >= ? AND DeliveryEndDate <= ? {sync_filter}"""
+        
+        print("Gathering EAC data from SQL server...")
+        print(" ")
+        df = SQL_read(query_string, [date_from, date_to] + sync_params, "EAC_data")
+        df.rename(columns = SQL_renames("EAC_data"), inplace = True)
+        return df
+    
+    def STOR_data(date_from: str, date_to: str, changed_since = False):
+        sync_filter, sync_params = SQL_sync_filter("STOR_data", changed_since)
+        date_to = datetime.strftime(datetime.strptime(date_to, "%Y-%m-%d") + relativedelta(days = 1), "%Y-%m-%d")
+        query_string = f"""SELECT {SQL_select("STOR_data")}
+        
+        FROM PowerSystem.tblSTORDayAheadAuctionResults as STOR
+        
+        INNER JOIN Meta.tblNGTUnit_Managed as NGU on NGU.NGTUnitID = STOR.NGTUnitID
+        
+        WHERE ServiceDeliveryFromDate >= ? and ServiceDeliveryFromDate <= ? {sync_filter}"""
+        print("Gathering STOR data from the SQL server...")
+        print()
+        df = SQL_read(query_string, [date_from, date_to] + sync_params, "STOR_data")
+        df.rename(columns = SQL_renames("STOR_data"), inplace = True)
+        df = df.sort_values(by = "Start time").reset_index(drop = True)
+        return df
+        
+    
+    def SFFR_data(date_from: str, date_to: str, changed_since = False):
+        sync_filter, sync_params = SQL_sync_filter("SFFR_data", changed_since)
+        
+        # adds on one day to get all the data
+        date_to = datetime.strftime(datetime.strptime(date_to, "%Y-%m-%d") + relativedelta(days = 1), "%Y-%m-%d")
+        
+        query_string = f"""SELECT {SQL_select("SFFR_data")}
+        
+        FROM PowerSystem.tblFFRStaticAuctionResults as SFFR
+        
+        INNER JOIN Meta.tblNGTUnit_Managed as NGU on NGU.NGTUnitID = SFFR.NGTUnitID
+
+        WHERE DeliveryStart >= ? and DeliveryStart <= ? {sync_filter}
+        
+        """
+        print("Gathering SFFR data from SQL server...")
+        print()
+        df = SQL_read(query_string, [date_from, date_to] + sync_params, "SFFR_data")
+        df.rename(columns = SQL_renames("SFFR_data"), inplace = True)
+        df = df.sort_values(by = "Start time").reset_index(drop = True)
+        return df
+    
+    def Inertia_data(date_from: str, date_to: str, changed_since = False):
+        sync_filter, sync_params = SQL_sync_filter("Inertia_data", changed_since)
+        query_string = f"""SELECT {SQL_select("Inertia_data")}
+        
+        FROM PowerSystem.tblSystemInertia
+        
+        WHERE SettlementDate >= ? AND SettlementDate <= ? {sync_filter}
+
+        ORDER BY SettlementDate, HHPeriod"""
+        
+        df = SQL_read(query_string, [date_from, date_to] + sync_params, "Inertia_data")
+        df.rename(columns = SQL_renames("Inertia_data"), inplace = True)
+        return df
+    
+    def Generation_data(date_from: str, date_to: str, changed_since = False):
+        sync_filter, sync_params = SQL_sync_filter("Generation_data", changed_since)
+        query_string = f"""SELECT {SQL_select("Generation_data")}
+        
+        FROM PowerSystem.tblGenerationByFuel as gen
+
+        INNER JOIN Meta.tblFuelType as Fuel on Fuel.FuelTypeID = gen.FuelTypeID
+        
+        WHERE SettlementDate >= ? and SettlementDate <= ? {sync_filter}
+        
+        ORDER BY SettlementDate, HHPeriod"""
+        
+        print("Gathering gen mix data from the SQL server...")
+        print(" ")
+        df = SQL_read(query_string, [date_from, date_to] + sync_params, "Generation_data")
+        df.rename(columns = SQL_renames("Generation_data"), inplace = True)
+        return df
+    
+    def Demand_data(date_from: str, date_to: str, changed_since = False):
+        sync_filter, sync_params = SQL_sync_filter("Demand_data", changed_since)
+        query_string = f"""SELECT {SQL_select("Demand_data")}
+        
+        FROM PowerSystem.tblDemandOutturn as demand
+        
+        INNER JOIN Meta.tblDataDescription as DD on DD.DataDescriptionID = demand.DataDescriptionID
+        
+        WHERE SettlementDate >= ? AND SettlementDate <= ? {sync_filter}
+        """
+        df = SQL_read(query_string, [date_from, date_to] + sync_params, "Demand_data")
+        df.rename(columns = SQL_renames("Demand_data"), inplace = True)
+        return df
+    
+    def FPN_data(date_from: str, date_to: str, BMU_ID = False, SP_from: int = False, SP_to: int = False):
+        # BMU_ID can be one BMU ID or a list of them, SP_from/SP_to only gets those SPs on each day
+        query_string = f"""
+        SELECT {SQL_select("FPN_data")}
+        
+        FROM PowerSystem.tblPhysicalData as FPN
+        
+        INNER JOIN Meta.tblBMUnit_Managed as BMU on FPN.BMUnitID = BMU.BMUnitID
+        
+        WHERE SettlementDate >= ? AND SettlementDate <= ? 
+        """
+        params = [date_from, date_to]
+        if isinstance(BMU_ID, str):
+            query_string = f"{query_string} AND Elexon_BMUnitID = ?"
+            params.append(BMU_ID)
+        elif BMU_ID != False:
+            query_string = f"{query_string} AND Elexon_BMUnitID IN ({', '.join(['?']*len(BMU_ID))})"
+            params += list(BMU_ID)
+        if SP_from != False:
+            query_string = f"{query_string} AND HHPeriod >= ?"
+            params.append(SP_from)
+        if SP_to != False:
+            query_string = f"{query_string} AND HHPeriod <= ?"
+            params.append(SP_to)
+        
+        df = SQL_read(query_string, params, "FPN_data")
+        df.rename(columns = SQL_renames("FPN_data"), inplace = True)
+        return df
+
+def SQL_benchmark(data: str, date_from: str, date_to: str, backends: list = ["pandas", "arrow"], repeats: int = 3):
+    # times the same query through each fetch backend, e.g. SQL_benchmark("DSP_data", "2024-01-01", "2024-01-31")
+    backend_setting = SQL_fetch_backends.get(data, "pandas")
+    results = []
+    try:
+        for backend in backends:
+            SQL_fetch_backends[data] = backend
+            if SQL_fetch_backend(data) != backend:
+                continue
+            for repeat in range(repeats):
+                t0 = time.time()
+                df = getattr(SQL_query, data)(date_from, date_to)
+                seconds = time.time() - t0
+                results.append({"Backend": backend, "Repeat": repeat, "Seconds": seconds, "Rows": len(df), 
+                                "Rows per second": len(df)/seconds if seconds > 0 else np.nan, 
+                                "MB": df.memory_usage(deep = True).sum()/1e6})
+                del df
+    finally:
+        SQL_fetch_backends[data] = backend_setting
+    
+    results = pd.DataFrame(results)
+    if len(results) > 0:
+        print(f"{data} fetch benchmark {date_from} to {date_to} (median of {repeats})")
+        print(results.groupby("Backend")[["Seconds", "Rows", "Rows per second", "MB"]].median())
+        print(" ")
+    return results
+
+"""==========================================================================================================
+Local database
+============================================================================================================="""
+
+# tables the queries use and the columns needed from each, {table: {column: type}}. The local database is made
+# with these so it can stand in for the SQL server when SQL_backend is "sqlite" or "duckdb"
+SQL_local_tables = {"Meta.tblFuelType": {"FuelTypeID": "int", "ReportName": "text"},
+                    
+                    "Meta.tblDataDescription": {"DataDescriptionID": "int", "Description": "text"},
+                    
+                    "Meta.tblBMUnit_Managed": {"BMUnitID": "int", "Elexon_BMUnitID": "text", "NGC_BMUnitID": "text", 
+                                               "PartyName": "text", "GSPGroup": "text", "FuelTypeID": "int"},
+                    
+                    "Meta.tblNGTUnit_Managed": {"NGTUnitID": "int", "NGESO_NGTUnitID": "text", "CompanyName": "text",
+                                                "FuelTypeID": "int", "BM/NBM": "text"},
+                    
+                    "PowerSystem.tblSystemPrice": {"SettlementDate": "datetime", "HHPeriod": "int", "DataDescriptionID": "int",
+                                                   "Value": "float", "LastUpdated": "datetime"},
+                    
+                    "PowerSystem.tblBMUnitGCDC": {"BMUnitID": "int", "Runtime": "datetime", "GC": "float", "DC": "float"},
+                    
+                    "PowerSystem.tblBidOfferData": {"SettlementDate": "datetime", "HHPeriod": "int", "TimeFromUTC": "datetime",
+                                                    "TimeToUTC": "datetime", "BMUnitID": "int", "LevelFrom": "float", 
+                                                    "LevelTo": "float", "PairId": "int", "Bid": "float", "Offer": "float"},
+                    
+                    "PowerSystem.tblBidOfferAcceptance": {"SettlementDate": "datetime", "BMUnitID": "int", 
+                                                          "AcceptanceNumber": "int", "AcceptanceTime": "datetime",
+                                                          "TimeFromUTC": "datetime", "TimeToUTC": "datetime", 
+                                                          "LevelFrom": "float", "LevelTo": "float", "SoFlag": "text",
+                                                          "StorFlag": "text", "DeemedBOFlag": "text", "RRFlag": "text"},
+                    
+                    "PowerSystem.tblDetailedSystemPrices": {"SettlementDate": "datetime", "HHPeriod": "int", "ID": "text",
+                                                            "BidOfferPairId": "int", "CadlFlag": "text", "SoFlag": "text",
+                                                            "StorFlag": "text", "Price": "float", "Volume": "float"},
+                    
+                    "PowerSystem.tblBalancingServicesAdjustment": {"SettlementDate": "datetime", "HHPeriod": "int", "ID": "int",
+                                                                   "Elexon_AssetID": "text", "SoFlag": "text", 
+                                                                   "BsaaSTORProviderFlag": "text", "Elexon_PartyID": "text",
+                                                                   "Price": "float", "Volume": "float", "Cost": "float",
+                                                                   "TenderedStatus": "text", "ServiceType": "text", 
+                                                                   "StartTime": "datetime", "LastUpdated": "datetime"},
+                    
+                    "PowerSystem.tblEACAuctionResultsSell": {"Unit_NGESOID": "text", "BasketID": "text", "ServiceType": "text",
+                                                             "DeliveryStartDate": "datetime", "DeliveryEndDate": "datetime",
+                                                             "OrderType": "text", "AuctionProduct": "text", "Volume": "float",
+                                                             "PriceLimit": "float", "LoopedBasketID": "text", 
+                                                             "ExecutedVolume": "float", "ClearingPrice": "float",
+                                                             "LastUpdated": "datetime"},
+                    
+                    "PowerSystem.tblSTORDayAheadAuctionResults": {"ServiceDeliveryFromDate": "datetime", 
+                                                                  "ServiceDeliveryToDate": "datetime", "Unit_NGESOID": "text",
+                                                                  "NGTUnitID": "int", "FuelType": "text", "TenderedMW": "float",
+                                                                  "ContractedMW": "float", "TenderedAvailabilityPrice": "float",
+                                                                  "MarketClearingPrice": "float", "Status": "text",
+                                                                  "LastUpdated": "datetime"},
+                    
+                    "PowerSystem.tblFFRStaticAuctionResults": {"DeliveryStart": "datetime", "NGTUnitID": "int", 
+                                                               "TechnologyType": "text", "EFA": "int", "Volume(MW)": "float",
+                                                               "AcceptedVolume(MW)": "float", "Price(£/MWh)": "float",
+                                                               "ClearingPrice(£/MWh)": "float", "Status": "text",
+                                                               "LastUpdated": "datetime"},
+                    
+                    "PowerSystem.tblSystemInertia": {"SettlementDate": "datetime", "HHPeriod": "int", "OutturnInertia": "float",
+                                                     "MarketProvidedInertia": "float", "LastUpdated": "datetime"},
+                    
+                    "PowerSystem.tblGenerationByFuel": {"SettlementDate": "datetime", "HHPeriod": "int", "FuelTypeID": "int",
+                                                        "Value": "float", "LastUpdated": "datetime"},
+                    
+                    "PowerSystem.tblDemandOutturn": {"SettlementDate": "datetime", "HHPeriod": "int", "DataDescriptionID": "int",
+                                                     "Value": "float", "LastUpdated": "datetime"},
+                    
+                    "PowerSystem.tblPhysicalData": {"SettlementDate": "datetime", "HHPeriod": "int", "BMUnitID": "int",
+                                                    "TimeFrom": "datetime", "TimeTo": "datetime", "LevelFrom": "float", 
+                                                    "LevelTo": "float"}}
+
+# column each table is filtered on when a snapshot is taken off the SQL server and indexed on in the local database,
+# tables not listed are copied in full
+SQL_local_date_columns = {"PowerSystem.tblSystemPrice": "SettlementDate", "PowerSystem.tblBidOfferData": "SettlementDate",
+                          "PowerSystem.tblDetailedSystemPrices": "SettlementDate", 
+                          "PowerSystem.tblBidOfferAcceptance": "SettlementDate",
+                          "PowerSystem.tblBalancingServicesAdjustment": "SettlementDate",
+                          "PowerSystem.tblEACAuctionResultsSell": "DeliveryStartDate", 
+                          "PowerSystem.tblSTORDayAheadAuctionResults": "ServiceDeliveryFromDate",
+                          "PowerSystem.tblFFRStaticAuctionResults": "DeliveryStart", 
+                          "PowerSystem.tblSystemInertia": "SettlementDate", "PowerSystem.tblGenerationByFuel": "SettlementDate",
+                          "PowerSystem.tblDemandOutturn": "SettlementDate", "PowerSystem.tblPhysicalData": "SettlementDate",
+                          "PowerSystem.tblBMUnitGCDC": "Runtime"}
+
+SQL_local_types = {"sqlite": {"int": "INTEGER", "float": "REAL", "text": "TEXT", "datetime": "TIMESTAMP"},
+                   "duckdb": {"int": "INTEGER", "float": "DOUBLE", "text": "VARCHAR", "datetime": "TIMESTAMP"}}
+
+def SQL_local_synthetic(date_from: str, date_to: str, units: int = 50, seed: int = 0) -> dict:
+    # makes up data for every table in SQL_local_tables between the dates, units is the number of BMUs/NGUs.
+    # The values are random but have the same shape as the real data, which is enough for benchmarking
+    rng = np.random.default_rng(seed)
+    tables = {}
+    
+    fuel_types = ["CCGT", "OCGT", "Wind", "Solar", "Solar (Embedded)", "Biomass", "Battery", "Pumped storage", "NPSHYD",
+                  "Nuclear", "INTFR", "INTIFA2", "INTELEC", "Other"]
+    descriptions = ["Main Price Summary", "APXMIDP", "N2EXMIDP", "Market Price Summary", # MIP
+                    "Initial Demand Outturn", "Initial Transmission System Demand Outturn"] # demand
+    companies = [f"Company {i}" for i in string.ascii_uppercase[:10]]
+    tables["Meta.tblFuelType"] = pd.DataFrame({"FuelTypeID": range(1, len(fuel_types) + 1), "ReportName": fuel_types})
+    tables["Meta.tblDataDescription"] = pd.DataFrame({"DataDescriptionID": range(1, len(descriptions) + 1), 
+                                                      "Description": descriptions})
+    
+    unit_ids = np.arange(1, units + 1)
+    unit_fuel_types = rng.integers(1, len(fuel_types) + 1, units)
+    unit_companies = rng.choice(companies, units)
+    tables["Meta.tblBMUnit_Managed"] = pd.DataFrame({"BMUnitID": unit_ids, "Elexon_BMUnitID": [f"T_UNIT-{i}" for i in unit_ids],
+                                                     "NGC_BMUnitID": [f"UNIT{i}" for i in unit_ids], 
+                                                     "PartyName": unit_companies, 
+                                                     "GSPGroup": rng.choice(["_A", "_B", "_C", "_D", "_N", "_P"], units),
+                                                     "FuelTypeID": unit_fuel_types})
+    tables["Meta.tblNGTUnit_Managed"] = pd.DataFrame({"NGTUnitID": unit_ids, "NGESO_NGTUnitID": [f"UNIT{i}" for i in unit_ids],
+                                                      "CompanyName": unit_companies, "FuelTypeID": unit_fuel_types, 
+                                                      "BM/NBM": np.where(unit_ids % 5 == 0, "NBM", "BM")})
+    units_df = tables["Meta.tblBMUnit_Managed"]
+    
+    # every settlement period between the dates
+    dates = pd.date_range(date_from, date_to, freq = "D")
+    SPs = pd.DataFrame({"SettlementDate": np.repeat(dates, 48), "HHPeriod": np.tile(np.arange(1, 49), len(dates))})
+    SPs["Start"] = SPs["SettlementDate"] + pd.to_timedelta((SPs["HHPeriod"] - 1)*30, unit = "min")
+    SPs["End"] = SPs["Start"] + pd.Timedelta(minutes = 30)
+    SPs["LastUpdated"] = SPs["End"] + pd.Timedelta(minutes = 15) # published just after the SP
+    
+    df = SPs.merge(pd.DataFrame({"DataDescriptionID": [1, 2, 3, 4]}), how = "cross")
+    df["Value"] = rng.normal(80, 25, len(df)).round(2)
+    tables["PowerSystem.tblSystemPrice"] = df
+    
+    df = SPs.merge(pd.DataFrame({"DataDescriptionID": [5, 6]}), how = "cross")
+    df["Value"] = rng.normal(25000, 5000, len(df)).round(0)
+    tables["PowerSystem.tblDemandOutturn"] = df
+    
+    df = SPs.copy()
+    df["OutturnInertia"] = rng.normal(150, 20, len(df)).round(1)
+    df["MarketProvidedInertia"] = rng.normal(100, 15, len(df)).round(1)
+    tables["PowerSystem.tblSystemInertia"] = df
+    
+    df = SPs.merge(tables["Meta.tblFuelType"][["FuelTypeID"]], how = "cross")
+    df["Value"] = rng.uniform(0, 10000, len(df)).round(0)
+    tables["PowerSystem.tblGenerationByFuel"] = df
+    
+    # physical notifications and bid/offer ladders for every unit in every SP, with a bid and an offer pair each
+    df = SPs.merge(units_df[["BMUnitID"]], how = "cross")
+    df["TimeFrom"] = df["Start"]
+    df["TimeTo"] = df["End"]
+    df["LevelFrom"] = rng.uniform(0, 500, len(df)).round(0)
+    df["LevelTo"] = df["LevelFrom"]
+    tables["PowerSystem.tblPhysicalData"] = df
+    
+    df = df.merge(pd.DataFrame({"PairId": [-1, 1]}), how = "cross")
+    df["TimeFromUTC"] = df["Start"]
+    df["TimeToUTC"] = df["End"]
+    df["Bid"] = rng.normal(40, 20, len(df)).round(2)
+    df["Offer"] = df["Bid"] + rng.uniform(5, 100, len(df)).round(2)
+    tables["PowerSystem.tblBidOfferData"] = df
+    
+    # acceptances for a tenth of the units each SP, each with a two point profile
+    df = SPs.merge(units_df[["BMUnitID"]], how = "cross")
+    df = df[rng.random(len(df)) < 0.1].reset_index(drop = True)
+    df["AcceptanceNumber"] = np.arange(1, len(df) + 1)
+    df["AcceptanceTime"] = df["Start"] - pd.to_timedelta(rng.integers(2, 60, len(df)), unit = "min")
+    df["SoFlag"] = np.where(rng.random(len(df)) < 0.6, "T", "F")
+    df["StorFlag"] = np.where(rng.random(len(df)) < 0.02, "T", "F")
+    df["DeemedBOFlag"] = "F"
+    df["RRFlag"] = "F"
+    level = rng.uniform(-200, 200, len(df)).round(0)
+    df = pd.concat([df.assign(TimeFromUTC = df["Start"], TimeToUTC = df["Start"] + pd.Timedelta(minutes = 5), LevelFrom = 0, LevelTo = level),
+                    df.assign(TimeFromUTC = df["Start"] + pd.Timedelta(minutes = 5), TimeToUTC = df["End"], LevelFrom = level, LevelTo = level)])
+    tables["PowerSystem.tblBidOfferAcceptance"] = df.sort_values(by = ["SettlementDate", "AcceptanceTime"])
+    
+    # about a fifth of the units get accepted bids/offers each SP, with the odd DISBSAD action (numeric IDs)
+    df = SPs.merge(units_df[["Elexon_BMUnitID"]], how = "cross").rename(columns = {"Elexon_BMUnitID": "ID"})
+    df = df[rng.random(len(df)) < 0.2]
+    DISBSAD_IDs = SPs.sample(frac = 0.1, random_state = seed).assign(ID = lambda i: rng.integers(1, 1999, len(i)).astype(str))
+    df = pd.concat([df, DISBSAD_IDs]).sort_values(by = ["SettlementDate", "HHPeriod"]).reset_index(drop = True)
+    df["BidOfferPairId"] = rng.choice([-2, -1, 1, 2], len(df))
+    df["Volume"] = (np.sign(df["BidOfferPairId"])*rng.uniform(1, 100, len(df))).round(3)
+    df["Price"] = np.where(df["Volume"] > 0, rng.normal(120, 40, len(df)), rng.normal(30, 30, len(df))).round(2)
+    df["CadlFlag"] = np.where(rng.random(len(df)) < 0.05, "T", "F")
+    df["SoFlag"] = np.where(rng.random(len(df)) < 0.6, "T", "F")
+    df["StorFlag"] = np.where(rng.random(len(df)) < 0.02, "T", "F")
+    tables["PowerSystem.tblDetailedSystemPrices"] = df
+    
+    df = DISBSAD_IDs.copy()
+    df["ID"] = df["ID"].astype(int)
+    df["Elexon_AssetID"] = rng.choice(tables["Meta.tblNGTUnit_Managed"]["NGESO_NGTUnitID"], len(df))
+    df["SoFlag"] = "T"
+    df["BsaaSTORProviderFlag"] = np.where(rng.random(len(df)) < 0.1, "T", "F")
+    df["Elexon_PartyID"] = rng.choice(companies, len(df))
+    df["Volume"] = rng.uniform(-100, 100, len(df)).round(3)
+    df["Price"] = rng.normal(100, 50, len(df)).round(2)
+    df["Cost"] = (df["Volume"]*df["Price"]).round(2)
+    df["TenderedStatus"] = rng.choice(["Tendered", "Not Tendered"], len(df))
+    df["ServiceType"] = rng.choice(["Energy", "System"], len(df))
+    df["StartTime"] = df["Start"]
+    tables["PowerSystem.tblBalancingServicesAdjustment"] = df
+    
+    df = pd.DataFrame({"Runtime": dates}).merge(units_df[["BMUnitID"]], how = "cross")
+    df["DC"] = rng.uniform(10, 500, len(df)).round(0)
+    df["GC"] = df["DC"]
+    tables["PowerSystem.tblBMUnitGCDC"] = df
+    
+    # auction results for every EFA block of every day, a third of the NGUs bidding into each
+    EFAs = pd.DataFrame({"Date": np.repeat(dates, 6), "EFA": np.tile(np.arange(1, 7), len(dates))})
+    EFAs["Start"] = EFAs["Date"] + pd.to_timedelta(4*(EFAs["EFA"] - 1) - 1, unit = "h")
+    EFAs["End"] = EFAs["Start"] + pd.Timedelta(hours = 4)
+    EFAs["LastUpdated"] = EFAs["Date"] - pd.Timedelta(hours = 10) # auction results come out the day before
+    NGUs = tables["Meta.tblNGTUnit_Managed"]
+    
+    df = EFAs.merge(NGUs[["NGESO_NGTUnitID"]], how = "cross").rename(columns = {"NGESO_NGTUnitID": "Unit_NGESOID"})
+    df = df.merge(pd.DataFrame({"AuctionProduct": ["DCL", "DCH", "DML", "DMH", "DRL", "DRH", "PQR", "NQR"]}), how = "cross")
+    df = df[rng.random(len(df)) < 0.33].reset_index(drop = True)
+    df["BasketID"] = [f"B{i}" for i in range(len(df))]
+    df["ServiceType"] = np.where(df["AuctionProduct"].str.startswith("D"), "Response", "Reserve")
+    df["DeliveryStartDate"] = df["Start"]
+    df["DeliveryEndDate"] = df["End"]
+    df["OrderType"] = "Sell"
+    df["Volume"] = rng.uniform(1, 50, len(df)).round(1)
+    df["PriceLimit"] = rng.uniform(0, 20, len(df)).round(2)
+    df["LoopedBasketID"] = None
+    df["ExecutedVolume"] = (df["Volume"]*rng.choice([0, 1], len(df))).round(1)
+    df["ClearingPrice"] = rng.uniform(0, 15, len(df)).round(2)
+    tables["PowerSystem.tblEACAuctionResultsSell"] = df
+    
+    df = pd.DataFrame({"Date": dates}).merge(NGUs[["NGTUnitID", "NGESO_NGTUnitID"]], how = "cross")
+    df = df[rng.random(len(df)) < 0.33].reset_index(drop = True)
+    df["ServiceDeliveryFromDate"] = df["Date"] + pd.Timedelta(hours = 5)
+    df["ServiceDeliveryToDate"] = df["ServiceDeliveryFromDate"] + pd.Timedelta(hours = 24)
+    df["Unit_NGESOID"] = df["NGESO_NGTUnitID"]
+    df["FuelType"] = rng.choice(fuel_types, len(df))
+    df["TenderedMW"] = rng.uniform(3, 50, len(df)).round(1)
+    df["TenderedAvailabilityPrice"] = rng.uniform(0, 10, len(df)).round(2)
+    df["MarketClearingPrice"] = rng.uniform(0, 10, len(df)).round(2)
+    df["Status"] = np.where(df["TenderedAvailabilityPrice"] <= df["MarketClearingPrice"], "Accepted", "Rejected")
+    df["ContractedMW"] = df["TenderedMW"].where(df["Status"] == "Accepted", 0)
+    df["LastUpdated"] = df["Date"] - pd.Timedelta(hours = 10)
+    tables["PowerSystem.tblSTORDayAheadAuctionResults"] = df
+    
+    df = EFAs.merge(NGUs[["NGTUnitID"]], how = "cross")
+    df = df[rng.random(len(df)) < 0.33].reset_index(drop = True)
+    df["DeliveryStart"] = df["Start"]
+    df["TechnologyType"] = rng.choice(fuel_types, len(df))
+    df["Volume(MW)"] = rng.uniform(1, 50, len(df)).round(1)
+    df["Price(£/MWh)"] = rng.uniform(0, 10, len(df)).round(2)
+    df["ClearingPrice(£/MWh)"] = rng.uniform(0, 10, len(df)).round(2)
+    df["Status"] = np.where(df["Price(£/MWh)"] <= df["ClearingPrice(£/MWh)"], "Accepted", "Rejected")
+    df["AcceptedVolume(MW)"] = df["Volume(MW)"].where(df["Status"] == "Accepted", 0)
+    tables["PowerSystem.tblFFRStaticAuctionResults"] = df
+    
+    return {i: tables[i][list(j.keys())].reset_index(drop = True) for i, j in SQL_local_tables.items()}
+
+def SQL_local_snapshot(date_from: str, date_to: str) -> dict:
+    # copies every table in SQL_local_tables off the SQL server between the dates
+    date_to = datetime.strftime(datetime.strptime(date_to, "%Y-%m-%d") + relativedelta(days = 1), "%Y-%m-%d")
+    connection = pyodbc.connect(SQL_connection_string)
+    tables = {}
+    try:
+        for table, columns in SQL_local_tables.items():
+            query_string = f"SELECT {', '.join(f'[{i}]' for i in columns)} FROM {table}"
+            params = None
+            if table in SQL_local_date_columns:
+                query_string = f"{query_string} WHERE [{SQL_local_date_columns[table]}] >= ? AND [{SQL_local_date_columns[table]}] < ?"
+                params = [date_from, date_to]
+            print(f"Copying {table} from SQL server...")
+            tables[table] = pd.read_sql_query(query_string, connection, params = params)
+    finally:
+        connection.close()
+    print(" ")
+    return tables
+
+def SQL_local_build(source: str = "synthetic", date_from: str = date_from, date_to: str = date_to, 
+                    backend: str = "sqlite", database: str = SQL_local_database, **kwargs):
+    # makes the local database for the sqlite/duckdb backends from either synthetic data or a snapshot of the SQL
+    # server, e.g. SQL_local_build("snapshot", "2024-10-01", "2024-11-30", "duckdb", "FMR local.duckdb")
+    # then set SQL_backend and SQL_local_database to match. Any existing file is replaced
+    if source == "synthetic":
+        tables = SQL_local_synthetic(date_from, date_to, **kwargs)
+    elif source == "snapshot":
+        tables = SQL_local_snapshot(date_from, date_to)
+    else:
+        raise ValueError(f"{source} isn't a source, use synthetic or snapshot")
+    
+    if os.path.exists(database):
+        os.remove(database)
+    types = SQL_local_types[backend]
+    if backend == "sqlite":
+        connection = sqlite3.connect(database)
+    else:
+        connection = SQL_local_connect(backend, database, read_only = False)
+        for schema in SQL_schemas:
+            connection.execute(f"CREATE SCHEMA {schema}")
+    
+    try:
+        for table, columns in SQL_local_tables.items():
+            # sqlite has a file attached under each schema name, so tables are made without the schema
+            name = table.split(".")[-1] if backend == "sqlite" else table
+            df = tables[table][list(columns.keys())].copy()
+            definition = ", ".join(['"' + i + '" ' + types[j] for i, j in columns.items()])
+            connection.execute(f"CREATE TABLE {name} ({definition})")
+            
+            if backend == "sqlite":
+                for i, j in columns.items():
+                    if j == "datetime":
+                        # midnight is saved without the time, like SQL_date does with the query dates, so the
+                        # text comparisons sqlite does give the same results as the SQL server
+                        df[i] = pd.to_datetime(df[i]).map(SQL_date, na_action = "ignore")
+                df = df.astype(object).where(df.notna(), None)
+                connection.executemany(f"INSERT INTO {name} VALUES ({', '.join(['?']*len(columns))})", 
+                                       df.itertuples(index = False, name = None))
+            else:
+                connection.register("df_temp", df)
+                connection.execute(f"INSERT INTO {name} SELECT * FROM df_temp")
+                connection.unregister("df_temp")
+            
+            if table in SQL_local_date_columns:
+                connection.execute(f"CREATE INDEX ix_{table.split('.')[-1]} ON {name} ({SQL_local_date_columns[table]})")
+            print(f"{table}: {len(df)} rows")
+        connection.commit()
+    finally:
+        connection.close()
+    
+    print(f"{source} {backend} database saved to {database}")
+    print(" ")
+
+"""==========================================================================================================
+Data cache
+============================================================================================================="""
+# Data_load keeps what it gets off the server in Data cache/<dataset>/<YYYY-MM>.parquet, split by month on the
+# dataset's date column so only the months asked for are read. Datasets without a date column are kept in all.parquet.
+# Parquet keeps the column types, if pyarrow isn't installed the same files are saved as csv instead
+Data_cache_folder = "Data cache"
+Data_cache_format = "parquet" if pa != None else "csv"
+
+# the history datasets which are loaded over years are kept as Arrow (feather) files instead. They're saved in the
+# same layout pandas' columns are held in, so reading them is mostly a copy from the OS's file cache on later runs
+# rather than the decoding parquet needs. The rows are copied out rather than used from a memory map, as Windows
+# can't replace or delete a mapped file and other sessions on the shared folder save and evict these partitions.
+# They're compressed with lz4 but still bigger than parquet on disk, so the other datasets are left as parquet
+Data_cache_formats = {"DSP_data": "feather", "BOD_data": "feather", "BOA_data": "feather"}
+
+# the partitions read most recently are also kept in memory, up to Data_cache_memory_MB, so loading the same months
+# again (the current and previous month are read by most sections) doesn't go to the disk. Partitions in a frame
+# Data_load has registered (see Data_registry) aren't kept as they're already in memory. The files on the disk are
+# kept under Data_cache_disk_MB by deleting the partitions that haven't been used for longest, which are gathered
+# again if they're asked for. None for either means no limit, 0 for the memory turns it off
+Data_cache_memory_MB = 2000
+Data_cache_disk_MB = 20000
+Data_cache_memory = OrderedDict() # {partition file: (DataFrame, MB, file's modified time)}, least recently used first
+Data_cache_memory_lock = threading.Lock() # also held to count into Data_cache_stats, which the threads all add to
+Data_cache_stats = {"memory": {"hits": 0, "misses": 0}, "disk": {"hits": 0, "misses": 0, "evicted": 0}}
+
+# the single csv files the data used to be saved in, which are split into the cache the first time they're loaded
+Data_cache_csv_files = {"DSP_data": "All DSP data.csv", "DISBSAD_data": "All DISBSAD data.csv", "BMU_data": "BMU Info.csv",
+                        "Capacity_data": "BMU Capacity data.csv", "EAC_data": "EAC Sell Order data.csv",
+                        "Inertia_data": "Inertia data.csv", "Generation_data": "Generation data.csv",
+                        "STOR_data": "STOR data.csv", "SFFR_data": "SFFR data.csv", "BOD_data": "BOD data.csv",
+                        "NGU_data": "NGU Info.csv", "Demand_data": "Demand data.csv", "MIP_data": "System prices data.csv",
+                        "BOA_data": "BOA data.csv"}
+
+# change a dataset's number when its query changes (columns, joins, filters), the data cached with the older query
+# is then deleted and gathered again as it's asked for
+SQL_query_versions = {"DSP_data": 1, "DISBSAD_data": 1, "BMU_data": 1, "Capacity_data": 1, "EAC_data": 1,
+                      "Inertia_data": 1, "Generation_data": 1, "STOR_data": 1, "SFFR_data": 1, "BOD_data": 1,
+                      "NGU_data": 1, "Demand_data": 1, "MIP_data": 1, "BOA_data": 1}
+
+# when the datasets which change over time are gathered again rather than read from the cache. "max age" is the most
+# days a copy is kept and "watermark" a query returning one value which changes when the source does (new units or
+# capacities), checked when the dataset is loaded once the copy is over "check every" hours old so it's gathered soon
+# after it's changed without asking the server on every run. The policy and the last watermark are kept in the catalog
+Data_cache_freshness = {"BMU_data": {"max age": 5, "check every": 6, "watermark": "SELECT COUNT(*) FROM Meta.tblBMUnit_Managed"},
+                        "NGU_data": {"max age": 5, "check every": 6, "watermark": "SELECT COUNT(*) FROM Meta.tblNGTUnit_Managed"},
+                        "Capacity_data": {"max age": 5, "check every": 6, "watermark": "SELECT MAX(Runtime) FROM PowerSystem.tblBMUnitGCDC"}}
+
+# what's in the cache, so Data_load can tell what's saved without reading it. For each dataset it has the query
+# version, the date ranges gathered off the server ("coverage", [[from, to], ...]) and for each partition the rows,
+# first and last date, a hash of the columns and types and when it was saved
+Data_cache_catalog_file = os.path.join(Data_cache_folder, "catalog.json")
+Data_cache_catalog = None # read from the file the first time it's needed
+Data_cache_catalog_read_from = None # (full path, modified time, size) of the file read, it's read again if either changes
+Data_cache_catalog_lock = threading.Lock() # datasets can be loaded on several threads at once
+
+# several sessions can share the cache folder. A partition is locked with a <partition>.lock file next to it while
+# it's gathered and saved, so a session wanting the same months waits and then reads them rather than gathering them
+# too, and catalog.json.lock is held while the catalog is changed. The lock files are touched every
+# Data_cache_lock_stale/5 seconds while held, one that hasn't been touched for Data_cache_lock_stale seconds was left
+# by a session that stopped and is taken over. Threads in the same session wait on a threading.Lock for each file
+# rather than on the file
+Data_cache_lock_poll = 1 # seconds between checks while waiting for a lock
+Data_cache_publish_tries = 5 # tries at swapping a saved file in (see Cache_publish), waiting twice as long after each
+Data_cache_publish_wait = 0.5 # seconds waited after the first try
+Data_cache_lock_stale = 300
+Data_cache_locks = {} # {lock file: [thread id, times taken]} held by this session
+Data_cache_thread_locks = {} # {lock file: threading.Lock}, held by the thread with the lock file
+Data_cache_locks_lock = threading.Lock()
+Data_cache_lock_owner = f"{getpass.getuser()} on {socket.gethostname()} (process {os.getpid()})"
+
+def Cache_format(data: str) -> str:
+    # "parquet", "feather" or "csv", everything is csv if pyarrow isn't installed or Data_cache_format is set to it
+    if Data_cache_format == "csv":
+        return "csv"
+    return Data_cache_formats.get(data, Data_cache_format)
+
+def Cache_path(data: str, partition: str, file_format: str = None) -> str:
+    file_format = Cache_format(data) if file_format == None else file_format
+    return os.path.join(Data_cache_folder, data, f"{partition}.{file_format}")
+
+def Cache_schema_hash(df) -> str:
+    # changes if the columns or their types do
+    schema = ";".join([f"{i}:{j}" for i, j in df.dtypes.astype(str).items()])
+    return hashlib.md5(schema.encode()).hexdigest()[:12]
+
+def Cache_partition_entry(df, data: str, date_col_name = False) -> dict:
+    # the catalog entry for a partition made of df
+    entry = {"rows": len(df.index), "from": None, "to": None, "schema": Cache_schema_hash(df), 
+             "refreshed": datetime.now().isoformat(timespec = "seconds"), "derived": Data_derived_versions.get(data)}
+    if isinstance(date_col_name, str) and (len(df.index) > 0):
+        dates = pd.to_datetime(df[date_col_name])
+        entry["from"] = dates.min().isoformat()
+        entry["to"] = dates.max().isoformat()
+    return entry
+
+def Cache_intervals_merge(intervals: list) -> list:
+    # sorts [[from, to], ...] date ranges and joins up the ones which overlap or follow on from each other
+    merged = []
+    for i, j in sorted([[pd.Timestamp(i).strftime("%Y-%m-%d"), pd.Timestamp(j).strftime("%Y-%m-%d")] for i, j in intervals]):
+        if (len(merged) > 0) and (pd.Timestamp(i) <= pd.Timestamp(merged[-1][1]) + relativedelta(days = 1)):
+            merged[-1][1] = max(merged[-1][1], j)
+        else:
+            merged.append([i, j])
+    return merged
+
+def Cache_days_covered(dates) -> list:
+    # the date ranges with rows on every day, for data gathered before the coverage was kept, so days missing
+    # in the middle are gathered again
+    days = pd.to_datetime(pd.Series(dates)).dt.normalize().dropna().unique()
+    return Cache_intervals_merge([[i, i] for i in days])
+
+def Cache_catalog_file_state():
+    # (full path, modified time, size) of the catalog file, which change when any session saves it
+    path = os.path.abspath(Data_cache_catalog_file)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return (path, None, None)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+def Cache_catalog_read():
+    # reads the catalog the first time and again whenever another session has saved it (or the folder's changed),
+    # keeping the times partitions were last used by this session. Called with Data_cache_catalog_lock held
+    global Data_cache_catalog, Data_cache_catalog_read_from
+    state = Cache_catalog_file_state()
+    if (Data_cache_catalog != None) and (Data_cache_catalog_read_from == state):
+        return
+    catalog = {}
+    if state[1] != None:
+        try:
+            with open(Data_cache_catalog_file) as f:
+                catalog = json.load(f)
+        except ValueError:
+            print(f"Couldn't read {Data_cache_catalog_file}, it will be rebuilt from the cache")
+            print(" ")
+    if (Data_cache_catalog != None) and (Data_cache_catalog_read_from[0] == state[0]):
+        for data, entry in catalog.items():
+            old = Data_cache_catalog.get(data, {}).get("partitions", {})
+            for i, j in entry["partitions"].items():
+                if "used" in old.get(i, {}):
+                    j["used"] = max(j.get("used", ""), old[i]["used"])
+    Data_cache_catalog = catalog
+    Data_cache_catalog_read_from = state
+
+def Cache_catalog_save():
+    # written to a temp file and swapped in like the partitions, called with Data_cache_catalog_lock and the
+    # catalog's lock file held, after reading any changes other sessions have saved (Cache_catalog_read)
+    global Data_cache_catalog_read_from
+    os.makedirs(Data_cache_folder, exist_ok = True)
+    with open(Cache_temp_path(Data_cache_catalog_file), "w") as f:
+        json.dump(Data_cache_catalog, f, indent = 1)
+    Cache_publish(Cache_temp_path(Data_cache_catalog_file), Data_cache_catalog_file)
+    Data_cache_catalog_read_from = Cache_catalog_file_state()
+
+def Cache_catalog_new(data: str) -> dict:
+    # the catalog entry for a dataset with nothing cached
+    return {"query version": SQL_query_versions.get(data, 1), "format": Cache_format(data), "coverage": [], "partitions": {}}
+
+def Cache_catalog_rebuild(data: str, date_col_name = False) -> dict:
+    # makes a catalog entry from the files in a dataset's folder, for a cache saved before there was a catalog
+    entry = Cache_catalog_new(data)
+    folder = os.path.join(Data_cache_folder, data)
+    if os.path.isdir(folder) == False:
+        return entry
+    for i in sorted([i.rsplit(".", 1)[0] for i in os.listdir(folder) if i.endswith(f".{Cache_format(data)}")]):
+        df = Cache_read_partition(data, i, date_col_name)
+        entry["partitions"][i] = Cache_partition_entry(df, data, date_col_name)
+        entry["partitions"][i]["derived"] = None # not known, so they're worked out again
+        entry["partitions"][i]["bytes"] = os.path.getsize(Cache_path(data, i))
+        if isinstance(date_col_name, str):
+            entry["coverage"] = entry["coverage"] + Cache_days_covered(df[date_col_name])
+    entry["coverage"] = Cache_intervals_merge(entry["coverage"])
+    if len(entry["partitions"]) > 0:
+        print(f"Added {data} to {Data_cache_catalog_file} ({len(entry['partitions'])} partitions)")
+        print(" ")
+    return entry
+
+def Cache_catalog_check(data: str, entry: dict):
+    # what has to be done to a dataset's catalog entry before it can be used, or None
+    if (entry != None) and (entry["query version"] != SQL_query_versions.get(data, 1)):
+        return "query"
+    elif (entry == None) or ((len(entry["partitions"]) > 0) and (os.path.isdir(os.path.join(Data_cache_folder, data)) == False)):
+        return "rebuild" # not in the catalog or the folder's been deleted
+    elif entry.get("format", Data_cache_format) != Cache_format(data):
+        return "format"
+    return None
+
+def Cache_catalog_entry(data: str, date_col_name = False) -> dict:
+    # the dataset's catalog entry, missing datasets are added from their files. Data cached with an older query
+    # version is deleted so it's gathered again
+    with Data_cache_catalog_lock:
+        Cache_catalog_read()
+        entry = Data_cache_catalog.get(data)
+        if Cache_catalog_check(data, entry) == None:
+            return entry
+    
+    with Cache_lock([f"{Data_cache_catalog_file}.lock"]), Data_cache_catalog_lock:
+        Cache_catalog_read() # another session may have done it while this one waited
+        entry = Data_cache_catalog.get(data)
+        check = Cache_catalog_check(data, entry)
+        if check == "query":
+            print(f"{data} was cached with an older query, it will be gathered again")
+            print(" ")
+            Cache_clear_folder(data)
+            for i in entry["partitions"]:
+                Cache_memory_drop(Cache_path(data, i, entry.get("format", Data_cache_format)))
+            entry = Cache_catalog_new(data)
+        elif check == "rebuild":
+            entry = Cache_catalog_rebuild(data, date_col_name)
+        elif check == "format":
+            Cache_convert_format(data, entry, date_col_name)
+        else:
+            return entry
+        Data_cache_catalog[data] = entry
+        Cache_catalog_save()
+        return entry
+
+def Cache_clear_folder(data: str):
+    # deletes the dataset's files but not the lock files, which other sessions may be holding
+    folder = os.path.join(Data_cache_folder, data)
+    for i in (os.listdir(folder) if os.path.isdir(folder) else []):
+        if i.endswith(".lock") == False:
+            try:
+                os.remove(os.path.join(folder, i))
+            except OSError: # being written by another session
+                pass
+
+def Cache_convert_format(data: str, entry: dict, date_col_name = False):
+    # saves the dataset's partitions again in the format it's now kept in (see Data_cache_formats), called with
+    # Data_cache_catalog_lock held
+    file_format = entry.get("format", Data_cache_format) # caches from before the formats were kept are in the default
+    print(f"Saving {data} as {Cache_format(data)} rather than {file_format}...")
+    print(" ")
+    for i in list(entry["partitions"]):
+        df = Cache_read_partition(data, i, date_col_name, file_format)
+        saved = Cache_write_partition(df, data, i, date_col_name)
+        if saved == None: # gathered again when it's next asked for
+            del entry["partitions"][i]
+            entry["coverage"] = Cache_intervals_remove_months(entry["coverage"], [i])
+        else:
+            entry["partitions"][i] = saved
+        try:
+            os.remove(Cache_path(data, i, file_format))
+        except OSError: # in use by another session, it's ignored as it's not in the format kept
+            pass
+    entry["format"] = Cache_format(data)
+
+def Cache_catalog_update(data: str, partitions: dict = {}, coverage: list = [], watermark: str = None, units: dict = {},
+                         synced: str = None):
+    # records partitions ({partition: entry}) that have been saved, date ranges that have been gathered and the
+    # source's watermark when they were gathered, added to what other sessions have saved since it was read. units
+    # is the date ranges gathered for each unit ({BMU ID: [[from, to], ...]}) for datasets gathered by unit (FPN_data)
+    # and synced when the dataset was last synced (see SQL_sync_datasets)
+    Cache_catalog_entry(data)
+    with Cache_lock([f"{Data_cache_catalog_file}.lock"]), Data_cache_catalog_lock:
+        Cache_catalog_read()
+        entry = Data_cache_catalog.setdefault(data, Cache_catalog_new(data))
+        entry["partitions"].update(partitions)
+        entry["coverage"] = Cache_intervals_merge(entry["coverage"] + [list(i) for i in coverage])
+        for i, j in units.items():
+            entry.setdefault("units", {})[i] = Cache_intervals_merge(entry.get("units", {}).get(i, []) + [list(k) for k in j])
+        if data in Data_cache_freshness:
+            entry["freshness"] = Data_cache_freshness[data]
+        if watermark != None:
+            entry["watermark"] = watermark
+        if synced != None:
+            entry["synced"] = synced
+        if len(partitions) > 0:
+            Cache_evict(keep = [(data, i) for i in partitions])
+        Cache_catalog_save()
+
+def Cache_intervals_remove(intervals: list, date_from, date_to) -> list:
+    # takes the dates between date_from and date_to out of [[from, to], ...] date ranges
+    remaining = []
+    for i, j in intervals:
+        if pd.Timestamp(i) < pd.Timestamp(date_from):
+            remaining.append([i, min(pd.Timestamp(j), pd.Timestamp(date_from) - relativedelta(days = 1))])
+        if pd.Timestamp(j) > pd.Timestamp(date_to):
+            remaining.append([max(pd.Timestamp(i), pd.Timestamp(date_to) + relativedelta(days = 1)), j])
+    return Cache_intervals_merge(remaining)
+
+def Cache_intervals_remove_months(intervals: list, partitions: list) -> list:
+    # takes the dates of month partitions out of [[from, to], ...] date ranges, all of them for "all"
+    for i in partitions:
+        if i == "all":
+            return []
+        month = pd.Period(i, freq = "M")
+        intervals = Cache_intervals_remove(intervals, month.start_time, month.end_time.normalize())
+    return intervals
+
+def Cache_evict(keep: list = []):
+    # deletes the partitions used longest ago until the cache is under Data_cache_disk_MB, apart from those in keep
+    # ([(dataset, partition)], the ones just saved) and those locked by other sessions or by this one (which is
+    # gathering them, and would read them back). Their dates are taken out of the coverage so they're gathered again
+    # if they're asked for. Called with Data_cache_catalog_lock held
+    if Data_cache_disk_MB == None:
+        return
+    partitions = []
+    for data, entry in Data_cache_catalog.items():
+        for i, j in entry["partitions"].items():
+            size = j["bytes"] if "bytes" in j else os.path.getsize(Cache_path(data, i, entry.get("format", Data_cache_format)))
+            partitions.append((j.get("used", j["refreshed"]), data, i, size))
+    total = sum([i[3] for i in partitions])
+    for used, data, i, size in sorted(partitions):
+        if total <= Data_cache_disk_MB*1e6:
+            break
+        if (data, i) in keep:
+            continue
+        entry = Data_cache_catalog[data]
+        path = Cache_path(data, i, entry.get("format", Data_cache_format))
+        with Data_cache_locks_lock: # Cache_lock_acquire would let a thread in this session take its own lock again
+            if os.path.abspath(Cache_lock_path(data, i)) in Data_cache_locks:
+                continue
+        if Cache_lock_acquire(Cache_lock_path(data, i), wait = False) == False: # being saved by another session
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError: # in use
+            continue
+        finally:
+            Cache_lock_release(Cache_lock_path(data, i))
+        Cache_memory_drop(path)
+        if i != "all":
+            entry["coverage"] = Cache_intervals_remove_months(entry["coverage"], [i])
+            for j in entry.get("units", {}):
+                entry["units"][j] = Cache_intervals_remove_months(entry["units"][j], [i])
+        del entry["partitions"][i]
+        total -= size
+        with Data_cache_memory_lock:
+            Data_cache_stats["disk"]["evicted"] += 1
+        print(f"Removed {data} {i} from the cache to keep it under {Data_cache_disk_MB} MB")
+
+def Cache_partitions(data: str, date_col_name = False) -> list:
+    # the months (or "all") saved for a dataset
+    return sorted(Cache_catalog_entry(data, date_col_name)["partitions"].keys())
+
+def Cache_gaps(data: str, date_from, date_to) -> list:
+    # the date ranges between date_from and date_to which aren't in the catalog's coverage, [[from, to], ...] in
+    # whole days, so only the missing dates are gathered off the server
+    return Cache_intervals_gaps(Cache_catalog_entry(data)["coverage"], date_from, date_to)
+
+def Cache_intervals_gaps(intervals: list, date_from, date_to) -> list:
+    # the date ranges between date_from and date_to which aren't in [[from, to], ...] date ranges
+    start = pd.Timestamp(date_from).normalize()
+    end = pd.Timestamp(date_to).normalize()
+    gaps = []
+    for i, j in intervals:
+        if (pd.Timestamp(j) < start) or (pd.Timestamp(i) > end):
+            continue
+        if pd.Timestamp(i) > start:
+            gaps.append([start, pd.Timestamp(i) - relativedelta(days = 1)])
+        start = max(start, pd.Timestamp(j) + relativedelta(days = 1))
+    if start <= end:
+        gaps.append([start, end])
+    return [[SQL_date(i), SQL_date(j)] for i, j in gaps]
+
+def Cache_missing(data: str, date_col_name, date_from, date_to) -> list:
+    # the partitions Data_load will have to gather between the dates, which it locks while it does
+    saved = Cache_partitions(data, date_col_name)
+    if date_col_name == False:
+        return [i for i in ["all"] if i not in saved]
+    return sorted(set([k for i, j in Cache_gaps(data, date_from, date_to) for k in Cache_months(i, j)]))
+
+def Cache_watermarks(datasets: list) -> dict:
+    # {dataset: watermark} from the freshness policies, run in one batch. Empty if the server can't be reached
+    datasets = [i for i in datasets if "watermark" in Data_cache_freshness.get(i, {})]
+    if len(datasets) == 0:
+        return {}
+    try:
+        dfs = SQL_read_batch([Data_cache_freshness[i]["watermark"] for i in datasets])
+    except SQL_errors:
+        return {}
+    return {i: str(df.iloc[0, 0]) for i, df in zip(datasets, dfs)}
+
+def Cache_check_due(data: str, refreshed: datetime) -> bool:
+    # True if a copy saved at refreshed is old enough for the source's watermark to be checked (see Data_cache_freshness)
+    policy = Data_cache_freshness.get(data, {})
+    return ("watermark" in policy) and (refreshed < datetime.now() - relativedelta(hours = policy.get("check every", 0)))
+
+def Cache_stale(data: str, refreshed: datetime, watermark: str = None, current: str = None):
+    # why a copy saved at refreshed with the source's watermark then should be gathered again (False if it shouldn't),
+    # current is the watermark now (None if it couldn't be got)
+    policy = Data_cache_freshness.get(data, {})
+    if ("max age" in policy) and (refreshed < datetime.now() - relativedelta(days = policy["max age"])):
+        return f"over {policy['max age']} days old"
+    if (current != None) and (current != watermark):
+        return "changed on the server"
+    return False
+
+def Cache_derived_stale(data: str, partition: str) -> bool:
+    # True if the partition's derived columns were worked out by an older Data_derive
+    return Cache_catalog_entry(data)["partitions"][partition].get("derived") != Data_derived_versions.get(data)
+
+def Cache_rederive(data: str, partition: str, date_col_name = False):
+    # works out a partition's derived columns again and saves it, returning the data
+    with Cache_lock([Cache_lock_path(data, partition)]):
+        df = Cache_read_partition(data, partition, date_col_name)
+        saved = Cache_write_partition(df, data, partition, date_col_name) # adds them to df
+        if saved != None: # otherwise they're worked out again next time
+            Cache_catalog_update(data, {partition: saved})
+    return df
+
+def Cache_extent(data: str, partitions: list):
+    # the first and last dates in the partitions, from the catalog
+    entries = [Cache_catalog_entry(data)["partitions"][i] for i in partitions]
+    dates_from = [pd.Timestamp(i["from"]) for i in entries if i["from"] != None]
+    dates_to = [pd.Timestamp(i["to"]) for i in entries if i["to"] != None]
+    if len(dates_from) == 0:
+        return None, None
+    return min(dates_from), max(dates_to)
+
+def Cache_months(date_from, date_to) -> list:
+    # every YYYY-MM partition name between the dates
+    return [i.strftime("%Y-%m") for i in pd.period_range(pd.Timestamp(date_from), pd.Timestamp(date_to), freq = "M")]
+
+def Cache_read_schema(data: str, partition: str):
+    # the Arrow schema of a parquet or feather partition, without reading the rows
+    if Cache_format(data) == "feather":
+        with pa.OSFile(Cache_path(data, partition)) as source:
+            return pa.ipc.open_file(source).schema
+    return pq.read_schema(Cache_path(data, partition))
+
+def Cache_read_batches(data: str, partition: str):
+    # the record batches of a parquet or feather partition one at a time, so a month that's being added to
+    # (Cache_stream) is never all in memory. The file's closed once they've been read as it's then replaced
+    if Cache_format(data) == "feather":
+        with pa.OSFile(Cache_path(data, partition)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+    else:
+        with pq.ParquetFile(Cache_path(data, partition)) as source:
+            yield from source.iter_batches()
+
+def Cache_read_partition(data: str, partition: str, date_col_name = False, file_format: str = None, path: str = None):
+    # path reads the partition from another file, i.e. a temp file which couldn't be published (Cache_stream)
+    file_format = Cache_format(data) if file_format == None else file_format
+    path = Cache_path(data, partition, file_format) if path == None else path
+    if file_format == "feather":
+        # read into memory rather than mapped, so the file isn't held open by the frame (see Data_cache_formats)
+        with pa.OSFile(path) as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    elif file_format == "parquet":
+        return pd.read_parquet(path)
+    df = pd.read_csv(path)
+    for i in ([date_col_name] if isinstance(date_col_name, str) else []):
+        df[i] = pd.to_datetime(df[i])
+    for i, j in Data_schemas.get(data, {}).items(): # csv saves dates as text
+        if (j == "date") and (i in df.columns):
+            df[i] = pd.to_datetime(df[i]).dt.date
+    return df
+
+def Cache_memory_drop(path: str):
+    # forgets the copy of a partition kept in memory, when the file's been saved again or deleted
+    with Data_cache_memory_lock:
+        Data_cache_memory.pop(os.path.abspath(path), None)
+
+def Cache_read_memory(data: str, partition: str, date_col_name = False):
+    # a partition from memory if it's there, otherwise from the disk (and kept in memory). The frames kept are
+    # handed out as shallow copies so columns set by Data_load aren't set on them
+    path = os.path.abspath(Cache_path(data, partition))
+    modified = os.path.getmtime(path) # the copy in memory isn't used if the file's been saved since (by another session)
+    with Data_cache_memory_lock:
+        if (path in Data_cache_memory) and (Data_cache_memory[path][2] == modified):
+            Data_cache_memory.move_to_end(path)
+            Data_cache_stats["memory"]["hits"] += 1
+            return Data_cache_memory[path][0].copy(deep = False)
+        Data_cache_stats["memory"]["misses"] += 1
+    
+    df = Cache_read_partition(data, partition, date_col_name)
+    with Data_cache_memory_lock:
+        Data_cache_stats["disk"]["hits"] += 1
+    if (Data_cache_memory_MB != 0) and (partition not in Data_registry_partitions(data)):
+        MB = Run_log_size(df)["MB"]
+        with Data_cache_memory_lock:
+            Data_cache_memory[path] = (df, MB, modified)
+            total = sum([i[1] for i in Data_cache_memory.values()])
+            while (Data_cache_memory_MB != None) and (total > Data_cache_memory_MB) and (len(Data_cache_memory) > 1):
+                total -= Data_cache_memory.popitem(last = False)[1][1]
+    return df.copy(deep = False)
+
+def Cache_stats_report():
+    # hit rates of the memory and disk tiers of the cache this run, to size Data_cache_memory_MB and Data_cache_disk_MB
+    with Data_cache_memory_lock:
+        memory_MB = sum([i[1] for i in Data_cache_memory.values()])
+        counted = {i: dict(j) for i, j in Data_cache_stats.items()}
+    stats = {"Memory MB": round(memory_MB, 1), "Memory partitions": len(Data_cache_memory)}
+    for tier, counts in counted.items():
+        total = counts["hits"] + counts["misses"]
+        rate = counts["hits"]/total if total > 0 else None
+        stats[f"{tier.capitalize()} hits"] = counts["hits"]
+        stats[f"{tier.capitalize()} misses"] = counts["misses"]
+        stats[f"{tier.capitalize()} hit rate"] = None if rate == None else round(rate, 3)
+        print(f"{tier.capitalize()} cache: {counts['hits']} hits, {counts['misses']} misses" + ("" if rate == None else f" ({rate:.0%})"))
+    stats["Disk evicted"] = counted["disk"]["evicted"]
+    print(f"{stats['Memory partitions']} partitions ({memory_MB:.0f} MB) in memory, {stats['Disk evicted']} removed from the disk")
+    print(" ")
+    Run_log("Cache stats", stats)
+    return stats
+
+def Cache_temp_path(path: str) -> str:
+    # the temp file a partition is written to before it's published, named for the process and thread so two
+    # writers never write into the same one
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+def Cache_publish(temp_path: str, path: str) -> bool:
+    # swaps a finished temp file in for the partition in one step, so a crash part way through saving leaves the
+    # old partition (or no partition) rather than half a file, and other sessions reading it see the old file or
+    # the new one. Any temp files left over are ignored by the cache. On Windows a file another session has open
+    # can't be replaced, so it's tried again a few times. If it still can't be, the temp file is left, it's put in
+    # the run log and False is returned, the old partition is kept and the new rows are gathered again next time
+    wait = Data_cache_publish_wait
+    for i in range(Data_cache_publish_tries):
+        try:
+            os.replace(temp_path, path)
+            return True
+        except OSError as error:
+            if i == Data_cache_publish_tries - 1:
+                print(f"Couldn't save {os.path.relpath(path)} as it's in use ({error}), it's left in {os.path.relpath(temp_path)}")
+                print(" ")
+                Run_log("Cache_publish", {"File": path, "Temp file": temp_path, "Error": str(error)})
+                return False
+            time.sleep(wait)
+            wait *= 2
+
+def Cache_lock_path(data: str, partition: str) -> str:
+    return os.path.join(Data_cache_folder, data, f"{partition}.lock")
+
+def Cache_lock_heartbeat():
+    # touches the lock files this session holds so other sessions know it's still running
+    while True:
+        time.sleep(Data_cache_lock_stale/5)
+        with Data_cache_locks_lock:
+            paths = list(Data_cache_locks.keys())
+        for i in paths:
+            try:
+                os.utime(i)
+            except OSError: # released since
+                pass
+
+Data_cache_lock_heartbeat = threading.Thread(target = Cache_lock_heartbeat, daemon = True)
+
+def Cache_lock_acquire(path: str, wait: bool = True) -> bool:
+    # takes the lock by creating the file, which fails if it's already there. Waits for it if wait is True,
+    # otherwise returns False if another session or thread has it. A thread can take a lock it holds again
+    path = os.path.abspath(path)
+    with Data_cache_locks_lock:
+        if (path in Data_cache_locks) and (Data_cache_locks[path][0] == threading.get_ident()):
+            Data_cache_locks[path][1] += 1
+            return True
+        thread_lock = Data_cache_thread_locks.setdefault(path, threading.Lock())
+    if thread_lock.acquire(blocking = wait) == False: # another thread in this session has it
+        return False
+    try:
+        taken = Cache_lock_file(path, wait)
+    except BaseException:
+        thread_lock.release()
+        raise
+    if taken == False:
+        thread_lock.release()
+        return False
+    with Data_cache_locks_lock:
+        Data_cache_locks[path] = [threading.get_ident(), 1]
+        if Data_cache_lock_heartbeat.is_alive() == False:
+            Data_cache_lock_heartbeat.start()
+    return True
+
+def Cache_lock_file(path: str, wait: bool) -> bool:
+    # creates the lock file for Cache_lock_acquire, once no other session has it
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    seen = None # (the lock file's modified time, when it was first seen with it), timed on this machine's clock
+                # as the shared folder's can be different
+    while True:
+        try:
+            handle = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            pass
+        if wait == False:
+            return False
+        try:
+            modified = os.path.getmtime(path)
+            if seen == None:
+                with open(path) as f:
+                    print(f"Waiting for {f.read()} to finish with {os.path.relpath(path)}...")
+                    print(" ")
+            if (seen == None) or (seen[0] != modified):
+                seen = (modified, time.time())
+            elif time.time() - seen[1] > Data_cache_lock_stale:
+                # moved out of the way rather than deleted, so if several sessions take it over at once only one
+                # moves it. If the file moved isn't the one seen (another session took it over and made its own
+                # in between) it's put back
+                stale_path = Cache_temp_path(path)
+                os.rename(path, stale_path)
+                if os.path.getmtime(stale_path) != seen[0]:
+                    try:
+                        os.link(stale_path, path) # fails rather than replacing a lock made since
+                    except OSError: # one was made since, or the folder doesn't take links
+                        pass
+                else:
+                    print(f"{os.path.relpath(path)} hasn't been touched for {Data_cache_lock_stale} seconds, taking it over")
+                    print(" ")
+                os.remove(stale_path)
+                seen = None
+                continue
+        except FileNotFoundError: # released or taken over in between
+            continue
+        time.sleep(Data_cache_lock_poll)
+    with os.fdopen(handle, "w") as f:
+        f.write(Data_cache_lock_owner)
+    return True
+
+def Cache_lock_release(path: str):
+    path = os.path.abspath(path)
+    with Data_cache_locks_lock:
+        Data_cache_locks[path][1] -= 1
+        if Data_cache_locks[path][1] > 0:
+            return
+        del Data_cache_locks[path]
+    try:
+        os.remove(path)
+    except FileNotFoundError: # the dataset's folder was deleted
+        pass
+    Data_cache_thread_locks[path].release()
+
+@contextmanager
+def Cache_lock(paths: list):
+    # holds the lock files in paths, taken in order so two sessions can't each hold one the other's waiting for
+    held = []
+    try:
+        for i in sorted(set(paths)):
+            Cache_lock_acquire(i)
+            held.append(i)
+        yield
+    finally:
+        for i in reversed(held):
+            Cache_lock_release(i)
+
+def Cache_write_partition(df, data: str, partition: str, date_col_name = False) -> dict:
+    # returns the partition's catalog entry, or None if it couldn't be swapped in (see Cache_publish)
+    df = Data_derive(df, data)
+    path = Cache_path(data, partition)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    if Cache_format(data) == "feather":
+        df.to_feather(Cache_temp_path(path), compression = "lz4")
+    elif Cache_format(data) == "parquet":
+        df.to_parquet(Cache_temp_path(path), index = False)
+    else:
+        df.to_csv(Cache_temp_path(path), index = False)
+    if Cache_publish(Cache_temp_path(path), path) == False:
+        return None
+    Cache_memory_drop(path)
+    return {**Cache_partition_entry(df, data, date_col_name), "bytes": os.path.getsize(path)}
+
+def Cache_frame_months(df, date_col_name: str) -> list:
+    # the partitions the rows of df fall in
+    if (date_col_name == False) or (len(df.index) == 0):
+        return []
+    return sorted(pd.to_datetime(df[date_col_name]).dt.strftime("%Y-%m").unique().tolist())
 
-date_from: str = "2024-11-01" # date to begin analysis
-date_to: str = "2024-11-30" # date to end analysis
+def Cache_write(df, data: str, date_col_name = False, months: list = None, coverage: list = [], watermark: str = None):
+    # saves the data over the partitions it covers, each month in df replaces the one in the cache. If months is
+    # given only those are saved, so adding a month doesn't rewrite the ones already there. coverage is the date
+    # ranges df was gathered for and watermark the source's (see Data_cache_freshness), which go in the catalog.
+    # Returns the partitions that couldn't be swapped in (see Cache_publish)
+    partitions = {}
+    if date_col_name == False:
+        partitions["all"] = Cache_write_partition(df, data, "all")
+    else:
+        df_months = pd.to_datetime(df[date_col_name]).dt.strftime("%Y-%m")
+        for month, df_month in df.groupby(df_months, sort = True):
+            if (months == None) or (month in months):
+                partitions[month] = Cache_write_partition(df_month.reset_index(drop = True), data, month, date_col_name)
+    failed = [i for i, j in partitions.items() if j == None] # their dates aren't marked as gathered
+    partitions = {i: j for i, j in partitions.items() if j != None}
+    Cache_catalog_update(data, partitions, Cache_intervals_remove_months(coverage, failed), watermark)
+    return failed
 
-# set these to True if you want the analysis to be done
+def Cache_convert_csv(data: str, date_col_name = False):
+    # splits the old single csv file for the dataset into the cache, the csv file is left where it is
+    csv_file_name = Data_cache_csv_files.get(data)
+    if (csv_file_name == None) or (os.path.isfile(csv_file_name) == False) or (len(Cache_partitions(data, date_col_name)) > 0):
+        return
+    print(f"Moving {csv_file_name} into {os.path.join(Data_cache_folder, data)}...")
+    print(" ")
+    df = pd.read_csv(csv_file_name)
+    for i, j in Data_schemas.get(data, {}).items(): # parquet can't save a column of dates as strings mixed with datetimes
+        if (j == "datetime") and (i in df.columns):
+            df[i] = pd.to_datetime(df[i])
+    coverage = []
+    if isinstance(date_col_name, str) and (len(df.index) > 0):
+        df[date_col_name] = pd.to_datetime(df[date_col_name])
+        coverage = Cache_days_covered(df[date_col_name])
+    Cache_write(df, data, date_col_name, coverage = coverage)
 
-Market_fundementals: bool = False # generation, inertia, MIP, forecast wind/solar data
-BM: bool = True
-EAC: bool = False
-STOR: bool = False
-SFFR: bool = False
-kW_revenue = False
+def Cache_read(data: str, date_col_name = False, date_from = False, date_to = False):
+    # reads the partitions overlapping the dates, returns None if none of them are in the cache
+    Cache_convert_csv(data, date_col_name)
+    saved = Cache_partitions(data, date_col_name)
+    if date_col_name == False:
+        partitions = [i for i in saved if i == "all"]
+    else:
+        partitions = [i for i in Cache_months(date_from, date_to) if i in saved]
+    # months that aren't on the disk, the ones that are count as hits when they're read (if they're not in memory)
+    with Data_cache_memory_lock:
+        Data_cache_stats["disk"]["misses"] += (1 if date_col_name == False else len(Cache_months(date_from, date_to))) - len(partitions)
+    if len(partitions) == 0:
+        return None
+    print(f"Loading {data} from {os.path.join(Data_cache_folder, data)} ({', '.join(partitions)})...")
+    stale = [i for i in partitions if Cache_derived_stale(data, i)]
+    if len(stale) > 0:
+        print(f"Working out the derived columns of {data} again ({', '.join(stale)})...")
+        print(" ")
+    dfs = [Cache_rederive(data, i, date_col_name) if i in stale else Cache_read_memory(data, i, date_col_name) for i in partitions]
+    entries = Cache_catalog_entry(data)["partitions"]
+    with Data_cache_catalog_lock: # saved with the catalog next time it's written, for Cache_evict
+        for i in partitions:
+            entries[i]["used"] = datetime.now().isoformat(timespec = "seconds")
+    return pd.concat(dfs).reset_index(drop = True) if len(dfs) > 1 else dfs[0]
 
-# Set Load = True if you want the data to be exported to the above Excel file
-Load = False
+class Cache_stream:
+    # writes chunks into the month partitions as they come off the server, without holding them all in memory.
+    # Each month is written to a temp file and only swapped in by close, so if the query fails part way through
+    # (abort) the cache is left as it was. Months already in the cache have their rows copied in first, as a
+    # parquet file can't be added to, so only the months the new rows fall in are rewritten
+    def __init__(self, data: str, date_col_name: str):
+        self.data = data
+        self.date_col_name = date_col_name
+        self.writers = {} # {month: pq.ParquetWriter or pa.ipc.RecordBatchFileWriter}
+        self.schemas = {} # {month: pa.Schema}
+        self.columns = {} # {month: columns}, lines chunks up with the columns already saved
+        self.entries = {} # {month: catalog entry}, added to as the rows are written
+        self.saved = Cache_partitions(data, date_col_name)
+        self.rows = 0
+        self.failed = {} # {month: temp file}, months close couldn't publish, their rows are only in the temp file
+    
+    def open(self, month: str, chunk):
+        path = Cache_path(self.data, month)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        if (month in self.saved) and Cache_derived_stale(self.data, month):
+            Cache_rederive(self.data, month, self.date_col_name) # so the rows already saved have the same columns
+        if month in self.saved:
+            self.entries[month] = dict(Cache_catalog_entry(self.data)["partitions"][month])
+        else:
+            self.entries[month] = {"rows": 0, "from": None, "to": None}
+        self.entries[month]["schema"] = Cache_schema_hash(chunk)
+        self.entries[month]["derived"] = Data_derived_versions.get(self.data)
+        
+        if Cache_format(self.data) in ["parquet", "feather"]:
+            self.columns[month] = Cache_read_schema(self.data, month).names if month in self.saved else chunk.columns.tolist()
+            schema = pa.Schema.from_pandas(chunk.reindex(columns = self.columns[month]), preserve_index = False)
+            # a column that's all blank in the first chunk would be typed as null, which nothing else can go into
+            schema = pa.schema([pa.field(i.name, pa.string()) if pa.types.is_null(i.type) else i for i in schema])
+            self.schemas[month] = schema
+            if Cache_format(self.data) == "feather":
+                self.writers[month] = pa.ipc.new_file(Cache_temp_path(path), schema, options = pa.ipc.IpcWriteOptions(compression = "lz4"))
+            else:
+                self.writers[month] = pq.ParquetWriter(Cache_temp_path(path), schema)
+            if month in self.saved:
+                for batch in Cache_read_batches(self.data, month):
+                    self.writers[month].write_batch(batch.cast(schema))
+        elif month in self.saved:
+            shutil.copyfile(path, Cache_temp_path(path))
+            self.columns[month] = pd.read_csv(path, nrows = 0).columns.tolist()
+        else:
+            self.columns[month] = chunk.columns.tolist()
+            chunk.iloc[:0].to_csv(Cache_temp_path(path), index = False) # header
+    
+    def write(self, chunk):
+        chunk = Data_derive(chunk, self.data)
+        months = pd.to_datetime(chunk[self.date_col_name]).dt.strftime("%Y-%m")
+        for month, df_month in chunk.groupby(months, sort = True):
+            if month not in self.columns:
+                self.open(month, df_month)
+            df_month = df_month.reindex(columns = self.columns[month])
+            if month in self.writers:
+                self.writers[month].write_table(pa.Table.from_pandas(df_month, schema = self.schemas[month], preserve_index = False))
+            else:
+                df_month.to_csv(Cache_temp_path(Cache_path(self.data, month)), mode = "a", header = False, index = False)
+            self.rows += len(df_month.index)
+            
+            dates = pd.to_datetime(df_month[self.date_col_name])
+            entry = self.entries[month]
+            entry["rows"] += len(df_month.index)
+            entry["from"] = min([i for i in [entry["from"], dates.min().isoformat()] if i != None])
+            entry["to"] = max([i for i in [entry["to"], dates.max().isoformat()] if i != None])
+    
+    def close(self, coverage: list = []):
+        # coverage is the date ranges that were streamed, for the catalog
+        for writer in self.writers.values():
+            writer.close()
+        for month in self.columns:
+            if Cache_publish(Cache_temp_path(Cache_path(self.data, month)), Cache_path(self.data, month)) == False:
+                # the saved partition is kept and the month's dates aren't marked as gathered
+                self.failed[month] = Cache_temp_path(Cache_path(self.data, month))
+                del self.entries[month]
+                continue
+            Cache_memory_drop(Cache_path(self.data, month))
+            self.entries[month]["refreshed"] = datetime.now().isoformat(timespec = "seconds")
+            self.entries[month]["bytes"] = os.path.getsize(Cache_path(self.data, month))
+        Cache_catalog_update(self.data, self.entries, Cache_intervals_remove_months(coverage, list(self.failed)))
+        self.writers = {}
+        self.schemas = {}
+        self.columns = {}
+        self.entries = {}
+    
+    def abort(self):
+        for writer in self.writers.values():
+            writer.close()
+        for month in self.columns:
+            os.remove(Cache_temp_path(Cache_path(self.data, month)))
+        self.writers = {}
+        self.schemas = {}
+        self.columns = {}
+        self.entries = {}
 
+# frames Data_load has already loaded this run, so a later load of the same dataset with the same lookups is
+# sliced from one covering its dates rather than read off the disk or the server again.
+# {(dataset, BMU ID, lookups): [{"from", "to", "date column", "df", "lookups"}]}. Clear it to load everything again
+Data_registry = {}
+Data_registry_lock = threading.Lock() # datasets can be loaded on several threads at once
 
-"""==========================================================================================================
-Don't change anything from here downwards
-============================================================================================================="""
+def Data_registry_key(data: str, BMU_ID, lookups: dict) -> tuple:
+    # the lookup dicts are told apart by id, they're kept in the registry with the frame so the ids aren't reused
+    return (data, str(BMU_ID), tuple([(i, id(j)) for i, j in lookups.items() if isinstance(j, dict)]))
 
-pd.set_option('display.max_columns', None)
-pd.set_option('display.max_rows', None)
-pd.reset_option('display.max_rows')
+def Data_registry_get(key: tuple, date_from, date_to):
+    # the rows of a registered frame in the months between the dates (which is what Data_load gives from the
+    # cache), or None if none of them cover the dates
+    with Data_registry_lock:
+        entries = list(Data_registry.get(key, []))
+    for i in entries:
+        if i["date column"] == False:
+            return i["df"].copy(deep = False)
+        if (pd.Timestamp(i["from"]) <= pd.Timestamp(date_from)) and (pd.Timestamp(date_to) <= pd.Timestamp(i["to"])):
+            month_from = pd.Timestamp(date_from).to_period("M").start_time
+            month_to = pd.Timestamp(date_to).to_period("M").end_time
+            df = i["df"]
+            return df[(df[i["date column"]] >= month_from) & (df[i["date column"]] <= month_to)].reset_index(drop = True)
+    return None
 
-start_time = datetime.now()
+def Data_registry_add(key: tuple, date_from, date_to, date_col_name, df, lookups: dict):
+    with Data_registry_lock:
+        Data_registry.setdefault(key, []).append({"from": date_from, "to": date_to, "date column": date_col_name, 
+                                                  "df": df, "lookups": lookups})
+    for i in Data_registry_partitions(key[0]): # the registered frame has these rows, so they aren't kept twice
+        Cache_memory_drop(Cache_path(key[0], i))
+
+def Data_registry_partitions(data: str) -> set:
+    # the cache partitions of the dataset whose rows are all in a registered frame (those loaded for one BMU aren't)
+    with Data_registry_lock:
+        entries = [j for i, k in Data_registry.items() if (i[0] == data) and (i[1] == str(False)) for j in k]
+    partitions = set()
+    for i in entries:
+        if i["date column"] == False:
+            partitions.add("all")
+        else:
+            partitions.update(Cache_months(i["from"], i["to"]))
+    return partitions
 
 # get data off the server
 def Data_load(data: str, date_from: str = False, date_to: str = False, BMUID_NGUID_dict = False, 
               NGUID_BMUID_dict = False, BMUID_fuel_type_dict = False, NGUID_fuel_type_dict = False, 
               BMU_company_dict = False, NGU_company_dict = False, BMU_ID: str = False):
     
+    # what happened for the run log, Cache is "miss" (all off the server), "hit" (all from the cache), "partial"
+    # (cache topped up from the server), "synced" (cached rows restated on the server replaced), "refresh" (cache out
+    # of date so reloaded), "registry" (sliced from a frame already loaded, see Data_registry) or "none" (not cached
+    # by Data_load)
+    t_start = time.time()
+    load_log = {"Cache": "none", "Load seconds": None}
+    export_months = [] # the cache partitions with new or restated rows, only these are saved
+    export_coverage = [] # the date ranges gathered off the server, for the cache catalog
+    export_watermark = [None] # the source's watermark, for datasets with a freshness policy
+    held = ExitStack() # the cache partitions locked while they're gathered, released once they're saved
+    
     """=======================================================================================================
     SQL Loading
     =========================================================================================================="""
     
-    class SQL_query: # creates SQL query class
-    
-        server = "tcp:mssql-01.citg.one"
-        database = "CI_DL1"
-        connection_string = "DRIVER={SQL Server};SERVER="+server+";DATABASE="+database+";Trusted_Connection=yes"
-        connection = pyodbc.connect(connection_string)
-        cursor = connection.cursor 
-    
-        def __init__(self):
-            print("Init")
-            
-        
-        def MIP_data(date_from: str, date_to: str, connection = connection):
-            query_string = f"""
-            SELECT SettlementDate, HHPeriod, Value, Description
-            
-            FROM PowerSystem.tblSystemPrice as Price
+    def gathered(date_from, date_to, last_date) -> list:
+        # the date range the server was asked for, for the catalog's coverage. Rows can still be published for the
+        # last day it had (last_date) and after it, so that's left out unless it's before the last two days, which
+        # are all the server won't get more rows for (restated rows are synced, see SQL_sync_datasets). So a range
+        # with no rows before then isn't asked for again, and nothing is marked if only recent days were asked for
+        covered_to = pd.Timestamp.now().normalize() - relativedelta(days = 2)
+        if (last_date is not None) and (pd.isna(last_date) == False):
+            covered_to = max(covered_to, pd.Timestamp(last_date).normalize() - relativedelta(days = 1))
+        covered_to = min(pd.Timestamp(date_to), covered_to)
+        if covered_to < pd.Timestamp(date_from):
+            return []
+        return [[pd.Timestamp(date_from), covered_to]]
     
-            INNER JOIN Meta.tblDataDescription as DD on DD.DataDescriptionID = Price.DataDescriptionID
-            
-            WHERE SettlementDate >= '{date_from}' AND SettlementDate <= '{date_to}'
-            """
-            df = pd.read_sql_query(query_string, connection)
-            
-            column_renames = {"SettlementDate": "Date", "HHPeriod": "SP", "Value": "Price"}
-            df = df.rename(columns = column_renames)
-            df = df.sort_values(by = ["Date", "SP"]).reset_index(drop = True)
-            
-            return df
-            
-        def BMU_data(connection = connection):
-            query_string = f"""
-            SELECT Elexon_BMUnitID, NGC_BMUnitID, PartyName, GSPGroup, ReportName, BMU.FuelTypeID
-            
-            FROM Meta.tblBMUnit_Managed as BMU
+    def fetch(date_from, date_to):
+        # gets the data off the SQL server, split into months gathered in parallel for the partitioned datasets
+        if data in SQL_partitioned_datasets:
+            return pd.concat(list(SQL_read_partitioned(getattr(SQL_query, data), date_from, date_to))).reset_index(drop = True)
+        elif data in SQL_reference_queries: # not gathered by date, Capacity_data is its whole history
+            return getattr(SQL_query, data)()
+        else:
+            return getattr(SQL_query, data)(date_from, date_to)
     
-            INNER JOIN Meta.tblFuelType as ft ON ft.FuelTypeID = BMU.FuelTypeID
-            """
-            print("Gathering asset information data from SQL server...")
-            print(" ")
-            df = pd.read_sql_query(query_string, connection)
-            
-            column_renames = {"Elexon_BMUnitID": "BMU ID", "NGC_BMUnitID": "NGU ID", "PartyName": "Company",
-                              "GSPGroup": "GSP Group", "ReportName": "Fuel type", "FuelTypeID": "Fuel type ID"}
-            df = df.rename(columns = column_renames)
-            
-            return df
-        
-        def NGU_data(connection = connection):
-            query_string = """
-            SELECT NGESO_NGTUnitID, CompanyName, [BM/NBM], ReportName 
-            
-            FROM Meta.tblNGTUnit_Managed as NGU
-            
-            LEFT JOIN Meta.tblFuelType as ft on ft.FuelTypeID = NGU.FuelTypeID
-            """
-            print("Gathering asset information data from SQL server...")
-            print(" ")
-            df = pd.read_sql_query(query_string, connection)
-            column_renames = {"NGESO_NGTUnitID": "NGU ID", "CompanyName": "Company",
-                              "ReportName": "Fuel type", "BM/NBM": "BM/NBM"}
-            df = df.rename(columns = column_renames)
-            df = df.sort_values(by = "NGU ID").reset_index(drop = True)
+    def fetch_days(date_from, date_to, date_col_name):
+        # the rows dated date_from to date_to. The "Start time" datasets are queried on when the rows end (EAC_data)
+        # or up to the start of date_to, so they're asked for two days more to get the blocks starting late on
+        # date_to (the EFA block from 23:00 ends the next day) and the rows starting after date_to are dropped
+        if date_col_name != "Start time":
+            return fetch(date_from, date_to)
+        df = fetch(date_from, SQL_date(pd.Timestamp(date_to) + relativedelta(days = 2)))
+        if len(df.index) == 0:
             return df
-            
-        def Capacity_data(connection = connection):
-            query_string = f"""
-            SELECT *
+        return df[pd.to_datetime(df[date_col_name]) < pd.Timestamp(date_to) + relativedelta(days = 1)].reset_index(drop = True)
     
-            FROM PowerSystem.tblBMUnitGCDC as Capacity
+    def stream(date_from, date_to, date_col_name, last_date = None):
+        # writes the SQL data into the cache a chunk at a time, so the whole query is never held in memory
+        if data in SQL_partitioned_datasets:
+            chunks = SQL_read_partitioned(getattr(SQL_query, data), date_from, date_to) # a month at a time
+        else:
+            chunks = getattr(SQL_query, data)(date_from, date_to, chunksize = SQL_chunksize)
+        
+        writer = Cache_stream(data, date_col_name)
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        # last_date is the last one already cached, gaps before it are all covered even if they had no rows
+        last_date = max([pd.Timestamp(i["to"]) for i in writer.entries.values()] + ([last_date] if last_date != None else []), default = None)
+        writer.close(coverage = gathered(date_from, date_to, last_date))
+        print(f"Streamed {writer.rows} rows into {os.path.join(Data_cache_folder, data)}")
+        print(" ")
+        # the months which couldn't be published are read from their temp files (left for the next run to gather)
+        return {i: Cache_read_partition(data, i, date_col_name, path = j) for i, j in writer.failed.items()}
     
-            INNER JOIN Meta.tblBMUnit_Managed as BMU on BMU.BMUnitID = Capacity.BMUnitID
-            
-            """
-            print("Gathering BMU capacity data from SQL server...")
-            print(" ")
-            
-            df = pd.read_sql_query(query_string, connection)
-            
-            
-            # don't use Company as a column in here, as it doesn't come from the BMUManaged table
-            column_renames = {"Elexon_BMUnitID": "BMU ID", "Runtime": "Date", "GC": "GC",
-                              "DC": "DC", "NGC_BMUnitID": "NGU ID"}
-            df = df.rename(columns = column_renames)
-            df = df[column_renames.values()]
+    def unpublished(df, unsaved, date_col_name):
+        # the rows read back from the cache after streaming, with the months that couldn't be published swapped
+        # for the rows streamed into their temp files
+        if len(unsaved) == 0:
             return df
-        
-        def BOD_data(date_from: str, date_to: str, connection = connection):
-            date_to = datetime.strftime(datetime.strptime(date_to, "%Y-%m-%d") + relativedelta(days = 1), "%Y-%m-%d")
-            query_string = f"""SELECT *
-            FROM [PowerSystem].[tblBidOfferData] as BOD
-            
-            INNER JOIN [Meta].[tblBMUnit_Managed] as BMU
-            ON BMU.BMUnitID = BOD.BMUnitID
-    
-            INNER JOIN [Meta].[tblFuelType] as ft
-            ON BMU.FuelTypeID = ft.FuelTypeID
+        dfs = list(unsaved.values())
+        if df is not None:
+            dfs = [df[~pd.to_datetime(df[date_col_name]).dt.strftime("%Y-%m").isin(unsaved)]] + dfs
+        return pd.concat(dfs).sort_values(by = date_col_name, kind = "stable").reset_index(drop = True)
     
-            WHERE
-            [TimeFromUTC] >= '{date_from}' and [TimeToUTC] <= '{date_to}'
-            """
-    
-            print("Gathering submitted bid/offer data from SQL server...")
-            print(" ")
-            df = pd.read_sql_query(query_string, connection)
-            #print("hello")
-            
-            column_renames = {"SettlementDate": "Date", "HHPeriod": "SP","TimeFromUTC": "Time from",
-                              "TimeToUTC": "Time to", "Elexon_BMUnitID": "BMU ID", "NGC_BMUnitID": "NGU ID",
-                              "ReportName": "Fuel type", "PartyName": "Company","LevelFrom": "MW from", 
-                              "LevelTo": "MW to", "PairId": "Pair ID", "Bid": "Bid price", "Offer": "Offer price"}
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            df = df.sort_values(by = "Time from").reset_index(drop = True)
-            
-            return df
-        
-        def BOA_data(date_from: str, date_to: str, connection = connection):
-            pass
-        
-        
-        def DSP_data(date_from: str, date_to: str, connection = connection):
-            
-            query_string = f"""SELECT *
-            FROM PowerSystem.tblDetailedSystemPrices as DSP
-            
-            WHERE SettlementDate >= '{date_from}' AND SettlementDate <= '{date_to}'
-            
-            """
-            
-            print("Gathering submitted Detailed System Prices data from SQL server...")
-            print(" ")
-            df = pd.read_sql_query(query_string, connection)
-            column_renames = {"SettlementDate": "Date", "HHPeriod": "SP", "ID": "BMU ID", "BidOfferPairId": "Pair ID",
-                              "CadlFlag": "CADL Flag", "SoFlag": "SO Flag", "StorFlag": "STOR Flag", 
-                              "Price": "Price (£/MWh)", "Volume": "Volume (MWh)"}
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            df["Date"] = pd.to_datetime(df["Date"])
-            df = df.sort_values(by = ["Date", "SP"]).reset_index(drop = True)
-            
-            return df
-        
-        def DISBSAD_data(date_from: str, date_to: str, connection = connection):
-            query_string = f"""SELECT *
-            FROM PowerSystem.tblBalancingServicesAdjustment
-            
-            WHERE SettlementDate >= '{date_from}' AND SettlementDate <= '{date_to}'
-            
-            """
-            
-            print("Gathering DISBSAD data from SQL server...")
-            print(" ")
-            df = pd.read_sql_query(query_string, connection)
-            
-            column_renames = {"SettlementDate": "Date", "HHPeriod": "SP", "ID": "ID", "Elexon_AssetID": "NGU ID",
-                              "SoFlag": "SO Flag", "BsaaSTORProviderFlag": "STOR Flag", "Elexon_PartyID": "Company ID",
-                              "Price": "Price (£/MWh)", "Volume": "Volume (MWh)", "Cost": "Cost (£)", "TenderedStatus": "Tendered Status", 
-                              "ServiceType": "Service type", "StartTime": "Start time"}
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            df["Date"] == pd.to_datetime(df["Date"])
-            df = df.sort_values(by = ["Date", "SP"]).reset_index(drop = True)
-            
-            return df
-            
-        
-        def EAC_data(date_from: str, date_to: str, connection = connection):
-            query_string = f"""SELECT Unit_NGESOID, BasketID, ServiceType, DeliveryStartDate, DeliveryEndDate, OrderType, AuctionProduct, Volume, 
-            PriceLimit, LoopedBasketID, ExecutedVolume, ClearingPrice, NGU.CompanyName
-            
-            FROM PowerSystem.tblEACAuctionResultsSell as EAC
-            
-            INNER JOIN Meta.tblNGTUnit_Managed as NGU on NGU.NGESO_NGTUnitID = EAC.Unit_NGESOID
-            
-            WHERE DeliveryStartDate >= '{date_from}' AND DeliveryEndDate <= '{date_to}'"""
-            
-            print("Gathering EAC data from SQL server...")
-            print(" ")
-            df = pd.read_sql_query(query_string, connection)
-            column_renames = {"Unit_NGESOID": "NGU ID", "BasketID": "Basket ID", "ServiceType": "Service type",
-                              "DeliveryStartDate": "Start time", "DeliveryEndDate": "End time", "OrderType": "Order type",
-                              "AuctionProduct": "Service", "Volume": "Volume (MW)", "PriceLimit": "Submitted price (£/MW/hr)",
-                              "LoopedBasketID": "Looped Basket ID", "ExecutedVolume": "Executed Volume (MW)",
-                              "ClearingPrice": "Clearing price (£/MW/hr)", "CompanyName": "Company"}
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            return df
-        
-        def STOR_data(date_from: str, date_to: str, connection = connection):
-            date_to = datetime.strftime(datetime.strptime(date_to, "%Y-%m-%d") + relativedelta(days = 1), "%Y-%m-%d")
-            query_string = f"""SELECT
-
-            ServiceDeliveryFromDate, ServiceDeliveryToDate, Unit_NGESOID, NGU.CompanyName, NGU.[BM/NBM], FuelType, TenderedMW, ContractedMW,
-            TenderedAvailabilityPrice, MarketClearingPrice, Status
-            
-            FROM PowerSystem.tblSTORDayAheadAuctionResults as STOR
-            
-            INNER JOIN Meta.tblNGTUnit_Managed as NGU on NGU.NGTUnitID = STOR.NGTUnitID
-            
-            WHERE ServiceDeliveryFromDate >= '{date_from}' and ServiceDeliveryFromDate <= '{date_to}' """
-            print("Gathering STOR data from the SQL server...")
-            print()
-            column_renames = {"ServiceDeliveryFromDate": "Start time", "ServiceDeliveryToDate": "End time", 
-                              "Unit_NGESOID": "NGU ID", "CompanyName": "Company", "BM/NBM": "BM/NBM", 
-                              "FuelType": "Fuel type", "TenderedMW": "Submitted MW", "ContractedMW": "Accepted MW",
-                              "TenderedAvailabilityPrice": "Availability price", "MarketClearingPrice": "Clearing price",
-                              "Status": "Status"}
-            df = pd.read_sql_query(query_string, connection)
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            df = df.sort_values(by = "Start time").reset_index(drop = True)
-            return df
-            
-        
-        def SFFR_data(date_from: str, date_to: str, connection = connection):
-            
-            # adds on one day to get all the data
-            date_to = datetime.strftime(datetime.strptime(date_to, "%Y-%m-%d") + relativedelta(days = 1), "%Y-%m-%d")
-            
-            query_string = f"""SELECT DeliveryStart, Status, NGESO_NGTUnitID, NGU.CompanyName, 
-            TechnologyType, EFA, [Volume(MW)], [AcceptedVolume(MW)], [Price(£/MWh)], [ClearingPrice(£/MWh)]
-            
-            FROM PowerSystem.tblFFRStaticAuctionResults as SFFR
-            
-            INNER JOIN Meta.tblNGTUnit_Managed as NGU on NGU.NGTUnitID = SFFR.NGTUnitID
-
-            WHERE DeliveryStart >= '{date_from}' and DeliveryStart <= '{date_to}'
-            
-            """
-            print("Gathering SFFR data from SQL server...")
-            print()
-            column_renames = {"DeliveryStart": "Start time", "NGESO_NGTUnitID": "NGU ID", "CompanyName": "Company",
-                              "TechnologyType": "Fuel type", "EFA": "EFA", "Volume(MW)": "Submitted MW",
-                              "AcceptedVolume(MW)": "Accepted MW", "Price(£/MWh)": "Submitted price (£/MW/hr)",
-                              "ClearingPrice(£/MWh)": "Clearing price", "Status": "Status"}
-            df = pd.read_sql_query(query_string, connection)
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            df = df.sort_values(by = "Start time").reset_index(drop = True)
-            return df
-        
-        def Inertia_data(date_from: str, date_to: str, connection = connection):
-            query_string = f"""SELECT *
-            
-            FROM PowerSystem.tblSystemInertia
-            
-            WHERE SettlementDate >= '{date_from}' AND SettlementDate <= '{date_to}'
-
-            ORDER BY SettlementDate, HHPeriod"""
-            
-            df = pd.read_sql_query(query_string, connection)
-            column_renames = {"SettlementDate": "Date", "HHPeriod": "SP", "OutturnInertia": "Outturn Inertia",
-                              "MarketProvidedInertia": "Market Provided Inertia"}
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            return df
-        
-        def Generation_data(date_from: str, date_to: str, connection = connection):
-            query_string = f"""SELECT * 
-            
-            FROM PowerSystem.tblGenerationByFuel as gen
-
-            INNER JOIN Meta.tblFuelType as Fuel on Fuel.FuelTypeID = gen.FuelTypeID
-            
-            WHERE SettlementDate >= '{date_from}' and SettlementDate <= '{date_to}'
-            
-            ORDER BY SettlementDate, HHPeriod"""
-            
-            print("Gathering gen mix data from the SQL server...")
+    def sync(df, date_col_name, min_pre_loaded_date, max_pre_loaded_date):
+        # gets the rows published or restated since the newest one in the cache, for the dates read from it, and
+        # swaps them in by their natural key. Dates outside the cache are left to the top ups below
+        synced = Cache_catalog_entry(data).get("synced")
+        if (synced != None) and (datetime.now() - datetime.fromisoformat(synced) < timedelta(minutes = SQL_sync_every)):
+            return df, 0
+        if SQL_sync_watermark(data) == None:
+            return df, 0
+        watermark = "Last updated"
+        if watermark not in df.columns:
+            df[watermark] = pd.NaT
+        df[watermark] = pd.to_datetime(df[watermark])
+        order = [date_col_name] + [i for i in SQL_sync_datasets[data]["key"] if i != date_col_name]
+        sync_to = datetime.strftime(max_pre_loaded_date + relativedelta(days = 1), "%Y-%m-%d")
+        
+        # months cached before the watermark was gathered (moved in from the old csv files) are gathered again whole
+        # so they have it, otherwise their rows would never be synced
+        months = pd.to_datetime(df[date_col_name]).dt.strftime("%Y-%m")
+        unstamped = sorted(set(months) - set(months[df[watermark].notna()]))
+        restamped = 0
+        if len(unstamped) > 0:
+            print(f"Gathering {data} for {', '.join(unstamped)} again as it was cached without {watermark}...")
             print(" ")
-            df = pd.read_sql_query(query_string, connection)
-            column_renames = {"SettlementDate": "Date", "HHPeriod": "SP", "Value": "MW",
-                              "ReportName": "Fuel type"}
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            return df
-        
-        def Demand_data(date_from: str, date_to: str, connection = connection):
-            query_string = f"""SELECT SettlementDate, HHPeriod, Value, Description
-            
-            FROM PowerSystem.tblDemandOutturn as demand
-            
-            INNER JOIN Meta.tblDataDescription as DD on DD.DataDescriptionID = demand.DataDescriptionID
-            
-            WHERE SettlementDate >= '{date_from}' AND SettlementDate <= '{date_to}'
-            """
-            df = pd.read_sql_query(query_string, connection)
-            column_renames = {"SettlementDate": "Date", "HHPeriod": "SP", "Value": "MW", "Description": "Demand type"}
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            return df
-        
-        def FPN_data(date_from: str, date_to: str, connection = connection):
-            if BMU_ID == False:
-                query_string = f"""
-                SELECT SettlementDate, HHPeriod, TimeFrom, TimeTo, Elexon_BMUnitID, LevelFrom, LevelTo
-                
-                FROM PowerSystem.tblPhysicalData as FPN
-                
-                INNER JOIN Meta.tblBMUnit_Managed as BMU on FPN.BMUnitID = BMU.BMUnitID
-                
-                WHERE SettlementDate >= '{date_from}' AND SettlementDate <= '{date_to}' 
-                """
-            else:
-                query_string = f"""
-                SELECT SettlementDate, HHPeriod, TimeFrom, TimeTo, Elexon_BMUnitID, LevelFrom, LevelTo
-                
-                FROM PowerSystem.tblPhysicalData as FPN
-                
-                INNER JOIN Meta.tblBMUnit_Managed as BMU on FPN.BMUnitID = BMU.BMUnitID
-                
-                WHERE SettlementDate >= '{date_from}' AND SettlementDate <= '{date_to}' AND Elexon_BMUnitID = '{BMU_ID}'
-                """
-            df = pd.read_sql_query(query_string, connection)
-            column_renames = {"SettlementDate": "Date", "HHPeriod": "SP", "TimeFrom": "Time from",
-                              "TimeTo": "Time to", "Elexon_BMUnitID": "BMU ID", "LevelFrom": "MW from", "LevelTo": "MW to"}
-            df.rename(columns = column_renames, inplace = True)
-            df = df[column_renames.values()]
-            return df
-            
-    
+            gathered_from = max(min_pre_loaded_date, pd.Period(unstamped[0]).start_time)
+            gathered_to = min(max_pre_loaded_date + relativedelta(days = 1), pd.Period(unstamped[-1]).end_time.normalize() + relativedelta(days = 1))
+            df_temp = getattr(SQL_query, data)(SQL_date(gathered_from), SQL_date(gathered_to))
+            df_temp[date_col_name] = pd.to_datetime(df_temp[date_col_name])
+            df_temp = df_temp[df_temp[date_col_name].dt.strftime("%Y-%m").isin(unstamped) & (df_temp[date_col_name] >= min_pre_loaded_date) 
+                              & (df_temp[date_col_name] <= max_pre_loaded_date)]
+            df = pd.concat([df[~months.isin(unstamped)], df_temp]).sort_values(by = order, kind = "stable").reset_index(drop = True)
+            df[watermark] = pd.to_datetime(df[watermark])
+            export_months.extend(unstamped)
+            restamped = len(df_temp.index)
+        
+        high_watermark = df[watermark].max()
+        Cache_catalog_update(data, synced = datetime.now().isoformat(timespec = "seconds"))
+        if pd.isna(high_watermark):
+            return df, restamped
+        changed = getattr(SQL_query, data)(datetime.strftime(min_pre_loaded_date, "%Y-%m-%d"), sync_to, 
+                                           changed_since = high_watermark)
+        changed[date_col_name] = pd.to_datetime(changed[date_col_name])
+        changed = changed[(changed[date_col_name] >= min_pre_loaded_date) & (changed[date_col_name] <= max_pre_loaded_date)]
+        # the server may hold the watermark more precisely than the query parameter
+        changed = changed[pd.to_datetime(changed[watermark]) > high_watermark]
+        if len(changed.index) == 0:
+            return df, restamped
+        
+        key = SQL_sync_datasets[data]["key"]
+        restated = pd.MultiIndex.from_frame(df[key]).isin(pd.MultiIndex.from_frame(changed[key]))
+        print(f"Synced {len(changed.index)} rows of {data} published since {high_watermark} ({restated.sum()} restated)")
+        print(" ")
+        df = pd.concat([df[~restated], changed]).sort_values(by = order, kind = "stable").reset_index(drop = True)
+        export_months.extend(Cache_frame_months(changed, date_col_name))
+        return df, restamped + len(changed.index)
     
-    def load(date_from, date_to, csv_file_name, date_col_name):
+    def load(date_from, date_to, date_col_name):
         # print(date_from, date_to)
-        # date_col_name is the name of the datetime column in the dataset (it's used to find the max date)
-        if csv_file_name not in [i for i in os.listdir() if i.endswith(".csv")]:
-            # if csv file not in directory, loads from SQL server
+        # date_col_name is the name of the datetime column in the dataset (it's used to find the max date and to
+        # split the cache into months)
+        # the partitions which have to be gathered are locked first, so if another session is already gathering
+        # them this one waits and then reads them from the cache
+        held.enter_context(Cache_lock([Cache_lock_path(data, i) for i in Cache_missing(data, date_col_name, date_from, date_to)]))
+        df = Cache_read(data, date_col_name, date_from, date_to)
+        if (df is None) and (data in SQL_streamed_datasets):
+            unsaved = stream(date_from, date_to, date_col_name)
+            df = unpublished(Cache_read(data, date_col_name, date_from, date_to), unsaved, date_col_name)
+            export = False # already in the cache
+            load_log["Cache"] = "miss"
+        elif df is None:
+            # if the dates aren't in the cache, loads from SQL server
             # df = getattr(SQL_query, data)(date_from = date_from, date_to = date_to)
-            try:
-                # print("Hello")
-                df = getattr(SQL_query, data)(date_from = date_from, date_to = date_to) # gets the SQL data using the correct method
-                
-            except:
-                # print("ISBD")
-                df = getattr(SQL_query, data)()
+            export_watermark[0] = Cache_watermarks([data]).get(data) # before the data so a change part way through is caught next time
+            df = fetch_days(date_from, date_to, date_col_name) # gets the SQL data using the correct method
+            if data in SQL_sync_datasets: # just gathered, so it doesn't need syncing until SQL_sync_every has passed
+                Cache_catalog_update(data, synced = datetime.now().isoformat(timespec = "seconds"))
             export = True
+            export_months.extend(Cache_frame_months(df, date_col_name))
+            if date_col_name != False:
+                export_coverage.extend(gathered(date_from, date_to, pd.to_datetime(df[date_col_name]).max()))
+            load_log["Cache"] = "miss"
         else:
             export = False
-            print(f"Loading data from {csv_file_name}...")
-            df = pd.read_csv(csv_file_name)
-            
-            time_update_list = ["BMU Info.csv", "BMU Capacity data.csv", "NGU Info.csv"] # data which updates regularly
-            
-            if csv_file_name in time_update_list: # if file was created over 5 days ago, will update
-                path = os.getcwd() + f"//{csv_file_name}"
-                details = os.path.getctime(path) # gets time created
-                created_time = time.strptime(time.ctime(details)) # turns time into annoying time format
-                created_time = time.strftime("%Y-%m-%d") # useful string format
-                created_time = datetime.strptime(created_time, "%Y-%m-%d") # into datetime format
+            load_log["Cache"] = "hit"
+            
+            if data in Data_cache_freshness: # data which updates regularly, see Data_cache_freshness
+                entry = Cache_catalog_entry(data)
+                refreshed = datetime.fromisoformat(entry["partitions"]["all"]["refreshed"])
+                stale = Cache_stale(data, refreshed) # the max age first, without asking the server
+                if (stale == False) and (Cache_check_due(data, refreshed) == True):
+                    export_watermark[0] = Cache_watermarks([data]).get(data)
+                    stale = Cache_stale(data, refreshed, entry.get("watermark"), export_watermark[0])
                 
-                if created_time < datetime.now() - relativedelta(days = 5):
-                    print(f"Updating {csv_file_name}...")
-                    try:
-                        df = getattr(SQL_query, data)(date_from = date_from, date_to = date_to) # gets the SQL data using the correct method
-                    except:
-                        df = getattr(SQL_query, data)()
+                if stale != False:
+                    print(f"Updating {data} ({stale})...")
+                    if export_watermark[0] == None:
+                        export_watermark[0] = Cache_watermarks([data]).get(data) # saved with the data
+                    df = fetch(date_from = date_from, date_to = date_to) # gets the SQL data using the correct method
                     export = True
+                    load_log["Cache"] = "refresh"
                 else:
                     pass
             
@@ -429,8 +2443,9 @@ def Data_load(data: str, date_from: str = False, date_to: str = False, BMUID_NGU
                 
                 if isinstance(date_col_name, str):
                     df[date_col_name] = pd.to_datetime(df[date_col_name])
-                    max_pre_loaded_date = df[date_col_name].max() # finds max date in the dataset
-                    min_pre_loaded_date = df[date_col_name].min()
+                    # the first and last dates are in the catalog, so the data doesn't have to be searched for them
+                    partitions = [i for i in Cache_months(date_from, date_to) if i in Cache_partitions(data)]
+                    min_pre_loaded_date, max_pre_loaded_date = Cache_extent(data, partitions)
                     
                 elif isinstance(date_col_name, list):
                     for i in date_col_name:
@@ -443,20 +2458,49 @@ def Data_load(data: str, date_from: str = False, date_to: str = False, BMUID_NGU
                 
                 max_pre_loaded_date_str = datetime.strftime(max_pre_loaded_date, "%Y-%m-%d")
                 
-                # pulls additional data if the csv file data doesn't go back to date_from
-                if datetime.strptime(date_from, "%Y-%m-%d") < min_pre_loaded_date:
-                    df_temp1 = getattr(SQL_query, data)(date_from, datetime.strftime(min_pre_loaded_date - relativedelta(days = 1), "%Y-%m-%d"))
-                    df = pd.concat([df, df_temp1])
-                    export = True
+                # brings the rows already in the cache up to date before any new dates are added
+                if (data in SQL_sync_datasets) and (load_log["Cache"] == "hit"):
+                    df, synced = sync(df, date_col_name, min_pre_loaded_date, max_pre_loaded_date)
+                    if synced > 0:
+                        load_log["Cache"] = "synced"
+                        export = True
                 
-                # if the max date in the csv is less than user input date_to, pulls the remaining data off the server
-                if max_pre_loaded_date < datetime.strptime(date_to, "%Y-%m-%d") - relativedelta(hours = 2): # -2hrs is there because it would keep pulling from the SQL server when it didn't need to for the EAC data
-                    df_temp = getattr(SQL_query, data)(max_pre_loaded_date + relativedelta(days = 1), date_to = date_to)
-                    df = pd.concat([df, df_temp])
+                # the dates asked for which haven't been gathered, before, after or in between the ones in the cache
+                gaps = Cache_gaps(data, date_from, date_to)
+
+                streamed = False
+                unsaved = {} # {month: rows} streamed but not published
+                fetched = []
+                for gap_from, gap_to in gaps:
+                    load_log["Cache"] = "partial"
+                    if data in SQL_streamed_datasets:
+                        unsaved.update(stream(gap_from, gap_to, date_col_name, last_date = max_pre_loaded_date))
+                        streamed = True
+                        continue
+                    
+                    df_temp = fetch_days(gap_from, gap_to, date_col_name)
+                    last_date = max_pre_loaded_date # gaps before the last cached date won't get any more rows
+                    if len(df_temp.index) > 0: # an empty result has no types so would turn the dates to strings
+                        fetched.append(df_temp)
+                        export_months.extend(Cache_frame_months(df_temp, date_col_name))
+                        last_date = max(last_date, pd.to_datetime(df_temp[date_col_name]).max())
+                    export_coverage.extend(gathered(gap_from, gap_to, last_date))
                     export = True
-                else:
-                    pass
                 
+                if len(fetched) > 0:
+                    print(f"Filled {len(gaps)} gaps in the cached {data}")
+                    print(" ")
+                    df = pd.concat([df] + fetched)
+                    if data in SQL_sync_datasets: # the newly gathered rows are kept where they overlap
+                        df = df.drop_duplicates(subset = SQL_sync_datasets[data]["key"], keep = "last")
+                    df = df.sort_values(by = date_col_name, kind = "stable").reset_index(drop = True)
+                
+                if streamed == True: # new rows were written straight into the cache, so it's read back in
+                    del df
+                    df = unpublished(Cache_read(data, date_col_name, date_from, date_to), unsaved, date_col_name)
+                    export = False
+        
+        load_log["Load seconds"] = time.time() - t_start
         return df, export
     
     # gets a list of all methods in the SQL class
@@ -468,110 +2512,350 @@ def Data_load(data: str, date_from: str = False, date_to: str = False, BMUID_NGU
     else:
         pass
     
-    if data == "DSP_data":
-        csv_file_name = "All DSP data.csv"
-        df, export = load(date_from, date_to, csv_file_name, "Date")
-        df["Month"] = df["Date"].dt.strftime("%b-%y")
-        df["Volume ABS"] = df["Volume (MWh)"].abs()
-        
-        # works out bid/offer status by splitting value by DISBSAD and normal BOAs
-        nums = [str(i) for i in range(2000)]
-        DSP_data_temp = df[~df["BMU ID"].isin(nums)].reset_index(drop = True)
-        DISBSAD_temp = df[df["BMU ID"].isin(nums)].reset_index(drop = True) # BMU ID is a number for DISBSAD
-        
-        DSP_data_temp["Order type"] = "Offer"
-        DSP_data_temp["Order type"] = DSP_data_temp["Order type"].where(DSP_data_temp["Pair ID"] > 0, "Bid")
-        
-        DISBSAD_temp["Order type"] = "Offer"
-        DISBSAD_temp["Order type"] = DISBSAD_temp["Order type"].where(DISBSAD_temp["Volume (MWh)"] > 0, "Bid") 
-        
-        df = pd.concat([DSP_data_temp, DISBSAD_temp])
-        
-        df["Energy/System"] = "System"
-        df["Energy/System"] = df["Energy/System"].where((df["SO Flag"] == "T") | (df["CADL Flag"] == "T"), "Energy")
-        
-        df = df.sort_values(by = ["Date", "SP", "BMU ID"], ascending = True).reset_index(drop = True)
-        
-        #df["Energy/System"] = "System"
-        #df["Energy/System"] = df["Energy/System"].where((df["SO Flag"] == "T"), "Energy")
-        df["Month start"] = pd.to_datetime(df["Month"], format = "%b-%y").dt.date
-    elif data == "DISBSAD_data":
-        csv_file_name = "All DISBSAD data.csv"
-        df, export = load(date_from, date_to, csv_file_name, "Date")
-        df["Month"] = df["Date"].dt.strftime("%b-%y")
-        df["Order type"] = "Offer"
-        df["Order type"] = df["Order type"].where(df["Volume (MWh)"] > 0, "Bid")
-    elif data == "BMU_data":
-        csv_file_name = "BMU Info.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = False)
-        df["Company"] = df["Company"].where(df["Company"] != "EDF", "EDF Energy")
-    elif data == "Capacity_data":
-        csv_file_name = "BMU Capacity data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = False)
-        df["BMU Capacity ID"] = df["BMU ID"] + df["Date"].astype(str)
-        df["NGU Capacity ID"] = df["NGU ID"] + df["Date"].astype(str)
-    elif data == "EAC_data":
-        csv_file_name = "EAC Sell Order data.csv"
-        # ups the date by one to make the query gather all the data
-        date_to = datetime.strftime((datetime.strptime(date_to, "%Y-%m-%d") + relativedelta(days = 1)).date(), "%Y-%m-%d")
-        # df = SQL_query().EAC_data(date_from = date_from, date_to = date_to)
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Start time")
-        df["Month"] = df["Start time"].dt.strftime("%b-%y")
-    elif data == "Inertia_data":
-        csv_file_name = "Inertia data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Date")
-    elif data == "Generation_data":
-        csv_file_name = "Generation data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Date")
-    elif data == "STOR_data":
-        csv_file_name = "STOR data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Start time")
-    elif data == "SFFR_data":
-        csv_file_name = "SFFR data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Start time")
-    elif data == "BOD_data":
-        csv_file_name = "BOD data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Date")
-    elif data == "NGU_data":
-        csv_file_name = "NGU Info.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = False)
-    elif data == "Demand_data":
-        csv_file_name = "Demand data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Date")
-    elif data == "MIP_data":
-        csv_file_name = "System prices data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Date")
-        rename_MIP = {"Main Price Summary": "SIP", "APXMIDP": "APX", "N2EXMIDP": "N2EX", "Market Price Summary": "Market Price Summary"}
-        df["Description"] = df["Description"].map(rename_MIP).where(df["Description"].isin(rename_MIP.keys()), df["Description"])
-    elif data == "FPN_data":
-        csv_file_name = "FPN data.csv"
-        df, export = load(date_from, date_to, csv_file_name, date_col_name = "Date")
-        export = False
-    
-    param_names = list(locals().keys())
-    
-    if isinstance(BMUID_NGUID_dict, dict): # if BMUID_NGUID dict has been input it will add NGU ID based on BMU ID column
-        df["NGU ID"] = df["BMU ID"].map(BMUID_NGUID_dict)
-    if isinstance(NGUID_BMUID_dict, dict):
-        df["BMU ID"] = df["NGU ID"].map(NGUID_BMUID_dict)
-    if isinstance(BMUID_fuel_type_dict, dict):
-        df["Fuel type"] = df["BMU ID"].map(BMUID_fuel_type_dict)
-    if isinstance(NGUID_fuel_type_dict, dict):
-        df["Fuel type"] = df["NGU ID"].map(NGUID_fuel_type_dict)
-    if isinstance(BMU_company_dict, dict):
-        df["Company"] = df["BMU ID"].map(BMU_company_dict)
-    if isinstance(NGU_company_dict, dict):
-        df["Company"] = df["NGU ID"].map(NGU_company_dict)
-    
-    if export == True:
-        print(f"Exporting {data} to csv file as {csv_file_name}...")
-        df.to_csv(csv_file_name, index = False)
-    else:
-        pass
+    # the datasets kept in the data cache are registered once loaded, see Data_registry
+    lookups = {"BMUID_NGUID_dict": BMUID_NGUID_dict, "NGUID_BMUID_dict": NGUID_BMUID_dict, 
+               "BMUID_fuel_type_dict": BMUID_fuel_type_dict, "NGUID_fuel_type_dict": NGUID_fuel_type_dict,
+               "BMU_company_dict": BMU_company_dict, "NGU_company_dict": NGU_company_dict}
+    registry_key = Data_registry_key(data, BMU_ID, lookups)
+    if data in SQL_query_versions:
+        df = Data_registry_get(registry_key, date_from, date_to)
+        if df is not None:
+            print(f"Using the {data} already loaded this run")
+            print(" ")
+            Run_log("Data_load", {"Dataset": data, "Date from": date_from, "Date to": date_to, "Cache": "registry",
+                                  "Seconds": round(time.time() - t_start, 3), **Run_log_size(df)})
+            return df
+    
+    with held:
+        if data == "DSP_data":
+            date_col_name = "Date"
+            df, export = load(date_from, date_to, date_col_name)
+            # "Month", "Volume ABS", "Order type", "Energy/System" and "Month start" are saved in the cache, see Data_derive
+            df = df.sort_values(by = ["Date", "SP", "BMU ID"], ascending = True).reset_index(drop = True)
+        elif data == "DISBSAD_data":
+            date_col_name = "Date"
+            df, export = load(date_from, date_to, date_col_name)
+            df["Month"] = df["Date"].dt.strftime("%b-%y")
+            df["Order type"] = "Offer"
+            df["Order type"] = df["Order type"].where(df["Volume (MWh)"] > 0, "Bid")
+        elif data == "BMU_data":
+            date_col_name = False
+            df, export = load(date_from, date_to, date_col_name)
+            df["Company"] = df["Company"].where(df["Company"] != "EDF", "EDF Energy")
+        elif data == "Capacity_data":
+            date_col_name = False
+            df, export = load(date_from, date_to, date_col_name)
+            df["BMU Capacity ID"] = df["BMU ID"] + df["Date"].astype(str)
+            df["NGU Capacity ID"] = df["NGU ID"] + df["Date"].astype(str)
+        elif data == "EAC_data":
+            date_col_name = "Start time" # the blocks ending the day after date_to are gathered too, see fetch_days
+            df, export = load(date_from, date_to, date_col_name)
+            df["Month"] = df["Start time"].dt.strftime("%b-%y")
+        elif data == "Inertia_data":
+            date_col_name = "Date"
+            df, export = load(date_from, date_to, date_col_name)
+        elif data == "Generation_data":
+            date_col_name = "Date"
+            df, export = load(date_from, date_to, date_col_name)
+        elif data == "STOR_data":
+            date_col_name = "Start time"
+            df, export = load(date_from, date_to, date_col_name)
+        elif data == "SFFR_data":
+            date_col_name = "Start time"
+            df, export = load(date_from, date_to, date_col_name)
+        elif data == "BOD_data":
+            date_col_name = "Date"
+            df, export = load(date_from, date_to, date_col_name)
+        elif data == "NGU_data":
+            date_col_name = False
+            df, export = load(date_from, date_to, date_col_name)
+        elif data == "Demand_data":
+            date_col_name = "Date"
+            df, export = load(date_from, date_to, date_col_name)
+        elif data == "MIP_data":
+            date_col_name = "Date"
+            df, export = load(date_from, date_to, date_col_name) # descriptions renamed in SQL_query
+        elif data == "BOA_data":
+            date_col_name = "Date"
+            df, export = load(date_from, date_to, date_col_name)
+            df = BOA_compact(df) # the cache doesn't keep the types if it's saved as csv
+        elif data == "FPN_data":
+            # gathered by unit and cached whole days at a time in FPN_load
+            df = FPN_load(date_from, date_to, BMU_ID = BMU_ID)
+            export = False
+            load_log["Load seconds"] = time.time() - t_start
+        elif data == "DSP_summary_data":
+            # only a few thousand rows once aggregated on the server, so it isn't cached
+            df = SQL_query.DSP_summary_data(date_from, date_to)
+            export = False
+            load_log["Load seconds"] = time.time() - t_start
+    
+        param_names = list(locals().keys())
+    
+        if isinstance(BMUID_NGUID_dict, dict): # if BMUID_NGUID dict has been input it will add NGU ID based on BMU ID column
+            df["NGU ID"] = df["BMU ID"].map(BMUID_NGUID_dict)
+        if isinstance(NGUID_BMUID_dict, dict):
+            df["BMU ID"] = df["NGU ID"].map(NGUID_BMUID_dict)
+        if isinstance(BMUID_fuel_type_dict, dict):
+            df["Fuel type"] = df["BMU ID"].map(BMUID_fuel_type_dict)
+        if isinstance(NGUID_fuel_type_dict, dict):
+            df["Fuel type"] = df["NGU ID"].map(NGUID_fuel_type_dict)
+        if isinstance(BMU_company_dict, dict):
+            df["Company"] = df["BMU ID"].map(BMU_company_dict)
+        if isinstance(NGU_company_dict, dict):
+            df["Company"] = df["NGU ID"].map(NGU_company_dict)
+    
+        t_export = time.time()
+        if export == True:
+            print(f"Saving {data} to {os.path.join(Data_cache_folder, data)}...")
+            Cache_write(df, data, date_col_name, months = export_months, coverage = export_coverage, watermark = export_watermark[0])
+        else:
+            pass
+
+    # types are set after the export so the cache keeps the flags as "T"/"F" like the server does
+    df = Data_schema(df, data)
 
+    load_seconds = t_export - t_start if load_log["Load seconds"] == None else load_log["Load seconds"]
+    Run_log("Data_load", {"Dataset": data, "Date from": date_from, "Date to": date_to, "Cache": load_log["Cache"],
+                          "Seconds": round(time.time() - t_start, 3), "Load seconds": round(load_seconds, 3),
+                          "Post-processing seconds": round(t_export - t_start - load_seconds, 3), 
+                          "Export seconds": round(time.time() - t_export, 3), **Run_log_size(df)})
+    if data in SQL_query_versions:
+        Data_registry_add(registry_key, date_from, date_to, date_col_name, df, lookups)
+        return df.copy(deep = False) # columns added by the caller aren't added to the registered frame
     return df
 
 # gathers data from Elexon, could put this into a class in future
+"""==========================================================================================================
+Reference data
+============================================================================================================="""
+
+Reference_data_file = "Reference data.pkl"
+Reference_data_version: int = 2 # change when the snapshot's contents change so older snapshots get rebuilt
+
+def Reference_lookups(BMU_data, NGU_data, Capacity_data) -> dict:
+    # dictionaries to help the analysis, where an NGU is in both BMU_data and NGU_data the BMU_data value is used
+    lookups = {}
+    lookups["BMUID_fuel_type_dict"] = BMU_data.set_index("BMU ID")["Fuel type"].to_dict()
+    lookups["BMUID_NGUID_dict"] = BMU_data.set_index("BMU ID")["NGU ID"].to_dict()
+    lookups["NGUID_BMUID_dict"] = BMU_data.set_index("NGU ID")["BMU ID"].to_dict()
+    
+    lookups["NGUID_fuel_type_dict1"] = NGU_data.set_index("NGU ID")["Fuel type"].to_dict()
+    lookups["NGUID_fuel_type_dict2"] = BMU_data.set_index("NGU ID")["Fuel type"].to_dict()
+    lookups["NGUID_fuel_type_dict"] = {**lookups["NGUID_fuel_type_dict1"], **lookups["NGUID_fuel_type_dict2"]}
+    
+    lookups["BMU_company_dict"] = BMU_data.set_index("BMU ID")["Company"].to_dict()
+    lookups["NGU_company_dict"] = {**NGU_data.set_index("NGU ID")["Company"].to_dict(), 
+                                   **BMU_data.set_index("NGU ID")["Company"].to_dict()}
+    
+    lookups["BMU_capacity_dict"] = Capacity_data.set_index("BMU ID")["GC"].to_dict()
+    lookups["BMU_capacity_dict_by_NGUID"] = Capacity_data.set_index(Capacity_data["BMU ID"].map(lookups["BMUID_NGUID_dict"]))["GC"].to_dict()
+    return lookups
+
+def Capacity_as_of(df, capacity_data, time_col_name: str = "Start time", by: str = "BMU ID"):
+    # adds the GC and DC in force at each row's time_col_name onto df (DSP_data, EAC_data etc), capacity_data
+    # being Capacity_data in "history" mode. by is the unit ID column they share, "BMU ID" or "NGU ID". The IDs are
+    # matched as text as Data_load makes them categories, which merge_asof can't match against the capacity's
+    capacity = capacity_data[[by, "Date", "GC", "DC"]].dropna(subset = [by, "Date"])
+    capacity = capacity.rename(columns = {"Date": "Capacity date"})
+    capacity["Capacity date"] = pd.to_datetime(capacity["Capacity date"]).astype(df[time_col_name].dtype)
+    capacity["Unit"] = capacity[by].astype(str)
+    capacity = capacity.drop(columns = [by]).sort_values(by = "Capacity date")
+    
+    df = df.drop(columns = ["GC", "DC"], errors = "ignore")
+    df["Row order"] = np.arange(len(df.index))
+    df["Unit"] = df[by].astype(str)
+    df = pd.merge_asof(df.sort_values(by = time_col_name), capacity, left_on = time_col_name, right_on = "Capacity date", 
+                       by = "Unit", direction = "backward")
+    df = df.sort_values(by = "Row order").drop(columns = ["Row order", "Capacity date", "Unit"]).reset_index(drop = True)
+    return df
+
+def Reference_data_load(refresh: bool = False) -> dict:
+    # BMU_data, NGU_data and Capacity_data gathered in one batch and saved together with the lookups made from them,
+    # so most runs just read the snapshot. Returns {"version", "created", "watermarks", "BMU_data", "NGU_data", "Capacity_data", "lookups"}
+    snapshot = None
+    if os.path.exists(Reference_data_file):
+        try:
+            snapshot = pd.read_pickle(Reference_data_file)
+        except Exception:
+            print(f"Couldn't read {Reference_data_file}, it will be rebuilt")
+        if (snapshot != None) and (snapshot.get("version") != Reference_data_version):
+            print(f"{Reference_data_file} is from an older version of the script, it will be rebuilt")
+            snapshot = None
+    
+    # refreshed on the same policies as the cached copies in Data_load (see Data_cache_freshness). The max age is
+    # checked first and the server's only asked for the watermarks once the snapshot's over "check every" hours old
+    datasets = ["BMU_data", "NGU_data", "Capacity_data"]
+    if (snapshot != None) and (refresh == False):
+        stale = {i: Cache_stale(i, snapshot["created"]) for i in datasets}
+        stale = {i: j for i, j in stale.items() if j != False}
+        if len(stale) == 0:
+            current = Cache_watermarks([i for i in datasets if Cache_check_due(i, snapshot["created"]) == True])
+            stale = {i: Cache_stale(i, snapshot["created"], snapshot.get("watermarks", {}).get(i), j) for i, j in current.items()}
+            stale = {i: j for i, j in stale.items() if j != False}
+        if len(stale) == 0:
+            print(f"Loading reference data from {Reference_data_file} (made {snapshot['created']:%Y-%m-%d %H:%M})...")
+            print(" ")
+            return snapshot
+        print(f"Updating the reference data ({', '.join([f'{i} {j}' for i, j in stale.items()])})...")
+        print(" ")
+    
+    watermarks = Cache_watermarks(datasets) # before the data so a change part way through is caught next time
+    try:
+        dfs = SQL_query.Reference_data()
+    except SQL_errors:
+        if snapshot == None:
+            raise
+        print(f"Couldn't refresh the reference data, using {Reference_data_file} from {snapshot['created']:%Y-%m-%d}")
+        print(" ")
+        return snapshot
+    
+    # same changes as Data_load makes to these datasets
+    dfs["BMU_data"]["Company"] = dfs["BMU_data"]["Company"].where(dfs["BMU_data"]["Company"] != "EDF", "EDF Energy")
+    dfs["Capacity_data"]["BMU Capacity ID"] = dfs["Capacity_data"]["BMU ID"] + dfs["Capacity_data"]["Date"].astype(str)
+    dfs["Capacity_data"]["NGU Capacity ID"] = dfs["Capacity_data"]["NGU ID"] + dfs["Capacity_data"]["Date"].astype(str)
+    
+    snapshot = {"version": Reference_data_version, "created": datetime.now(), "watermarks": watermarks, **dfs, 
+                "lookups": Reference_lookups(dfs["BMU_data"], dfs["NGU_data"], dfs["Capacity_data"])}
+    print(f"Saving reference data to {Reference_data_file}...")
+    print(" ")
+    pd.to_pickle(snapshot, Cache_temp_path(Reference_data_file)) # swapped in so other sessions don't read half of it
+    Cache_publish(Cache_temp_path(Reference_data_file), Reference_data_file)
+    return snapshot
+
+"""==========================================================================================================
+Physical notifications
+============================================================================================================="""
+
+FPN_batch_size: int = 50 # number of BMUs asked for in each query
+
+def FPN_load(date_from: str, date_to: str, BMU_ID = False, SP_from: int = False, SP_to: int = False):
+    # physical notifications for a BMU ID or a list of them (every BMU if BMU_ID is False) between the dates, only
+    # for SP_from to SP_to on each day if they're given. Whole days are gathered and kept in the data cache as
+    # FPN_data, split into months like the other datasets, with the days gathered for each unit kept in the catalog
+    # ("units") so only the units and days that are missing come off the server. SP windows are cut from the whole
+    # days. Days from yesterday on can still be resubmitted, so they're gathered each time and not saved
+    if BMU_ID == False:
+        BMU_IDs = sorted(Reference_data_load()["BMU_data"]["BMU ID"].dropna().unique().tolist())
+    elif isinstance(BMU_ID, str):
+        BMU_IDs = [BMU_ID]
+    else:
+        BMU_IDs = list(BMU_ID)
+    save_to = pd.Timestamp.now().normalize() - relativedelta(days = 2)
+    
+    def missing() -> dict:
+        # {gaps: [units]}, the days each unit hasn't been gathered for. Units missing the same days are asked for together
+        units = Cache_catalog_entry("FPN_data", "Date").get("units", {})
+        groups = {}
+        for unit in BMU_IDs:
+            gaps = tuple([tuple(i) for i in Cache_intervals_gaps(units.get(unit, []), date_from, date_to)])
+            if len(gaps) > 0:
+                groups.setdefault(gaps, []).append(unit)
+        return groups
+    
+    def window(df):
+        # the rows between the dates and in the SP window
+        df = df[(df["Date"] >= pd.to_datetime(date_from)) & (df["Date"] <= pd.to_datetime(date_to))]
+        if SP_from != False:
+            df = df[df["SP"] >= SP_from]
+        if SP_to != False:
+            df = df[df["SP"] <= SP_to]
+        return df
+    
+    fetched = []
+    failed = [] # months that couldn't be saved, their rows are given from what was fetched
+    with ExitStack() as held:
+        groups = missing()
+        if len(groups) > 0:
+            # another session gathering the same months is waited for, then only what it didn't gather is asked for
+            months = sorted(set([k for i in groups for j in i for k in Cache_months(*j)]))
+            held.enter_context(Cache_lock([Cache_lock_path("FPN_data", i) for i in months]))
+            groups = missing()
+        to_fetch = [(gap_from, gap_to, units[i:i + FPN_batch_size]) for gaps, units in groups.items() 
+                    for gap_from, gap_to in gaps for i in range(0, len(units), FPN_batch_size)]
+        
+        if len(to_fetch) > 0:
+            print(f"Gathering FPN data for {len(set(j for i in to_fetch for j in i[2]))} BMUs in {len(to_fetch)} batches...")
+            print(" ")
+            with ThreadPoolExecutor(max_workers = SQL_workers()) as executor:
+                fetched = list(executor.map(lambda i: SQL_query.FPN_data(i[0], i[1], BMU_ID = i[2]), to_fetch))
+            fetched = [i.assign(Date = pd.to_datetime(i["Date"])) for i in fetched if len(i.index) > 0] # empty ones have no types
+            
+            # the days up to save_to are saved, and the units asked for are recorded even if they had no FPNs so
+            # they aren't asked for again
+            units = {}
+            for gap_from, gap_to, batch in to_fetch:
+                if pd.Timestamp(gap_from) <= save_to:
+                    for unit in batch:
+                        units.setdefault(unit, []).append([gap_from, SQL_date(min(pd.Timestamp(gap_to), save_to))])
+            new = pd.concat(fetched) if len(fetched) > 0 else pd.DataFrame(columns = ["Date"])
+            new = new[new["Date"] <= save_to]
+            months = Cache_frame_months(new, "Date")
+            if len(months) > 0: # added to the units already saved in the months
+                cached = Cache_read("FPN_data", "Date", f"{months[0]}-01", pd.Period(months[-1]).end_time.normalize())
+                new = pd.concat([i for i in [cached, new] if i is not None])
+                new = new.drop_duplicates(subset = ["BMU ID", "Time from"], keep = "last").sort_values(by = ["Date", "SP", "BMU ID"])
+                failed = Cache_write(new.reset_index(drop = True), "FPN_data", "Date", months = months)
+            units = {i: Cache_intervals_remove_months(j, failed) for i, j in units.items()}
+            Cache_catalog_update("FPN_data", units = units)
+        
+        cached = Cache_read("FPN_data", "Date", date_from, date_to)
+    
+    # the saved days are read from the cache
+    dfs = [window(i[(i["Date"] > save_to) | i["Date"].dt.strftime("%Y-%m").isin(failed)]) for i in fetched]
+    if cached is not None:
+        dfs.append(window(cached[cached["BMU ID"].isin(BMU_IDs)]))
+    if len(dfs) == 0:
+        return pd.DataFrame(columns = list(SQL_columns["FPN_data"].values()))
+    df = pd.concat(dfs).sort_values(by = ["BMU ID", "Time from"]).reset_index(drop = True)
+    return df
+
+"""==========================================================================================================
+Load scheduler
+============================================================================================================="""
+
+def Load_scheduler(loads: dict, max_workers: int = SQL_pool_size) -> dict:
+    # runs every load in loads, {name: {"load": function given the results so far, "needs": [names it waits for]}},
+    # starting each one as soon as everything it needs has finished so independent datasets load at the same time.
+    # Returns {name: result}
+    for name, load in loads.items():
+        missing = [i for i in load["needs"] if i not in loads]
+        if len(missing) > 0:
+            raise ValueError(f"{name} needs {missing} which aren't being loaded")
+    
+    t_start = time.time()
+    results = {}
+    seconds = {}
+    pending = dict(loads)
+    running = {}
+    
+    def timed(name, load):
+        SQL_thread_state.loads = max_workers # so the months gathered inside a load share the connections (SQL_workers)
+        t0 = time.time()
+        result = load["load"](results)
+        seconds[name] = time.time() - t0
+        return result
+    
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        while (len(pending) > 0) or (len(running) > 0):
+            for name, load in list(pending.items()):
+                if all(i in results for i in load["needs"]):
+                    running[executor.submit(timed, name, load)] = name
+                    del pending[name]
+            if len(running) == 0:
+                raise ValueError(f"{list(pending.keys())} can't be loaded as what they need depends on them")
+            
+            done, not_done = wait(running.keys(), return_when = FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    
+    print(f"Finished {len(loads)} loads in {time.time() - t_start:.1f}s ({sum(seconds.values()):.1f}s if run one at a time)")
+    print(" ")
+    Run_log("Load_scheduler", {"Loads": len(loads), "Seconds": round(time.time() - t_start, 3), 
+                               "Sequential seconds": round(sum(seconds.values()), 3),
+                               "Load seconds": {i: round(j, 3) for i, j in seconds.items()}})
+    return results
+
 def Elexon_gather(code: str, date_from: str = False, date_to: str = False, n_days: int = 7, 
                BMU_ID = False, SP = False, message_IDs: list = False, physical_code: str = "PN", file_check: str = False):
     
@@ -943,14 +3227,66 @@ if __name__ == "__main__":
     Initial data loading
     =========================================================================================================="""
     
-    # loads BMU data
-    BMU_data = Data_load("BMU_data", date_from = date_from, date_to = date_to)
-    NGU_data = Data_load("NGU_data", date_from = date_from, date_to = date_to)
-    # loads BMU capacity data
-    BMU_capacity_data = Data_load("Capacity_data", date_from = date_from, date_to = date_to)
+    BM_date_from = "2023-11-01"
+    EAC_date_from = "2023-11-01" # the EAC's first auctions, the monthly price and volume tables go back to then
+    
+    # every dataset the analysis below uses and what each of them has to wait for, the lookups come from the
+    # reference data (BMU, NGU and BMU capacity data). Loads of a dataset covered by another load wait for it so
+    # they're sliced from it rather than loaded again (see Data_registry)
+    loads = {"reference": {"load": lambda r: Reference_data_load(), "needs": []}}
+    for i in ["BMUID_NGUID_dict", "NGUID_BMUID_dict", "BMUID_fuel_type_dict", "NGUID_fuel_type_dict2"]:
+        loads[i] = {"load": lambda r, i = i: r["reference"]["lookups"][i], "needs": ["reference"]}
+    
+    if Market_fundementals == True:
+        loads["inertia_data"] = {"load": lambda r: Data_load("Inertia_data", date_from = "2023-01-01", date_to = date_to), "needs": []}
+        loads["gen_mix"] = {"load": lambda r: Data_load("Generation_data", date_from = date_from_prev, date_to = date_to), "needs": []}
+        loads["demand_data"] = {"load": lambda r: Data_load("Demand_data", date_from = date_from, date_to = date_to), "needs": []}
+        loads["System_price_data"] = {"load": lambda r: Data_load("MIP_data", date_from = date_from, date_to = date_to), "needs": []}
+    
+    if BM == True:
+        loads["DSP_data"] = {"load": lambda r: Data_load("DSP_data", date_from = BM_date_from, date_to = date_to, 
+                                                         BMUID_NGUID_dict = r["BMUID_NGUID_dict"], 
+                                                         BMUID_fuel_type_dict = r["BMUID_fuel_type_dict"]),
+                             "needs": ["BMUID_NGUID_dict", "BMUID_fuel_type_dict"]}
+        loads["SIP"] = {"load": lambda r: Data_load("MIP_data", date_from = BM_date_from, date_to = date_to), "needs": []}
+        if "System_price_data" in loads: # the system prices are then sliced from SIP (see Data_registry)
+            loads["System_price_data"]["needs"] = ["SIP"]
+        if BM_summaries_from_SQL == True:
+            loads["DSP_summary"] = {"load": lambda r: Data_load("DSP_summary_data", date_from = BM_date_from, date_to = date_to), "needs": []}
+        loads["DISBSAD_data"] = {"load": lambda r: Data_load("DISBSAD_data", date_from = "2023-11-01", date_to = date_to, 
+                                                             NGUID_BMUID_dict = r["NGUID_BMUID_dict"], 
+                                                             NGUID_fuel_type_dict = r["NGUID_fuel_type_dict2"]),
+                                 "needs": ["NGUID_BMUID_dict", "NGUID_fuel_type_dict2"]}
+    elif (STOR == True) or (kW_revenue == True):
+        loads["DSP_data"] = {"load": lambda r: Data_load("DSP_data", date_from = date_from, date_to = date_to), "needs": []}
+    if kW_revenue == True: # every GC/DC submission, for the capacities in force at each bid/offer
+        loads["Capacity_data"] = {"load": lambda r: Data_load("Capacity_data"), "needs": []}
+    
+    if EAC == True:
+        loads["EAC_data"] = {"load": lambda r: Data_load("EAC_data", date_from = EAC_date_from, date_to = date_to, 
+                                                         NGUID_fuel_type_dict = r["NGUID_fuel_type_dict2"], 
+                                                         NGUID_BMUID_dict = r["NGUID_BMUID_dict"]),
+                             "needs": ["NGUID_fuel_type_dict2", "NGUID_BMUID_dict"]}
+    elif kW_revenue == True:
+        loads["EAC_data"] = {"load": lambda r: Data_load("EAC_data", date_from = date_from, date_to = date_to), "needs": []}
+    
+    # the STOR and SFFR sections compare the month with the one before
+    if (STOR == True) or (kW_revenue == True):
+        loads["STOR_data"] = {"load": lambda r: Data_load("STOR_data", date_from = date_from_prev, date_to = date_to), "needs": []}
+    if (SFFR == True) or (kW_revenue == True):
+        loads["SFFR_data"] = {"load": lambda r: Data_load("SFFR_data", date_from = date_from_prev, date_to = date_to), "needs": []}
+    
+    loaded = Load_scheduler(loads)
+    Cache_stats_report()
+    
+    # loads BMU, NGU and BMU capacity data, along with the dictionaries made from them
+    reference_data = loaded["reference"]
+    BMU_data = reference_data["BMU_data"]
+    NGU_data = reference_data["NGU_data"]
+    BMU_capacity_data = reference_data["Capacity_data"]
     BMU_capacity_data["DC"] = BMU_capacity_data["DC"].abs()
     BMU_capacity_data["Capacity"] = BMU_capacity_data[["GC", "DC"]].max()
-    BMU_capacity_dict = BMU_capacity_data.set_index("BMU ID").to_dict()["GC"]
+    BMU_capacity_dict = reference_data["lookups"]["BMU_capacity_dict"]
     #BMU_capacity_dict = sorted(BMU_capacity_dict)
     
     
@@ -968,48 +3304,20 @@ if __name__ == "__main__":
     SP_to_EFA_dict = {45: 1, 5: 2, 13: 3, 21: 4, 29: 5, 37:6}
     
     # creates dictionaries to help analysis
-    BMUID_fuel_type_dict = BMU_data.set_index("BMU ID")["Fuel type"].to_dict()
-    BMUID_NGUID_dict = BMU_data.set_index("BMU ID")["NGU ID"].to_dict()
-    NGUID_BMUID_dict = BMU_data.set_index("NGU ID")["BMU ID"].to_dict()
+    BMUID_fuel_type_dict = reference_data["lookups"]["BMUID_fuel_type_dict"]
+    BMUID_NGUID_dict = reference_data["lookups"]["BMUID_NGUID_dict"]
+    NGUID_BMUID_dict = reference_data["lookups"]["NGUID_BMUID_dict"]
     
-    
-    NGUID_fuel_type_dict1 = NGU_data.set_index("NGU ID")["Fuel type"].to_dict()
-    NGUID_fuel_type_dict2 = BMU_data.set_index("NGU ID")["Fuel type"].to_dict()
-    NGUID_fuel_type_dict = {}
+    # NGUID_fuel_type_dict has the fuel types from both, with BMU_data's used where an NGU is in both
+    NGUID_fuel_type_dict1 = reference_data["lookups"]["NGUID_fuel_type_dict1"]
+    NGUID_fuel_type_dict2 = reference_data["lookups"]["NGUID_fuel_type_dict2"]
+    NGUID_fuel_type_dict = reference_data["lookups"]["NGUID_fuel_type_dict"]
     
     BMU_capacity_data["NGU ID"] = BMU_capacity_data["BMU ID"].map(BMUID_NGUID_dict)
-    BMU_capacity_dict_by_NGUID = BMU_capacity_data.set_index("NGU ID").to_dict()["GC"]  # used in BM £/kW
-    
-    """Below updates the NGU fuel types into 1 dictionary"""
-    keys_1 = set(NGUID_fuel_type_dict1.keys())
-    keys_2 = set(NGUID_fuel_type_dict2.keys())
-    all_keys = keys_1 | keys_2
-    for key in all_keys:
-        a = 0
-        if key in keys_1:
-            a = NGUID_fuel_type_dict1[key]
-        if key in keys_2:
-            a = NGUID_fuel_type_dict2[key]
-        
-        NGUID_fuel_type_dict[key] = a
-    
-            
-    BMU_company_dict = BMU_data.set_index("BMU ID")["Company"].to_dict()
-    NGU_company_dict1 = NGU_data.set_index("NGU ID")["Company"].to_dict()
-    NGU_company_dict2 = BMU_data.set_index("NGU ID")["Company"].to_dict()
-    NGU_company_dict = {}
+    BMU_capacity_dict_by_NGUID = reference_data["lookups"]["BMU_capacity_dict_by_NGUID"]  # used in BM £/kW
     
-    keys_1 = set(NGU_company_dict1.keys())
-    keys_2 = set(NGU_company_dict2.keys())
-    all_keys = keys_1 | keys_2
-    for key in all_keys:
-        a = 0
-        if key in keys_1:
-            a = NGU_company_dict1[key]
-        if key in keys_2:
-            a = NGU_company_dict2[key]
-        
-        NGU_company_dict[key] = a
+    BMU_company_dict = reference_data["lookups"]["BMU_company_dict"]
+    NGU_company_dict = reference_data["lookups"]["NGU_company_dict"]
     
     
     if Market_fundementals == True:
@@ -1019,17 +3327,17 @@ if __name__ == "__main__":
         =========================================================================================================="""
         print("Gathering inertia data...")
         
-        inertia_data = Data_load("Inertia_data", date_from = "2023-01-01", date_to = date_to)
+        inertia_data = loaded["inertia_data"]
         
         inertia_data["Month"] = inertia_data["Date"].dt.strftime("%b-%y")
         inertia_data["Month start"] = pd.to_datetime(inertia_data["Month"], format = "%b-%y")
         
         inertia_col_list = ["Outturn Inertia", "Market Provided Inertia"]
         
-        inertia_table = inertia_data.groupby(["Month start", "Month"])[inertia_col_list].mean()
+        inertia_table = inertia_data.groupby(["Month start", "Month"], observed = True)[inertia_col_list].mean()
         
         for i in inertia_col_list:
-            inertia_table[f"{i} volatility"] = inertia_data.groupby(["Month start", "Month"])[i].std()
+            inertia_table[f"{i} volatility"] = inertia_data.groupby(["Month start", "Month"], observed = True)[i].std()
         
         #print(inertia_table)
         
@@ -1048,7 +3356,7 @@ if __name__ == "__main__":
         Generation data
         =========================================================================================================="""
         
-        gen_mix = Data_load("Generation_data", date_from = date_from_prev, date_to = date_to)
+        gen_mix = loaded["gen_mix"]
         #print(gen_mix)
         gen_mix["Month"] = gen_mix["Date"].dt.strftime("%b-%y")
         #print(gen_mix)
@@ -1059,11 +3367,11 @@ if __name__ == "__main__":
         int_flows["Imports"] = int_flows["MW"].where(int_flows["MW"] >= 0, 0)
         int_flows["Exports"] = int_flows["MW"].where(int_flows["MW"] < 0, 0)
         
-        int_flows = int_flows.groupby(["Month start"])[["Imports", "Exports", "MW"]].sum()/2E6 # TWh
+        int_flows = int_flows.groupby(["Month start"], observed = True)[["Imports", "Exports", "MW"]].sum()/2E6 # TWh
         int_flows.rename(columns = {"MW": "Net imports"}, inplace = True)
         
         
-        gen_mix_table = pd.pivot_table(gen_mix, index = ["Month start", "Month"], columns = "Fuel type", values = "MW", aggfunc = "sum")/2000000
+        gen_mix_table = pd.pivot_table(gen_mix, index = ["Month start", "Month"], columns = "Fuel type", values = "MW", aggfunc = "sum", observed = True)/2000000
         
         gen_mix_table["Solar"] = gen_mix_table[["Solar", "Solar (Embedded)"]].mean(axis = 1) # takes average between the two solar values in the data set as there's a slight discrepancy between the two
         # print(gen_mix_table)
@@ -1074,7 +3382,7 @@ if __name__ == "__main__":
         
         gen_mix_change = gen_mix_table/gen_mix_table.shift(1) - 1
         
-        gen_mix_volatility = gen_mix[gen_mix["Fuel type"] == "Wind"].groupby("Month start")["MW"].std()
+        gen_mix_volatility = gen_mix[gen_mix["Fuel type"] == "Wind"].groupby("Month start", observed = True)["MW"].std()
         print(gen_mix_volatility)
 
         if Load == True:
@@ -1093,11 +3401,11 @@ if __name__ == "__main__":
         Demand data
         =========================================================================================================="""
         
-        demand_data = Data_load("Demand_data", date_from = date_from, date_to = date_to)
+        demand_data = loaded["demand_data"]
         demand_data["Date"] = pd.to_datetime(demand_data["Date"])
         demand_data["Month"] = pd.to_datetime(demand_data["Date"].dt.strftime("%b-%y"), format = "%b-%y")
         
-        demand_summary = pd.pivot_table(demand_data, values = "MW", index = "Month", columns = "Demand type", aggfunc = ["sum", "mean", "std"])
+        demand_summary = pd.pivot_table(demand_data, values = "MW", index = "Month", columns = "Demand type", aggfunc = ["sum", "mean", "std"], observed = True)
         
 
         # demand_col_renames = {i: (f"{i[1]} (TWh)" if i[0] == "sum" else f"{i[1]} (MW)") for i in demand_summary.columns.tolist()}
@@ -1129,7 +3437,7 @@ if __name__ == "__main__":
         MIP data
         =========================================================================================================="""
         
-        System_price_data = Data_load("MIP_data", date_from = date_from, date_to = date_to)
+        System_price_data = loaded["System_price_data"]
 
         MIP_data = System_price_data[System_price_data["Description"] == "APX"].reset_index(drop = True)
         MIP_data["Date"] = pd.to_datetime(MIP_data["Date"])
@@ -1137,11 +3445,11 @@ if __name__ == "__main__":
         MIP_data["Month"] = pd.to_datetime(MIP_data["Date"].dt.strftime("%b-%y"), format = "%b-%y")
         
         MIP_data["EFA"] = MIP_data["SP"].map(SP_to_EFA_dict).ffill().bfill() # ffill fills out most, bfill fills out the very beginning NA EFA block values
-        MIP_data_summary = MIP_data.groupby(by = "Month").agg(Mean = ("Price", "mean"), Volatility = ("Price", "std"))
+        MIP_data_summary = MIP_data.groupby(by = "Month", observed = True).agg(Mean = ("Price", "mean"), Volatility = ("Price", "std"))
         
-        Spread_data = MIP_data.groupby(["Month", "Date", "EFA"])["Price"].max() - MIP_data.groupby(["Month", "Date", "EFA"])["Price"].min()
+        Spread_data = MIP_data.groupby(["Month", "Date", "EFA"], observed = True)["Price"].max() - MIP_data.groupby(["Month", "Date", "EFA"], observed = True)["Price"].min()
         Spread_data = Spread_data.reset_index()
-        Spread_data = Spread_data.groupby("Month").agg(Average_EFA_spread = ("Price", "mean"))
+        Spread_data = Spread_data.groupby("Month", observed = True).agg(Average_EFA_spread = ("Price", "mean"))
         
         MIP_data_summary = pd.merge(MIP_data_summary, Spread_data["Average_EFA_spread"], left_index = True, right_index = True)
         MIP_data_summary_mom = MIP_data_summary/MIP_data_summary.shift(1) - 1
@@ -1164,42 +3472,51 @@ if __name__ == "__main__":
         Loads Detailed system prices
         ======================================================================================================"""
         
-        BM_date_from = "2023-11-01"
+        DSP_data = loaded["DSP_data"]
         
-        DSP_data = Data_load("DSP_data", date_from = BM_date_from, date_to = date_to, BMUID_NGUID_dict = BMUID_NGUID_dict,
-                             BMUID_fuel_type_dict = BMUID_fuel_type_dict)
-        
-        SIP = Data_load("MIP_data", date_from = BM_date_from, date_to = date_to)
+        SIP = loaded["SIP"]
         SIP = SIP[SIP["Description"] == "SIP"].reset_index(drop = True)
         SIP["Month"] = pd.to_datetime(SIP["Date"]).dt.strftime("%b-%y")
         SIP["Month start"] = pd.to_datetime(SIP["Month"], format = "%b-%y").dt.date
         # SIP = pd.pivot_table(SIP, index = "Month start", values = "Price (£/MWh)", )
-        SIP = SIP.groupby("Month start").agg(Average = ("Price", "mean"), Volatility = ("Price", "std"))
+        SIP = SIP.groupby("Month start", observed = True).agg(Average = ("Price", "mean"), Volatility = ("Price", "std"))
         
         """===================================================================================================
         Begins BM Analysis
         ======================================================================================================"""
-        DSP_data["Month start"] = pd.to_datetime(DSP_data["Month"], format = "%b-%y").dt.date
         
         # below works out the different bids/offers by normal BOAs and DISBSAD
-        tech_vol_summary = pd.pivot_table(DSP_data, columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum")
-        
-        tech_vol_offer = pd.pivot_table(DSP_data[DSP_data["Order type"] == "Offer"], columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total offer volume").div(1000)
-        tech_vol_bid = pd.pivot_table(DSP_data[DSP_data["Order type"] == "Bid"], columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total bid volume").div(-1000)
-        
-        tech_price_summary = pd.pivot_table(DSP_data, columns = "Month start", values = "Price (£/MWh)", index = ["Order type", "Fuel type"], aggfunc = "mean")
+        if BM_summaries_from_SQL == True:
+            # same tables as below, but from the monthly totals worked out on the SQL server
+            DSP_summary = loaded["DSP_summary"]
+            
+            tech_vol_summary = pd.pivot_table(DSP_summary, columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum", observed = True)
+            
+            tech_vol_offer = pd.pivot_table(DSP_summary[DSP_summary["Order type"] == "Offer"], columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total offer volume", observed = True).div(1000)
+            tech_vol_bid = pd.pivot_table(DSP_summary[DSP_summary["Order type"] == "Bid"], columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total bid volume", observed = True).div(-1000)
+            
+            # average price = sum of prices/number of prices
+            tech_price_summary = (pd.pivot_table(DSP_summary, columns = "Month start", values = "Price sum", index = ["Order type", "Fuel type"], aggfunc = "sum", observed = True)
+                                  .div(pd.pivot_table(DSP_summary, columns = "Month start", values = "Price count", index = ["Order type", "Fuel type"], aggfunc = "sum", observed = True)))
+        else:
+            tech_vol_summary = pd.pivot_table(DSP_data, columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum", observed = True)
+            
+            tech_vol_offer = pd.pivot_table(DSP_data[DSP_data["Order type"] == "Offer"], columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total offer volume", observed = True).div(1000)
+            tech_vol_bid = pd.pivot_table(DSP_data[DSP_data["Order type"] == "Bid"], columns = "Month start", values = "Volume ABS", index = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total bid volume", observed = True).div(-1000)
+            
+            tech_price_summary = pd.pivot_table(DSP_data, columns = "Month start", values = "Price (£/MWh)", index = ["Order type", "Fuel type"], aggfunc = "mean", observed = True)
         #print(tech_vol_summary)
         
         DSP_data_dr = DSP_data[(DSP_data["Date"] >= date_from_dt) & (DSP_data["Date"] <= date_to_dt)].reset_index(drop = True)
         
         temp = DSP_data_dr
-        temp["Time"] = (temp["SP"]*30) - 30
+        temp["Time"] = (temp["SP"].astype(int)*30) - 30 # SP is an int8 which would overflow
         print(temp)
         temp["Start time"] = temp["Date"] + temp["Time"].astype("timedelta64[m]")
         
         t = "Bid"
         
-        temp = pd.pivot_table(temp[temp["Order type"] == t], index = "Start time", columns = "Fuel type", values = "Volume ABS", aggfunc = "sum")
+        temp = pd.pivot_table(temp[temp["Order type"] == t], index = "Start time", columns = "Fuel type", values = "Volume ABS", aggfunc = "sum", observed = True)
         temp.to_csv(f"{t}s Nov-24.csv")
         sys.exit()
         active_BMUs_during_period = DSP_data_dr[["BMU ID", "Fuel type"]].drop_duplicates(keep = "first").set_index("BMU ID")
@@ -1232,12 +3549,12 @@ if __name__ == "__main__":
             if i == 0:
                 tech_BOAs = DSP_data[DSP_data["Fuel type"] == j]
                 tech_BOAs.reset_index(drop = True, inplace = True)
-                dispatch_graph = tech_BOAs.groupby("Date", as_index = False)["Fuel type"].count()
+                dispatch_graph = tech_BOAs.groupby("Date", as_index = False, observed = True)["Fuel type"].count()
                 dispatch_graph.rename(columns = {"Fuel type": j}, inplace = True)
             else:
                 tech_BOAs_temp = DSP_data[DSP_data["Fuel type"] == j]
                 tech_BOAs_temp.reset_index(drop = True, inplace = True)
-                dispatch_graph_temp = tech_BOAs_temp.groupby("Date", as_index = False)["Fuel type"].count()
+                dispatch_graph_temp = tech_BOAs_temp.groupby("Date", as_index = False, observed = True)["Fuel type"].count()
                 dispatch_graph = dispatch_graph.merge(dispatch_graph_temp, on = "Date", how = "left")
                 dispatch_graph.rename(columns = {"Fuel type": j}, inplace = True)
         
@@ -1249,14 +3566,22 @@ if __name__ == "__main__":
         
         """Volume share graph"""
         print("Loading BM volume share data...")
-        BM_volume_share = pd.pivot_table(DSP_data, index = "Month start", values = "Volume ABS", columns = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total volume")
-        
-        BM_vol_summary_count = pd.pivot_table(DSP_data, index = ["Order type", "Energy/System"], 
-                                        columns = "Month start", values = "Volume ABS", 
-                                        aggfunc = "count")
-        BM_vol_summary_vol = pd.pivot_table(DSP_data, index = ["Order type", "Energy/System"], 
-                                        columns = "Month start", values = "Volume ABS", 
-                                        aggfunc = "sum").div(1000000)
+        BM_volume_share = pd.pivot_table(DSP_data, index = "Month start", values = "Volume ABS", columns = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total volume", observed = True)
+        
+        if BM_summaries_from_SQL == True:
+            BM_vol_summary_count = pd.pivot_table(DSP_summary, index = ["Order type", "Energy/System"], 
+                                            columns = "Month start", values = "Count", 
+                                            aggfunc = "sum", observed = True)
+            BM_vol_summary_vol = pd.pivot_table(DSP_summary, index = ["Order type", "Energy/System"], 
+                                            columns = "Month start", values = "Volume ABS", 
+                                            aggfunc = "sum", observed = True).div(1000000)
+        else:
+            BM_vol_summary_count = pd.pivot_table(DSP_data, index = ["Order type", "Energy/System"], 
+                                            columns = "Month start", values = "Volume ABS", 
+                                            aggfunc = "count", observed = True)
+            BM_vol_summary_vol = pd.pivot_table(DSP_data, index = ["Order type", "Energy/System"], 
+                                            columns = "Month start", values = "Volume ABS", 
+                                            aggfunc = "sum", observed = True).div(1000000)
         
         if Load == True:
             col = len(tech_vol_summary.columns.tolist())
@@ -1296,13 +3621,13 @@ if __name__ == "__main__":
         print("Calculating battery bid/offer spreads")
         battery_bids = DSP_data[(DSP_data["Fuel type"] == "Battery") & (DSP_data["Order type"] == "Bid")]
         battery_bids.reset_index(drop = True, inplace = True)
-        battery_bids = pd.pivot_table(battery_bids, values = ["Price (£/MWh)", "Volume (MWh)"], index = "Date", aggfunc = {"Price (£/MWh)": "mean", "Volume (MWh)": "sum"})
+        battery_bids = pd.pivot_table(battery_bids, values = ["Price (£/MWh)", "Volume (MWh)"], index = "Date", aggfunc = {"Price (£/MWh)": "mean", "Volume (MWh)": "sum"}, observed = True)
         battery_bids.rename(columns = {"Price (£/MWh)": "Average bid price (£/MWh)", "Volume (MWh)": "Bid volume (MWh)"})
         #print(battery_bids)
 
         battery_offers = DSP_data[(DSP_data["Fuel type"] == "Battery") & (DSP_data["Order type"] == "Offer")]
         battery_offers.reset_index(drop = True, inplace = True)
-        battery_offers = pd.pivot_table(battery_offers, values = ["Price (£/MWh)", "Volume (MWh)"], index = "Date", aggfunc = {"Price (£/MWh)": "mean", "Volume (MWh)": "sum"})
+        battery_offers = pd.pivot_table(battery_offers, values = ["Price (£/MWh)", "Volume (MWh)"], index = "Date", aggfunc = {"Price (£/MWh)": "mean", "Volume (MWh)": "sum"}, observed = True)
         battery_offers.rename(columns = {"Price (£/MWh)": "Average offer price (£/MWh)", "Volume (MWh)": "Offer volume (MWh)"})
         #print(battery_offers)
         
@@ -1321,12 +3646,12 @@ if __name__ == "__main__":
         monthly_dispatch.reset_index(drop = True, inplace = True)
         
         
-        total_dispatch = pd.pivot_table(monthly_dispatch, values = "Volume ABS", columns = "Month", index = "Fuel type", aggfunc = "count")
+        total_dispatch = pd.pivot_table(monthly_dispatch, values = "Volume ABS", columns = "Month", index = "Fuel type", aggfunc = "count", observed = True)
         total_dispatch.rename(columns = {month_str: f"{month_str} total dispatches", month_str_prev: f"{month_str_prev} total dispatches"}, inplace = True)
         total_dispatch["Change in total dispatches"] = (total_dispatch[f"{month_str} total dispatches"]/total_dispatch[f"{month_str_prev} total dispatches"]) - 1
         
         
-        average_dispatch = pd.pivot_table(monthly_dispatch, values = "Volume ABS", columns = ["Date", "Month"], index = "Fuel type", aggfunc = "count")
+        average_dispatch = pd.pivot_table(monthly_dispatch, values = "Volume ABS", columns = ["Date", "Month"], index = "Fuel type", aggfunc = "count", observed = True)
         total_dispatch.rename(columns = {month_str: f"{month_str} average dispatches", month_str_prev: f"{month_str_prev} average dispatches"}, inplace = True)
         
         # average daily dispatch rates by month and previous month
@@ -1368,7 +3693,7 @@ if __name__ == "__main__":
                 for b, j in enumerate(["Offer", "Bid"]):                  
                     print(i, j)
                     DSP_temp1 = DSP_temp[DSP_temp["Order type"] == j].reset_index(drop = True)
-                    DSP_temp1 = pd.pivot_table(DSP_temp1, values = vals, columns = "Month", index = "Fuel type", aggfunc = operation)
+                    DSP_temp1 = pd.pivot_table(DSP_temp1, values = vals, columns = "Month", index = "Fuel type", aggfunc = operation, observed = True)
                     
                     DSP_temp1.rename(columns = {c: f"{i} {j} {Type.lower()} {c}" for c in DSP_temp1.columns.tolist()}, inplace = True)
                     
@@ -1416,8 +3741,7 @@ if __name__ == "__main__":
         """===================================================================================================
         Begins DISBSAD Analysis
         ======================================================================================================"""
-        DISBSAD_data = Data_load("DISBSAD_data", date_from = "2023-11-01", date_to = date_to, NGUID_BMUID_dict = NGUID_BMUID_dict, 
-                                 NGUID_fuel_type_dict = NGUID_fuel_type_dict2)
+        DISBSAD_data = loaded["DISBSAD_data"]
         
         DISBSAD_data["Month start"] = pd.to_datetime(DISBSAD_data["Month"], format = "%b-%y")
         DISBSAD_data["Date"] = pd.to_datetime(DISBSAD_data["Date"], format = "%Y-%m-%d")
@@ -1425,7 +3749,7 @@ if __name__ == "__main__":
         DISBSAD_data["Price (£/MWh)"] = (DISBSAD_data["Cost (£)"].div(DISBSAD_data["Volume (MWh)"]).where(DISBSAD_data["Price (£/MWh)"].isna(), DISBSAD_data["Price (£/MWh)"])) 
         
         DISBSAD_vol_by_service = pd.pivot_table(DISBSAD_data, index = ["Month start", "Month", "Service type"], 
-                                                values = "Volume (MWh)", columns = "Order type", aggfunc = "sum").reset_index()
+                                                values = "Volume (MWh)", columns = "Order type", aggfunc = "sum", observed = True).reset_index()
         
         
         DISBSAD_summary_vol_by_service = pd.merge(DISBSAD_vol_by_service[DISBSAD_vol_by_service["Month"] == month_str],
@@ -1435,7 +3759,7 @@ if __name__ == "__main__":
         DISBSAD_summary_vol_by_service = DISBSAD_summary_vol_by_service[[i for i in DISBSAD_summary_vol_by_service.columns.tolist() if "Month" not in i]]
         
         DISBSAD_vol_by_tech = pd.pivot_table(DISBSAD_data, index = ["Month start", "Month", "Fuel type"], 
-                                                values = "Volume (MWh)", columns = "Order type", aggfunc = "sum").reset_index()
+                                                values = "Volume (MWh)", columns = "Order type", aggfunc = "sum", observed = True).reset_index()
         
         DISBSAD_summary_vol_by_tech = pd.merge(DISBSAD_vol_by_tech[DISBSAD_vol_by_tech["Month"] == month_str],
                                                DISBSAD_vol_by_tech[DISBSAD_vol_by_tech["Month"] == month_str_prev], 
@@ -1445,14 +3769,14 @@ if __name__ == "__main__":
         
         
         DISBSAD_prices_by_tech = pd.pivot_table(DISBSAD_data, index = ["Month start", "Month", "Service type"], 
-                                                values = "Price (£/MWh)", columns = "Fuel type", aggfunc = "mean").reset_index()
+                                                values = "Price (£/MWh)", columns = "Fuel type", aggfunc = "mean", observed = True).reset_index()
         
         DISBSAD_data_dr = DISBSAD_data[(DISBSAD_data["Date"] >= date_from_dt) & (DISBSAD_data["Date"] <= date_to_dt)].reset_index(drop = True)
         
-        DISBSAD_prices_by_tech = pd.pivot_table(DISBSAD_data_dr, index = "Fuel type", columns = "Order type", values = "Price (£/MWh)", aggfunc = "mean")
+        DISBSAD_prices_by_tech = pd.pivot_table(DISBSAD_data_dr, index = "Fuel type", columns = "Order type", values = "Price (£/MWh)", aggfunc = "mean", observed = True)
         
-        DISBSAD_data_daily = pd.pivot_table(DISBSAD_data[DISBSAD_data["Month"] == month_str], index = ["Date"], columns = "Fuel type", values = "Volume (MWh)", aggfunc = "sum")
-        DISBSAD_max_price = DISBSAD_data[DISBSAD_data["Month"] == month_str].groupby(by = "Date")["Price (£/MWh)"].max().reset_index()
+        DISBSAD_data_daily = pd.pivot_table(DISBSAD_data[DISBSAD_data["Month"] == month_str], index = ["Date"], columns = "Fuel type", values = "Volume (MWh)", aggfunc = "sum", observed = True)
+        DISBSAD_max_price = DISBSAD_data[DISBSAD_data["Month"] == month_str].groupby(by = "Date", observed = True)["Price (£/MWh)"].max().reset_index()
         DISBSAD_data_daily = pd.merge(DISBSAD_data_daily, DISBSAD_max_price, on = "Date", how = "inner").set_index("Date", drop = True)
         
         
@@ -1476,8 +3800,7 @@ if __name__ == "__main__":
             
     if EAC == True:
         
-        EAC_data = Data_load("EAC_data", date_from = date_from, date_to = date_to, 
-                             NGUID_fuel_type_dict = NGUID_fuel_type_dict2, NGUID_BMUID_dict = NGUID_BMUID_dict)
+        EAC_data = loaded["EAC_data"]
         print("Analysing EAC data...")
 
         EAC_data["Start time"] = pd.to_datetime(EAC_data["Start time"])
@@ -1490,13 +3813,13 @@ if __name__ == "__main__":
         EAC_data["BMU?"] = EAC_data["BMU?"].where(EAC_data["BMU ID"].isnull(), "BM")
         
         # price summaries by service
-        EAC_price_summary = EAC_data.groupby(["Month start", "Date", "Start time", "Service"], as_index = False).agg({"Clearing price (£/MW/hr)": "mean", "Volume (MW)": "sum", "Executed Volume (MW)": "sum"})
+        EAC_price_summary = EAC_data.groupby(["Month start", "Date", "Start time", "Service"], as_index = False, observed = True).agg({"Clearing price (£/MW/hr)": "mean", "Volume (MW)": "sum", "Executed Volume (MW)": "sum"})
         
-        EAC_price_summary_mean = pd.pivot_table(EAC_price_summary, values = "Clearing price (£/MW/hr)", columns = "Service", index = "Month start", aggfunc = "mean")
-        EAC_price_summary_std = pd.pivot_table(EAC_price_summary, values = "Clearing price (£/MW/hr)", columns = "Service", index = "Month start", aggfunc = "std")
+        EAC_price_summary_mean = pd.pivot_table(EAC_price_summary, values = "Clearing price (£/MW/hr)", columns = "Service", index = "Month start", aggfunc = "mean", observed = True)
+        EAC_price_summary_std = pd.pivot_table(EAC_price_summary, values = "Clearing price (£/MW/hr)", columns = "Service", index = "Month start", aggfunc = "std", observed = True)
         
-        EAC_sub_vol_summary_mean = pd.pivot_table(EAC_price_summary, values = "Volume (MW)", columns = "Service", index = "Month start", aggfunc = "mean")
-        EAC_acc_vol_summary_mean = pd.pivot_table(EAC_price_summary, values = "Executed Volume (MW)", columns = "Service", index = "Month start", aggfunc = "mean")
+        EAC_sub_vol_summary_mean = pd.pivot_table(EAC_price_summary, values = "Volume (MW)", columns = "Service", index = "Month start", aggfunc = "mean", observed = True)
+        EAC_acc_vol_summary_mean = pd.pivot_table(EAC_price_summary, values = "Executed Volume (MW)", columns = "Service", index = "Month start", aggfunc = "mean", observed = True)
         
         
         EAC_data_dr = EAC_data[(EAC_data["Start time"] >= date_from_dt) & (EAC_data["Start time"] <= date_to_dt + relativedelta(days = 1))].reset_index(drop = True)
@@ -1506,7 +3829,7 @@ if __name__ == "__main__":
         # EAC_data_dr["BMU ID"] = EAC_data_dr["NGU ID"].map(NGUID_BMUID_dict)
 
         
-        volumes_by_unit_type = pd.pivot_table(EAC_data, index = ["Month start", "BMU?"], columns = "Service", values = "Executed Volume (MW)", aggfunc = "sum")
+        volumes_by_unit_type = pd.pivot_table(EAC_data, index = ["Month start", "BMU?"], columns = "Service", values = "Executed Volume (MW)", aggfunc = "sum", observed = True)
         
         if Load == True:
             Excel_load("Clearing price graph", volumes_by_unit_type, "Z12", name = "Accepted volume by unit type")
@@ -1573,7 +3896,7 @@ if __name__ == "__main__":
                 
                 freq[col_name] = freq[col_name].div(seconds_in_hour) #gets values into MWh
             
-            energy_by_EFA_temp = freq.groupby(["Date", "EFA"])[response_services].sum().reset_index()
+            energy_by_EFA_temp = freq.groupby(["Date", "EFA"], observed = True)[response_services].sum().reset_index()
             
             energy_by_EFA = pd.melt(energy_by_EFA_temp, id_vars = ["Date", "EFA"], 
                                     value_vars = response_services, 
@@ -1591,12 +3914,12 @@ if __name__ == "__main__":
             # revenue per MW entered into each EFA block
             freq_cp["Revenue"] = freq_cp["Clearing price (£/MW/hr)"].mul(freq_cp["dt"])
             
-            freq_cp = freq_cp.groupby(["Date", "EFA", "Service"])["Revenue"].mean().reset_index()
-            freq_cp["ID"] = freq_cp["Date"].astype(str) + (freq_cp["EFA"].astype(int)).astype(str) + freq_cp["Service"]
+            freq_cp = freq_cp.groupby(["Date", "EFA", "Service"], observed = True)["Revenue"].mean().reset_index()
+            freq_cp["ID"] = freq_cp["Date"].astype(str) + (freq_cp["EFA"].astype(int)).astype(str) + freq_cp["Service"].astype(str)
             freq_cp["MWh"] = freq_cp["ID"].map(energy_by_EFA_dict)
             # finds £/MWh values but sets this to 0 if MWh == 0, otherwise you'd get a DIV0 error
             freq_cp["£/MWh"] = freq_cp["Revenue"].div(freq_cp["MWh"]).where(freq_cp["MWh"] != 0, 0)
-            freq_cp = pd.pivot_table(freq_cp, index = ["Date", "EFA"], values = "£/MWh", columns = "Service")
+            freq_cp = pd.pivot_table(freq_cp, index = ["Date", "EFA"], values = "£/MWh", columns = "Service", observed = True)
 
             if Load == True:
                 col = len(energy_by_EFA_temp.columns.tolist())
@@ -1617,14 +3940,14 @@ if __name__ == "__main__":
             
             if i in [j for j in EAC_services if ("P" in i) or ("N" in i)]: # reserve services
                 
-                reserve_volume_table = pd.pivot_table(df_filt, columns = "Fuel type", index = ["Start time", "Clearing price (£/MW/hr)"], values = "Executed Volume (MW)", aggfunc = "sum").reset_index()
-                reserve_volume_table_sub = pd.pivot_table(df_filt, columns = "Fuel type", index = ["Start time", "Clearing price (£/MW/hr)"], values = "Volume (MW)", aggfunc = "sum").reset_index()
+                reserve_volume_table = pd.pivot_table(df_filt, columns = "Fuel type", index = ["Start time", "Clearing price (£/MW/hr)"], values = "Executed Volume (MW)", aggfunc = "sum", observed = True).reset_index()
+                reserve_volume_table_sub = pd.pivot_table(df_filt, columns = "Fuel type", index = ["Start time", "Clearing price (£/MW/hr)"], values = "Volume (MW)", aggfunc = "sum", observed = True).reset_index()
                 reserve_volume_table_rej = (reserve_volume_table_sub - reserve_volume_table).mul(-1) # rejected volume
                 
                 #print(reserve_volume_table_sub)
                 
-                reserve_sub = pd.pivot_table(df_filt, index = "Start time", columns = "Fuel type", values = "Volume (MW)", aggfunc = "sum")
-                reserve_wav = pd.pivot_table(df_filt, index = "Start time", columns = "Fuel type", values = "Submitted £/hr", aggfunc = "sum")
+                reserve_sub = pd.pivot_table(df_filt, index = "Start time", columns = "Fuel type", values = "Volume (MW)", aggfunc = "sum", observed = True)
+                reserve_wav = pd.pivot_table(df_filt, index = "Start time", columns = "Fuel type", values = "Submitted £/hr", aggfunc = "sum", observed = True)
                 reserve_wav = reserve_wav/reserve_sub #weighted average submitted price per SP per tech type
                 reserve_wav.reset_index(inplace = True)
                 if Load == True:
@@ -1647,10 +3970,10 @@ if __name__ == "__main__":
                 df_filt_service_only["EFA"] = df_filt_service_only["Start time"].dt.hour.map(hour_to_EFA_dict)
 
                 
-                response_volume_table = df_filt.groupby("Start time")[["Volume (MW)", "Executed Volume (MW)"]].sum()
+                response_volume_table = df_filt.groupby("Start time", observed = True)[["Volume (MW)", "Executed Volume (MW)"]].sum()
                 response_volume_table["Acceptance rate"] = response_volume_table["Executed Volume (MW)"].div(response_volume_table["Volume (MW)"])
-                response_volume_table["Clearing price"] = df_filt.groupby("Start time")["Clearing price (£/MW/hr)"].mean()
-                response_volume_table["sum of submitted £/hr"] = df_filt.groupby("Start time")["Submitted £/hr"].sum()
+                response_volume_table["Clearing price"] = df_filt.groupby("Start time", observed = True)["Clearing price (£/MW/hr)"].mean()
+                response_volume_table["sum of submitted £/hr"] = df_filt.groupby("Start time", observed = True)["Submitted £/hr"].sum()
                 response_volume_table["Weighted average submitted price"] = response_volume_table["sum of submitted £/hr"].div(response_volume_table["Volume (MW)"])
                 # below is only used to get the Excel graphs to show the right thing, it isn't technically the submitted MW
                 response_volume_table["Submitted MW"] = response_volume_table["Volume (MW)"] - response_volume_table["Executed Volume (MW)"]
@@ -1660,12 +3983,12 @@ if __name__ == "__main__":
                 =========================================================================================================="""
                 
                 # accepted volume by EFA by month
-                acc_vol_EFA_month =  pd.pivot_table(df_filt_service_only, values = "Executed Volume (MW)", index = ["Date", "Month start"], columns = "EFA", aggfunc = "sum").reset_index()
-                sub_vol_EFA_month =  pd.pivot_table(df_filt_service_only, values = "Volume (MW)", index = ["Date", "Month start"], columns = "EFA", aggfunc = "sum").reset_index()
+                acc_vol_EFA_month =  pd.pivot_table(df_filt_service_only, values = "Executed Volume (MW)", index = ["Date", "Month start"], columns = "EFA", aggfunc = "sum", observed = True).reset_index()
+                sub_vol_EFA_month =  pd.pivot_table(df_filt_service_only, values = "Volume (MW)", index = ["Date", "Month start"], columns = "EFA", aggfunc = "sum", observed = True).reset_index()
                 #print(acc_vol_EFA_month)
                 
-                acc_vol_EFA_month = acc_vol_EFA_month.groupby("Month start")[acc_vol_EFA_month.columns.tolist()[2:]].mean()
-                sub_vol_EFA_month = sub_vol_EFA_month.groupby("Month start")[sub_vol_EFA_month.columns.tolist()[2:]].mean()
+                acc_vol_EFA_month = acc_vol_EFA_month.groupby("Month start", observed = True)[acc_vol_EFA_month.columns.tolist()[2:]].mean()
+                sub_vol_EFA_month = sub_vol_EFA_month.groupby("Month start", observed = True)[sub_vol_EFA_month.columns.tolist()[2:]].mean()
                 
                 acc_vol_EFA_month_change = (acc_vol_EFA_month/acc_vol_EFA_month.shift(1) - 1).tail(1)
                 sub_vol_EFA_month_change = (sub_vol_EFA_month/sub_vol_EFA_month.shift(1) - 1).tail(1)
@@ -1677,17 +4000,17 @@ if __name__ == "__main__":
                 
                 """Vol summary table is done"""
                 # print(summary_table_vol)
-                clearing_price_month =  pd.pivot_table(df_filt_service_only, values = "Clearing price (£/MW/hr)", index = ["Date", "Month start"], columns = "EFA").reset_index()
+                clearing_price_month =  pd.pivot_table(df_filt_service_only, values = "Clearing price (£/MW/hr)", index = ["Date", "Month start"], columns = "EFA", observed = True).reset_index()
                 # print(clearing_price_month.columns.tolist()[2:])
                 cols = clearing_price_month.columns.tolist()[2:]
                 
-                clearing_price_month_max = clearing_price_month.groupby("Month start")[cols].max()
+                clearing_price_month_max = clearing_price_month.groupby("Month start", observed = True)[cols].max()
                 clearing_price_month_max_change = (clearing_price_month_max/clearing_price_month_max.shift(1) - 1).tail(1)
                 
-                clearing_price_month_av = clearing_price_month.groupby("Month start")[cols].mean()
+                clearing_price_month_av = clearing_price_month.groupby("Month start", observed = True)[cols].mean()
                 clearing_price_month_av_change = (clearing_price_month_av/clearing_price_month_av.shift(1) - 1).tail(1)
                 
-                clearing_price_month_min = clearing_price_month.groupby("Month start")[cols].min()
+                clearing_price_month_min = clearing_price_month.groupby("Month start", observed = True)[cols].min()
                 clearing_price_month_min_change = (clearing_price_month_min/clearing_price_month_min.shift(1) - 1).tail(1)
                 
                 
@@ -1716,7 +4039,7 @@ if __name__ == "__main__":
         =========================================================================================================="""
         # print(EAC_data_dr)
         if Load == True: # only here so that it doesn't run the API each time as that's slow
-            clearing_prices = pd.pivot_table(EAC_data_dr, values = "Clearing price (£/MW/hr)", columns = "Service", index = "Start time")
+            clearing_prices = pd.pivot_table(EAC_data_dr, values = "Clearing price (£/MW/hr)", columns = "Service", index = "Start time", observed = True)
     
     
             DA_renewable_forecast = DA_Renewable_Generation_Forecast(date_from, date_to).reset_index()
@@ -1748,7 +4071,7 @@ if __name__ == "__main__":
     
     if STOR == True:
         # loads STOR data
-        STOR_data = Data_load("STOR_data", date_from, date_to)
+        STOR_data = loaded["STOR_data"]
         STOR_data["Date"] = pd.to_datetime(STOR_data["Start time"].dt.date)
         STOR_data["Month"] = STOR_data["Date"].dt.strftime("%b-%y")
         STOR_data["Month start"] = pd.to_datetime(STOR_data["Month"], format = "%b-%y")
@@ -1756,33 +4079,33 @@ if __name__ == "__main__":
         STOR_data = STOR_data[(STOR_data["Date"] >= date_from_prev_dt) & (STOR_data["Date"] <= date_to)].reset_index(drop = True)
         
         if BM == False:
-            STOR_data_BM = Data_load("DSP_data", date_from, date_to)
+            STOR_data_BM = loaded["DSP_data"].copy()
         else:
             STOR_data_BM = DSP_data
         
         print("Analysing STOR data...")
         STOR_data_BM = STOR_data_BM[(STOR_data_BM["Date"] >= date_from_dt) & 
                                     (STOR_data_BM["Date"] <= date_to_dt) & 
-                                    (STOR_data_BM["STOR Flag"] == "T")].reset_index(drop = True)
+                                    (STOR_data_BM["STOR Flag"] == True)].reset_index(drop = True)
         
-        STOR_utilisation_data = STOR_data_BM.groupby("Date").agg({"Volume (MWh)": "sum", 
+        STOR_utilisation_data = STOR_data_BM.groupby("Date", observed = True).agg({"Volume (MWh)": "sum", 
                                                                   "Price (£/MWh)": "mean"})
 
-        STOR_utilisation_data_mom = STOR_data_BM.groupby("Month").agg({"Volume (MWh)": "sum", 
+        STOR_utilisation_data_mom = STOR_data_BM.groupby("Month", observed = True).agg({"Volume (MWh)": "sum", 
                                                                              "Price (£/MWh)": "mean"})
         
 
         
         STOR_data["Price*vol"] = STOR_data["Submitted MW"].mul(STOR_data["Availability price"])
         
-        STOR_summary = STOR_data.groupby("Date").agg({"Submitted MW": "sum", "Accepted MW": "sum", 
+        STOR_summary = STOR_data.groupby("Date", observed = True).agg({"Submitted MW": "sum", "Accepted MW": "sum", 
                                                       "Availability price": "mean", "Clearing price": "mean"})
         
-        STOR_summary["Weighted submitted average price"] = STOR_data.groupby("Date")["Price*vol"].sum().div(STOR_summary["Submitted MW"])
+        STOR_summary["Weighted submitted average price"] = STOR_data.groupby("Date", observed = True)["Price*vol"].sum().div(STOR_summary["Submitted MW"])
         STOR_summary["Utilised volume (MWh)"] = STOR_summary.index.map(STOR_utilisation_data.to_dict()["Volume (MWh)"])
         
         
-        STOR_by_fuel = pd.pivot_table(STOR_data, values = "Accepted MW", index = "Date", columns = "Fuel type", aggfunc = "sum")
+        STOR_by_fuel = pd.pivot_table(STOR_data, values = "Accepted MW", index = "Date", columns = "Fuel type", aggfunc = "sum", observed = True)
         
         STOR_assets = pd.DataFrame({"Number of active assets": [len(STOR_data[STOR_data["Month"] == month_str_prev]["NGU ID"].unique().tolist()), 
                                                                 len(STOR_data[STOR_data["Month"] == month_str]["NGU ID"].unique().tolist())]}, 
@@ -1800,7 +4123,7 @@ if __name__ == "__main__":
             
     if SFFR == True:
         
-        SFFR_data = Data_load("SFFR_data", date_from, date_to)
+        SFFR_data = loaded["SFFR_data"]
         print("Analysing SFFR data...")
         SFFR_data["Start time"] = pd.to_datetime(SFFR_data["Start time"])
         SFFR_data["Date"] = SFFR_data["Start time"].dt.date
@@ -1812,8 +4135,8 @@ if __name__ == "__main__":
         SFFR_data = SFFR_data[(SFFR_data["Start time"] >= date_from_prev_dt) & (SFFR_data["Start time"] <= date_to_dt)].reset_index(drop = True)
         
 
-        SFFR_vol_summary_table_fuel = pd.pivot_table(SFFR_data, values = "Accepted MW", index = "Month start", columns = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total MW").drop("Total MW")
-        SFFR_vol_summary_table_period = SFFR_data.groupby(["Date", "Month start"]).agg({"Accepted MW": "sum", 
+        SFFR_vol_summary_table_fuel = pd.pivot_table(SFFR_data, values = "Accepted MW", index = "Month start", columns = "Fuel type", aggfunc = "sum", margins = True, margins_name = "Total MW", observed = True).drop("Total MW")
+        SFFR_vol_summary_table_period = SFFR_data.groupby(["Date", "Month start"], observed = True).agg({"Accepted MW": "sum", 
                                                                                               "Submitted MW": "sum",
                                                                                               "Clearing price": "mean", 
                                                                                               "price*vol": "sum"})
@@ -1840,27 +4163,27 @@ if __name__ == "__main__":
             """This finds the maximum submitted MW during the time period for each unit by service"""
 
             """STOR"""
-            STOR_capacities = STOR_data.groupby(["Start time", "NGU ID"])["Submitted MW"].sum().reset_index()
-            STOR_capacities = STOR_capacities.groupby("NGU ID")["Submitted MW"].max().to_dict()
+            STOR_capacities = STOR_data.groupby(["Start time", "NGU ID"], observed = True)["Submitted MW"].sum().reset_index()
+            STOR_capacities = STOR_capacities.groupby("NGU ID", observed = True)["Submitted MW"].max().to_dict()
             # print(STOR_capacities)
             
-            STOR_availability_revenue = STOR_data.groupby("NGU ID")["Revenue"].sum()
-            STOR_utilisation_data_revenue = DSP_data[DSP_data["STOR Flag"] == "T"].reset_index(drop = True)
-            STOR_utilisation_data_revenue = STOR_utilisation_data_revenue.groupby(["NGU ID"])["Revenue"].sum()
+            STOR_availability_revenue = STOR_data.groupby("NGU ID", observed = True)["Revenue"].sum()
+            STOR_utilisation_data_revenue = DSP_data[DSP_data["STOR Flag"] == True].reset_index(drop = True)
+            STOR_utilisation_data_revenue = STOR_utilisation_data_revenue.groupby(["NGU ID"], observed = True)["Revenue"].sum()
 
             """SFFR"""
-            SFFR_capacities = SFFR_data.groupby(["Start time", "NGU ID"])["Submitted MW"].sum().reset_index()
-            SFFR_capacities = SFFR_data.groupby("NGU ID")["Submitted MW"].max().to_dict()
+            SFFR_capacities = SFFR_data.groupby(["Start time", "NGU ID"], observed = True)["Submitted MW"].sum().reset_index()
+            SFFR_capacities = SFFR_data.groupby("NGU ID", observed = True)["Submitted MW"].max().to_dict()
             
-            SFFR_revenue = SFFR_data.groupby("NGU ID")["Revenue"].sum()
+            SFFR_revenue = SFFR_data.groupby("NGU ID", observed = True)["Revenue"].sum()
             
             """EAC services"""
             EAC_capacities = EAC_data[["Basket ID", "NGU ID", "Executed Volume (MW)", "Service"]]
-            EAC_capacities = EAC_capacities.groupby(["Basket ID", "NGU ID", "Service"], as_index = False)["Executed Volume (MW)"].sum()
+            EAC_capacities = EAC_capacities.groupby(["Basket ID", "NGU ID", "Service"], as_index = False, observed = True)["Executed Volume (MW)"].sum()
             # EAC_capacities = EAC_capacities.groupby(["NGU ID", "Service"], as_index = False)["Executed Volume (MW)"].max()
-            EAC_capacities = pd.pivot_table(EAC_capacities, values = "Executed Volume (MW)", index = "NGU ID", columns = "Service", aggfunc = "max")
+            EAC_capacities = pd.pivot_table(EAC_capacities, values = "Executed Volume (MW)", index = "NGU ID", columns = "Service", aggfunc = "max", observed = True)
             
-            EAC_revenue = pd.pivot_table(EAC_data, index = "NGU ID", values = "Revenue", columns = "Service", aggfunc = "sum")
+            EAC_revenue = pd.pivot_table(EAC_data, index = "NGU ID", values = "Revenue", columns = "Service", aggfunc = "sum", observed = True)
             # print(EAC_revenue)
             
             # print(EAC_capacities)
@@ -1886,10 +4209,17 @@ if __name__ == "__main__":
             """
             
             
-            BM_capacities = BMU_capacity_dict_by_NGUID            
+            DSP_data = DSP_data[DSP_data["STOR Flag"] == False].reset_index(drop = True)
+            
+            # GC in force at each accepted bid/offer rather than the latest one submitted, the most each BMU had
+            # during the period like the other services
+            BM_capacities = DSP_data[["BMU ID", "Date", "SP"]].copy()
+            BM_capacities["Start time"] = BM_capacities["Date"] + pd.to_timedelta((BM_capacities["SP"].astype(int) - 1)*30, unit = "m")
+            BM_capacities = Capacity_as_of(BM_capacities, loaded["Capacity_data"])
+            BM_capacities = BM_capacities.groupby(BM_capacities["BMU ID"].astype(str))["GC"].max()
+            BM_capacities = BM_capacities.set_axis(BM_capacities.index.map(BMUID_NGUID_dict)).to_dict()
             
-            DSP_data = DSP_data[DSP_data["STOR Flag"] == "F"].reset_index(drop = True)
-            BM_revenue = DSP_data.groupby(["NGU ID"])["Revenue"].sum()
+            BM_revenue = DSP_data.groupby(["NGU ID"], observed = True)["Revenue"].sum()
             
             units = sorted(list(set(list(STOR_capacities.keys()) + list(SFFR_capacities.keys())
                                     + EAC_capacities.index.values.tolist() + list(map(str, list(BM_capacities.keys())))
@@ -1948,22 +4278,22 @@ if __name__ == "__main__":
         
         if EAC == False:
             # print("Loading EAC data...")
-            EAC_data = Data_load("EAC_data", date_from = date_from, date_to = date_to)
+            EAC_data = loaded["EAC_data"]
             EAC_data["Start time"] = pd.to_datetime(EAC_data["Start time"])
             EAC_data["End time"] = pd.to_datetime(EAC_data["End time"])
             
         if STOR == False:
             # print("Loading STOR data...")
-            STOR_data = Data_load("STOR_data", date_from = date_from, date_to = date_to)
+            STOR_data = loaded["STOR_data"]
             # print(STOR_data)
             
         if SFFR == False:
             # print("Loading SFFR data...")
-            SFFR_data = Data_load("SFFR_data", date_from = date_from, date_to = date_to)
+            SFFR_data = loaded["SFFR_data"]
             # print(SFFR_data)
         
         if BM == False:
-            DSP_data = Data_load("DSP_data", date_from = date_from, date_to = date_to)
+            DSP_data = loaded["DSP_data"]
             DSP_data["Date"] = pd.to_datetime(DSP_data["Date"])
             DSP_data = DSP_data[(DSP_data["Date"] >= date_from_dt) & (DSP_data["Date"] <= date_to_dt)].reset_index(drop = True)
         
@@ -1985,14 +4315,14 @@ if __name__ == "__main__":
         
         group_columns = ["Start time", "NGU ID", "Company", "Service", "Submitted price (£/MW/hr)"]
         
-        bidding_data = EAC_data.groupby(group_columns).agg(sub_MW = ("Volume (MW)", "sum"), 
+        bidding_data = EAC_data.groupby(group_columns, observed = True).agg(sub_MW = ("Volume (MW)", "sum"), 
                                                            acc_MW = ("Executed Volume (MW)", "sum"),
                                                            av_price = ("Submitted price (£/MW/hr)", "mean"),
                                                            revenue = ("Revenue", "sum")).reset_index()
         
-        company_bidding_strategies_sub = pd.pivot_table(bidding_data, values = "sub_MW", index = "Company", columns = "Service", aggfunc = "sum")
-        company_bidding_strategies_acc = pd.pivot_table(bidding_data, values = "acc_MW", index = "Company", columns = "Service", aggfunc = "sum")
-        company_bidding_strategies_price = pd.pivot_table(bidding_data, values = "av_price", index = "Company", columns = "Service", aggfunc = "mean")
+        company_bidding_strategies_sub = pd.pivot_table(bidding_data, values = "sub_MW", index = "Company", columns = "Service", aggfunc = "sum", observed = True)
+        company_bidding_strategies_acc = pd.pivot_table(bidding_data, values = "acc_MW", index = "Company", columns = "Service", aggfunc = "sum", observed = True)
+        company_bidding_strategies_price = pd.pivot_table(bidding_data, values = "av_price", index = "Company", columns = "Service", aggfunc = "mean", observed = True)
         
         
         if Load == True:
@@ -2053,7 +4383,7 @@ if __name__ == "__main__":
         BM_problem_childs = BM_problem_childs.index.tolist()
 
         BM_problem_child_data = DSP_data[DSP_data["NGU ID"].isin(BM_problem_childs)]
-        BM_problem_child_data = BM_problem_child_data.groupby("NGU ID").agg(Capacity = ("Volume ABS", "max"))
+        BM_problem_child_data = BM_problem_child_data.groupby("NGU ID", observed = True).agg(Capacity = ("Volume ABS", "max"))
         
 
         BM_problem_child_data["Capacity"] = BM_problem_child_data["Capacity"]*2000 # gets MWh figure into estimated max capacity in kW
@@ -2071,11 +4401,11 @@ if __name__ == "__main__":
         """Company revenue analysis"""
         
         # total revenue during period
-        company_revenue = revenue_by_service.groupby("Company")[revenue_by_service.columns.tolist()[:-3]].sum()
+        company_revenue = revenue_by_service.groupby("Company", observed = True)[revenue_by_service.columns.tolist()[:-3]].sum()
         company_revenue["Total £"] = company_revenue.sum(axis = 1)
         
         # total capacity by company during period
-        company_capacity = capacity_by_service.groupby("Company")["Capacity"].sum()
+        company_capacity = capacity_by_service.groupby("Company", observed = True)["Capacity"].sum()
         company_capacity_dict = company_capacity.to_dict()
         
         company_revenue["Capacity"] = company_revenue.index.map(company_capacity_dict)
@@ -2123,6 +4453,7 @@ if __name__ == "__main__":
             Excel_load("Top 20 Assets", asset_kW_revenue.head(20), "A1", name = "£/kW revenue by flex asset")
             Excel_load("Top 20 Assets", top_revenue_by_service, (23, 0), name = "Net revenue by flex asset (£)")
 
+    SQL_connections.close()
     print(f"Code finished in: {datetime.now() - start_time}")
 else:
     pass
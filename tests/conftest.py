@@ -0,0 +1,24 @@
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import FMR_script_21 as fmr_module
+
+
+@pytest.fixture
+def fmr():
+    return fmr_module
+
+
+@pytest.fixture
+def cache(fmr, tmp_path, monkeypatch):
+    # an empty cache in a temp folder, the cache's paths are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fmr, "Data_cache_catalog", None)
+    monkeypatch.setattr(fmr, "Data_cache_memory", OrderedDict())
+    monkeypatch.setattr(fmr, "Data_cache_disk_MB", None)
+    return tmp_path
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+
+def test_intervals_merge_joins_overlapping_and_following_ranges(fmr):
+    merged = fmr.Cache_intervals_merge([["2024-09-10", "2024-09-20"], ["2024-09-01", "2024-09-09"],
+                                        ["2024-09-15", "2024-09-25"], ["2024-10-05", "2024-10-06"]])
+    assert merged == [["2024-09-01", "2024-09-25"], ["2024-10-05", "2024-10-06"]]
+
+
+def test_intervals_gaps_before_between_and_after(fmr):
+    intervals = [["2024-09-05", "2024-09-10"], ["2024-09-20", "2024-09-25"]]
+    gaps = fmr.Cache_intervals_gaps(intervals, "2024-09-01", "2024-09-30")
+    assert gaps == [["2024-09-01", "2024-09-04"], ["2024-09-11", "2024-09-19"], ["2024-09-26", "2024-09-30"]]
+
+
+def test_intervals_gaps_none_when_covered(fmr):
+    assert fmr.Cache_intervals_gaps([["2024-09-01", "2024-10-31"]], "2024-09-15", "2024-10-01 23:30") == []
+
+
+def test_intervals_remove_months(fmr):
+    intervals = [["2024-08-20", "2024-10-10"]]
+    assert fmr.Cache_intervals_remove_months(intervals, ["2024-09"]) == [["2024-08-20", "2024-08-31"], ["2024-10-01", "2024-10-10"]]
+    assert fmr.Cache_intervals_remove_months(intervals, ["all"]) == []
+
+
+def test_gaps_from_the_catalog_coverage(fmr, cache):
+    fmr.Cache_catalog_update("MIP_data", coverage = [["2024-09-01", "2024-09-30"]])
+    fmr.Cache_catalog_update("MIP_data", coverage = [["2024-10-01", "2024-10-15"]])
+    assert fmr.Cache_catalog_entry("MIP_data")["coverage"] == [["2024-09-01", "2024-10-15"]]
+    assert fmr.Cache_gaps("MIP_data", "2024-08-25", "2024-10-31") == [["2024-08-25", "2024-08-31"], ["2024-10-16", "2024-10-31"]]
+    assert fmr.Cache_missing("MIP_data", "Settlement Date", "2024-08-25", "2024-10-31") == ["2024-08", "2024-10"]
+
+
+def test_publish_replaces_the_partition(fmr, cache):
+    with open("new.tmp", "w") as f:
+        f.write("new")
+    with open("partition", "w") as f:
+        f.write("old")
+    assert fmr.Cache_publish("new.tmp", "partition") == True
+    assert open("partition").read() == "new"
+    assert os.path.exists("new.tmp") == False
+
+
+def test_publish_retries_while_the_partition_is_in_use(fmr, cache, monkeypatch):
+    monkeypatch.setattr(fmr, "Data_cache_publish_wait", 0.001)
+    replace = os.replace
+    tries = []
+    def in_use(temp_path, path):
+        tries.append(path)
+        if len(tries) < 3:
+            raise PermissionError(13, "in use")
+        replace(temp_path, path)
+    monkeypatch.setattr(fmr.os, "replace", in_use)
+    with open("new.tmp", "w") as f:
+        f.write("new")
+    assert fmr.Cache_publish("new.tmp", "partition") == True
+    assert len(tries) == 3
+    assert open("partition").read() == "new"
+
+
+def test_publish_leaves_the_temp_file_if_it_stays_in_use(fmr, cache, monkeypatch):
+    monkeypatch.setattr(fmr, "Data_cache_publish_wait", 0.001)
+    def in_use(temp_path, path):
+        raise PermissionError(13, "in use")
+    monkeypatch.setattr(fmr.os, "replace", in_use)
+    with open("new.tmp", "w") as f:
+        f.write("new")
+    assert fmr.Cache_publish("new.tmp", "partition") == False
+    assert os.path.exists("new.tmp")
+    log = [json.loads(i) for i in open(fmr.Run_log_file)]
+    assert log[-1]["Event"] == "Cache_publish"
+    assert log[-1]["Temp file"] == "new.tmp"
+
+
+def test_lock_is_taken_again_by_the_same_thread_only(fmr, cache):
+    path = fmr.Cache_lock_path("MIP_data", "2024-09")
+    assert fmr.Cache_lock_acquire(path) == True
+    assert fmr.Cache_lock_acquire(path) == True
+    other = []
+    thread = threading.Thread(target = lambda: other.append(fmr.Cache_lock_acquire(path, wait = False)))
+    thread.start()
+    thread.join()
+    assert other == [False]
+    fmr.Cache_lock_release(path)
+    assert os.path.exists(path) # still held once
+    fmr.Cache_lock_release(path)
+    assert os.path.exists(path) == False
+
+
+def test_lock_held_by_another_session_is_waited_for_then_taken_over(fmr, cache, monkeypatch):
+    monkeypatch.setattr(fmr, "Data_cache_lock_poll", 0.01)
+    monkeypatch.setattr(fmr, "Data_cache_lock_stale", 0.05)
+    path = os.path.abspath(fmr.Cache_lock_path("MIP_data", "2024-09"))
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write("another session")
+    assert fmr.Cache_lock_acquire(path, wait = False) == False
+    assert fmr.Cache_lock_acquire(path) == True # not touched since, so taken over
+    assert open(path).read() == fmr.Data_cache_lock_owner
+    fmr.Cache_lock_release(path)
+
+
+def test_evict_skips_partitions_this_session_has_locked(fmr, cache, monkeypatch):
+    df = pd.DataFrame({"Settlement Date": pd.to_datetime(["2024-08-01", "2024-09-01"]), "Price": [1.0, 2.0]})
+    fmr.Cache_write(df, "MIP_data", "Settlement Date", coverage = [["2024-08-01", "2024-09-30"]])
+    lock = fmr.Cache_lock_path("MIP_data", "2024-08")
+    fmr.Cache_lock_acquire(lock)
+    monkeypatch.setattr(fmr, "Data_cache_disk_MB", 0)
+    try:
+        with fmr.Data_cache_catalog_lock:
+            fmr.Cache_evict()
+    finally:
+        fmr.Cache_lock_release(lock)
+    assert fmr.Cache_partitions("MIP_data") == ["2024-08"]
+    assert fmr.Cache_catalog_entry("MIP_data")["coverage"] == [["2024-08-01", "2024-08-31"]]
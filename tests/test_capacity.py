@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+
+def capacity_history():
+    return pd.DataFrame({"BMU ID": ["T_A-1", "T_A-1", "T_B-1"],
+                         "Date": ["2024-01-01", "2024-06-01", "2024-03-01"],
+                         "GC": [100.0, 120.0, 50.0],
+                         "DC": [90.0, 110.0, 45.0]})
+
+
+def test_capacity_in_force_at_each_row(fmr):
+    df = pd.DataFrame({"BMU ID": pd.Categorical(["T_A-1", "T_B-1", "T_A-1", "T_B-1", "T_C-1"]),
+                       "Start time": pd.to_datetime(["2024-07-01 23:00", "2024-03-01 00:00", "2024-05-31 23:30",
+                                                     "2024-02-28 00:00", "2024-07-01 00:00"]),
+                       "Volume": [1, 2, 3, 4, 5]})
+    out = fmr.Capacity_as_of(df, capacity_history())
+    assert out["Volume"].tolist() == [1, 2, 3, 4, 5] # in the rows' own order
+    assert out["GC"].tolist()[:3] == [120.0, 50.0, 100.0]
+    assert out["DC"].tolist()[:3] == [110.0, 45.0, 90.0]
+    assert np.isnan(out["GC"].iloc[3]) # before its first capacity
+    assert np.isnan(out["GC"].iloc[4]) # no capacity at all
+
+
+def test_capacity_replaces_existing_columns(fmr):
+    df = pd.DataFrame({"BMU ID": ["T_A-1"], "Start time": pd.to_datetime(["2024-02-01"]), "GC": [0.0], "DC": [0.0]})
+    out = fmr.Capacity_as_of(df, capacity_history())
+    assert out.columns.tolist() == ["BMU ID", "Start time", "GC", "DC"]
+    assert out[["GC", "DC"]].values.tolist() == [[100.0, 90.0]]
+
+
+def test_capacity_with_microsecond_times(fmr):
+    # the capacity dates are put in the rows' datetime unit so merge_asof can match them
+    df = pd.DataFrame({"BMU ID": ["T_A-1"], "Start time": pd.to_datetime(["2024-06-01"]).astype("datetime64[us]")})
+    assert fmr.Capacity_as_of(df, capacity_history())["GC"].tolist() == [120.0]